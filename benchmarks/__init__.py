@@ -0,0 +1,2 @@
+# Benchmarks for the SFR plugin. Run from the plugin directory, e.g.
+#   python -m benchmarks.dispatch
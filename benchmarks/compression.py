@@ -0,0 +1,135 @@
+# Size and CPU cost of compressing upload bodies, each way sfr.compress can.
+#
+#   python -m benchmarks.compression [--count N] [--level N]
+#   python -m benchmarks.compression --train [--count N]
+#
+# Upload bodies are made from the events the plugin makes from the journal mix
+# in benchmarks.journal, in batches of 1, 10 and 100 events. For each way of
+# compressing them it shows the bytes posted as a percentage of the JSON, and
+# the time taken to compress (the plugin's upload threads) and decompress (the
+# server) each body.
+#
+# --train prints a VOCABULARY for a new version of the preset dictionary: the
+# header, eventNames and eventData keys - and key:value pairs that hardly ever
+# change - that appear most in those events, least common first, as zlib finds
+# matches nearer the end of a dictionary more cheaply. eventNames and keys in
+# sfr.core that the journal mix doesn't make go first of all. It's trained on
+# a different journal from the one measured.
+
+import argparse
+from collections import Counter
+import json
+import os
+import re
+from time import perf_counter_ns
+
+from benchmarks import edmc
+from benchmarks.journal import journal, make_state
+from sfr import codec, compress
+
+KEY = ('Cmdr', 'F1234567')
+HEADER = {'commanderName': KEY[0], 'commanderFrontierID': KEY[1], 'version': '2.0.0'}
+SIZES = (1, 10, 100)
+MODES = (compress.GZIP, compress.DEFLATE, compress.DICTIONARY)
+BUDGET = 8 * 1024	# Bytes of dictionary to train
+
+
+def capture(count, seed):
+    # Events the plugin makes from a journal
+    plugin = edmc.load_plugin()
+    made = []
+    plugin.add_event = lambda session, name, timestamp, data, key=None, if_changed=False: made.append(codec.Event.make(name, timestamp, data))
+    state = make_state()
+    for (system, station, entry) in journal(count, seed=seed):
+        plugin.journal_entry(KEY[0], False, system, station, entry, state)
+    edmc.reset(plugin)
+    return made
+
+
+def fragments(data, found):
+    # Count '"key":' and constant '"key":value' fragments in eventData
+    if isinstance(data, dict):
+        for (key, value) in data.items():
+            found['"%s":' % key] += 1
+            if isinstance(value, bool) or value is None:
+                found['"%s":%s' % (key, json.dumps(value))] += 1
+            fragments(value, found)
+    elif isinstance(data, list):
+        for value in data:
+            fragments(value, found)
+
+
+def train(events):
+    found = Counter()
+    with open(os.path.join(edmc.ROOT, 'sfr', 'core.py')) as f:
+        source = f.read()
+    for name in re.findall(r"add_event\(session, '(\w+)'", source):
+        found['{"eventName":"%s","eventTimestamp":"' % name] = 0
+    for key in re.findall(r"'([a-z][A-Za-z]+)':", source):
+        found['"%s":' % key] = 0
+    found['{"header":{"commanderName":"'] = found['","commanderFrontierID":"'] = found['","version":"2.0.0"},"events":['] = 1
+    for event in events:
+        found['{"eventName":"%s","eventTimestamp":"' % event.name] += 1
+        found['","eventData":'] += 1
+        fragments(json.loads(event.data), found)
+    vocabulary = []
+    size = 0
+    for (fragment, n) in sorted(found.items(), key=lambda item: (-item[1] * len(item[0]), item[0])):	# Most bytes first
+        if size + len(fragment) > BUDGET:
+            break
+        vocabulary.append((n, fragment))
+        size += len(fragment)
+    vocabulary.sort()	# Least common first
+    print('VOCABULARY = (')
+    for (n, fragment) in vocabulary:
+        print('    %r,' % fragment)
+    print(')')
+    print('# %d fragments, %d bytes' % (len(vocabulary), size))
+
+
+def timed(func, arg):
+    start = perf_counter_ns()
+    result = func(arg)
+    return (result, perf_counter_ns() - start)
+
+
+def measure(events, size, mode, level):
+    # (bytes of JSON, bytes posted, ns to compress, ns to decompress) for events in uploads of size
+    (raw, posted, packing, unpacking) = (0, 0, 0, 0)
+    for i in range(0, len(events), size):
+        body = codec.payload(HEADER, events[i:i + size])
+        ((data, headers), ns) = timed(lambda body: compress.compress(body, mode, level), body)
+        (plain, back) = timed(lambda data: compress.decompress(data, headers.get('Content-Encoding'), headers.get('SFR-Dictionary')), data)
+        assert plain == body
+        raw += len(body)
+        posted += len(data)
+        packing += ns
+        unpacking += back
+    return (raw, posted, packing, unpacking)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure compressing upload bodies')
+    parser.add_argument('--count', type=int, default=20000, help='journal entries to make events from')
+    parser.add_argument('--level', type=int, default=compress.LEVEL, help='zlib compression level')
+    parser.add_argument('--train', action='store_true', help='print a vocabulary for a new preset dictionary')
+    args = parser.parse_args()
+
+    if args.train:
+        train(capture(args.count, seed=1))
+        return
+
+    events = capture(args.count, seed=0)
+    print('%d events, level %d, dictionary version %d (%d bytes)' % (len(events), args.level, compress.VERSION, len(compress.DICTIONARIES[compress.VERSION])))
+    print('%-8s %-12s %10s %10s %12s %12s' % ('events', 'compression', 'bytes', 'of JSON', 'compress', 'decompress'))
+    for size in SIZES:
+        uploads = (len(events) + size - 1) // size
+        for mode in MODES:
+            (raw, posted, packing, unpacking) = measure(events, size, mode, args.level)
+            print('%-8d %-12s %10.0f %9.1f%% %9.1f µs %9.1f µs' % (size, mode, posted / uploads, 100.0 * posted / raw, packing / uploads / 1000.0, unpacking / uploads / 1000.0))
+        print('%-8d %-12s %10.0f' % (size, 'none', raw / uploads))
+        print()
+
+
+if __name__ == '__main__':
+    main()
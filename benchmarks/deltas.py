@@ -0,0 +1,127 @@
+# Bytes posted for loadouts, the fleet and stored modules, with and without
+# sfr.delta's deltas, end to end against the stand-in server in
+# benchmarks.server.
+#
+#   python -m benchmarks.deltas [--steps N] [--modules N] [--forget P] [--lag N]
+#
+# A commander starts up and then spends --steps journal entries outfitting:
+# each one swaps a module in the current ship (Loadout), changes one stored
+# module (StoredModules) or moves a ship (StoredShips). Everything is uploaded
+# after every entry, as the plugin would when docked. --forget makes the server
+# lose what it has at random, so updates have to be resynced. --lag posts each
+# upload that many entries late, as if SFR took that long to reply, so the
+# next changes are made before the last are acknowledged.
+#
+# At the end the loadout and stored modules the server has must be the ones
+# the plugin last made, or it exits with status 1.
+
+import argparse
+from collections import deque
+import random
+import sys
+
+from benchmarks import edmc, server
+from benchmarks.journal import SYSTEMS, make_module, make_state
+from sfr import delta
+from sfr.batch import Batch
+
+CMDR = 'Cmdr'
+SHIPS = 8
+STORED = 40
+ACTIONS = {'Loadout': 6, 'StoredModules': 2, 'StoredShips': 2}
+
+
+def stored_item(n, rng):
+    item = {'StorageSlot': n, 'Name': 'int_module_size%d_class%d' % (rng.randint(1, 7), rng.randint(1, 5)), 'BuyPrice': rng.randint(1000, 10 ** 7), 'Hot': False, 'StarSystem': rng.choice(SYSTEMS), 'MarketID': rng.getrandbits(32)}
+    if rng.random() < 0.5:
+        item.update({'EngineerModifications': 'Weapon_Overcharged', 'Level': rng.randint(1, 5), 'Quality': rng.random()})
+    return item
+
+
+def session(args, deltas):
+    # (server, plugin) after a session's uploads
+    rng = random.Random(args.seed)
+    stand_in = server.StandIn().start()
+    plugin = edmc.load_plugin(name='deltas')
+    plugin.API_URL = stand_in.url
+    plugin.DELTAS = deltas
+    edmc.reset(plugin)
+
+    state = make_state(modules=args.modules, rng=rng)
+    items = [stored_item(n, rng) for n in range(STORED)]
+    late = deque()	# (key, events) handed over but not yet posted
+    ships = [{'ShipType': 'cobramkiii', 'ShipID': n, 'Name': 'Ship %d' % n, 'Hot': False, 'StarSystem': rng.choice(SYSTEMS), 'ShipMarketID': rng.getrandbits(32)} for n in range(2, SHIPS + 2)]
+
+    def play(event, lag=args.lag, **fields):
+        entry = dict(fields, event=event, timestamp='3306-01-01T00:00:00Z')
+        error = plugin.journal_entry(CMDR, False, SYSTEMS[0], 'Station', entry, state)
+        assert not error, error
+        plugin.call()	# Deferred events too
+        while not plugin.queue.empty():
+            (handed, span) = plugin.queue.get_nowait()
+            late.append(handed)
+        while len(late) > lag:
+            for (key, events) in late.popleft():
+                batch = Batch(key, None, 0)
+                batch.events = events
+                plugin.post(stand_in.url, plugin.payload(batch), events, FID=key[1])
+
+    play('LoadGame', Commander=CMDR, Credits=1)
+    play('StartUp', StarSystem=SYSTEMS[0], Docked=True, StationName='Station')
+    for action in rng.choices(list(ACTIONS), list(ACTIONS.values()), k=args.steps):
+        if rng.random() < args.forget:
+            with stand_in.lock:
+                stand_in.snapshots.clear()
+        if action == 'Loadout':
+            slot = rng.choice(sorted(state['Modules']))
+            state['Modules'][slot] = make_module(slot, rng)
+            play('Loadout')
+        elif action == 'StoredModules':
+            n = rng.randrange(len(items))
+            items[n] = stored_item(items[n]['StorageSlot'], rng)
+            play('StoredModules', Items=list(items))
+        else:
+            ship = rng.choice(ships)
+            ship['StarSystem'] = rng.choice(SYSTEMS)
+            play('StoredShips', StarSystem=SYSTEMS[0], StationName='Station', MarketID=1, ShipsHere=[], ShipsRemote=[dict(ship) for ship in ships])
+    play('Undocked', lag=0)	# Anything that needed resyncing goes with the next entry
+    stand_in.stop()
+    return (stand_in, plugin)
+
+
+def check(stand_in, plugin):
+    # True if the server has the plugin's latest loadout and stored modules
+    [session] = plugin.sessions.values()
+    FID = session.FID
+    good = True
+    for (name, data) in (('setCommanderShipLoadout', session.loadout), ('setCommanderStorageModules', session.storedmodules)):
+        kind = delta.KINDS[name]
+        if dict(stand_in.snapshots.get((FID, name, delta.ident(kind, data)), {})) != dict(delta.items(kind, data)):	# In any order
+            print('Server has the wrong %s' % name)
+            good = False
+    return good
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the bytes deltas save on outfitting')
+    parser.add_argument('--steps', type=int, default=200, help='journal entries after StartUp')
+    parser.add_argument('--modules', type=int, default=30, help='modules in the current ship')
+    parser.add_argument('--forget', type=float, default=0.0, metavar='P', help='chance the server loses its snapshots before each entry')
+    parser.add_argument('--lag', type=int, default=0, metavar='N', help='entries made before each upload is posted')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    good = True
+    print('%-8s %10s %8s %8s %8s' % ('', 'bytes', 'uploads', 'events', 'resyncs'))
+    for deltas in (False, True):
+        (stand_in, plugin) = session(args, deltas)
+        good = check(stand_in, plugin) and good
+        print('%-8s %10d %8d %8d %8d' % (deltas and 'deltas' or 'full', stand_in.bytes, stand_in.uploads, stand_in.events, stand_in.resyncs))
+        for (name, count) in sorted(plugin.metrics.added.items()):
+            print('%-8s   %-32s %d' % ('', name, count))
+    if not good:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# Per-event cost of journal_entry() on a realistic journal mix.
+#
+#   python -m benchmarks.dispatch [--baseline REV] [--count N]
+#
+# With --baseline the same journal is also run through load.py as it was at
+# git revision REV, and the two are shown side by side.
+
+import argparse
+from collections import defaultdict
+from time import perf_counter_ns
+
+from benchmarks import edmc
+from benchmarks.journal import MIX, journal, make_state
+
+CHUNK = 200	# Calls between resets of the plugin's unsent events
+
+
+def time_events(plugin, entries, state, repeat):
+    # Mean ns per journal_entry() call for each event type
+    byevent = defaultdict(list)
+    for item in entries:
+        byevent[item[2]['event']].append(item)
+
+    results = {}
+    for (event, items) in byevent.items():
+        calls = 0
+        elapsed = 0
+        while calls < repeat:
+            edmc.reset(plugin)
+            chunk = (items * (CHUNK // len(items) + 1))[:CHUNK]
+            start = perf_counter_ns()
+            for (system, station, entry) in chunk:
+                plugin.journal_entry('Cmdr', False, system, station, entry, state)
+            elapsed += perf_counter_ns() - start
+            calls += len(chunk)
+        results[event] = elapsed / calls
+    edmc.reset(plugin)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time journal_entry() dispatch per event type')
+    parser.add_argument('--baseline', metavar='REV', help='also time load.py at this git revision')
+    parser.add_argument('--count', type=int, default=20000, help='journal entries to generate')
+    parser.add_argument('--repeat', type=int, default=2000, help='calls to time per event type')
+    args = parser.parse_args()
+
+    entries = journal(args.count)
+    state = make_state()
+    total = float(sum(MIX.values()))
+
+    runs = [('current', edmc.load_plugin())]
+    if args.baseline:
+        runs.insert(0, (args.baseline, edmc.load_plugin(args.baseline, 'load_baseline')))
+    results = []
+    for (label, plugin) in runs:
+        with edmc.using(plugin):
+            results.append((label, time_events(plugin, entries, state, args.repeat)))
+
+    print('%-22s %6s' % ('event', 'mix%') + ''.join(' %12s' % label[:12] for (label, r) in results) + (len(results) > 1 and '  speedup' or ''))
+    for event in sorted(MIX, key=lambda e: -MIX[e]):
+        times = [r[event] for (label, r) in results]
+        line = '%-22s %5.1f%%' % (event, 100 * MIX[event] / total) + ''.join(' %9.0f ns' % t for t in times)
+        if len(times) > 1:
+            line += '  %6.2fx' % (times[0] / times[-1])
+        print(line)
+
+    means = [sum(r[e] * MIX[e] for e in MIX) / total for (label, r) in results]
+    print('%-22s %6s' % ('weighted mean', '') + ''.join(' %9.0f ns' % m for m in means) + (len(means) > 1 and '  %6.2fx' % (means[0] / means[-1]) or ''))
+
+
+if __name__ == '__main__':
+    main()
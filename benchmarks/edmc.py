@@ -0,0 +1,128 @@
+# Stand-ins for the modules EDMC provides to plugins, so that load.py can be
+# imported and timed outside EDMC - and for tkinter, if Python was built
+# without it. Third-party packages that EDMC bundles (requests) still need to
+# be installed. Most benchmarks only need the headless core, sfr.core; older
+# revisions had everything in load.py.
+#
+# A git revision is loaded from a copy of the whole tree as it was then, so it
+# imports its own sfr package rather than the working tree's. Both can be
+# loaded in one process, as long as the revision's plugin is only run inside
+# using() - the core imports some of sfr as it goes.
+
+import builtins
+from contextlib import contextmanager
+import importlib.util
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TREES = {}	# Name a revision's plugin was loaded as -> (its tree, the sfr modules it has imported)
+
+
+def install():
+    if not hasattr(builtins, '_'):
+        builtins._ = lambda s: s	# EDMC's translation function
+
+    stubs = {
+        'plug': {
+            'show_error': lambda msg: None,
+            'provides': lambda name: [],
+            'invoke': lambda plugin, fallback, name, *args: None,
+        },
+        'companion': {},
+        'myNotebook': {},
+        'ttkHyperlinkLabel': {'HyperlinkLabel': object},
+        'config': {'config': {}},
+    }
+    if not importlib.util.find_spec('tkinter'):	# Without importing it, which is slow
+        stubs['tkinter'] = {'Label': object, 'Toplevel': object, 'LEFT': 'left', 'SOLID': 'solid'}
+    for (name, attrs) in stubs.items():
+        if name not in sys.modules:
+            module = types.ModuleType(name)
+            module.__dict__.update(attrs)
+            sys.modules[name] = module
+
+
+def tree(rev=None):
+    # The working tree, or a copy of the whole tree as it was at a git revision
+    if not rev:
+        return ROOT
+    folder = os.path.join(tempfile.gettempdir(), 'sfr_tree_%s' % subprocess.check_output(['git', 'rev-parse', '--short', rev], cwd=ROOT).decode().strip())
+    if not os.path.isdir(folder):	# Kept, so its .pyc files are reused
+        archive = subprocess.check_output(['git', 'archive', '--format=tar', rev], cwd=ROOT)
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(folder + '.part')
+        os.rename(folder + '.part', folder)	# Only once it's all there
+    return folder
+
+
+def source(path, rev=None):
+    # A file in the working tree, or in a copy of the tree as it was at a git revision - None if it didn't exist then
+    path = os.path.join(tree(rev), path)
+    return os.path.exists(path) and path or None
+
+
+def load_file(path, name, root=ROOT):
+    # Loads path as module name, with root's sfr package importable
+    install()
+    if sys.path[:1] != [root]:
+        sys.path.insert(0, root)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module	# The plugin holds its globals in sys.modules[__name__]
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_plugin(rev=None, name='load'):
+    # The plugin's headless core from the working tree, or as it was at a git revision - or load.py,
+    # from before the core was split out of it
+    if rev:
+        TREES[name] = (tree(rev), {})
+    with using(name):
+        return load_file(source('sfr/core.py', rev) or source('load.py', rev), name, tree(rev))
+
+
+@contextmanager
+def using(plugin):
+    # Run the plugin loaded as plugin (or by that name) with its own tree's sfr package
+    name = getattr(plugin, '__name__', plugin)
+    if name not in TREES:
+        yield	# The working tree's
+        return
+    (root, modules) = TREES[name]
+    others = {name: sys.modules.pop(name) for name in list(sys.modules) if name == 'sfr' or name.startswith('sfr.')}
+    sys.modules.update(modules)
+    sys.path.insert(0, root)
+    try:
+        yield
+    finally:
+        sys.path.remove(root)
+        modules.update({name: sys.modules.pop(name) for name in list(sys.modules) if name == 'sfr' or name.startswith('sfr.')})
+        sys.modules.update(others)
+
+
+def reset(plugin):
+    # Throw away anything the plugin has queued up, and what would suppress a repeated run. Each commander's
+    # session is kept, as a new one ignores most entries (Loadout, for one) until StartUp or Cargo.
+    if hasattr(plugin, 'sessions'):	# Each commander's unsent events and limits
+        for session in plugin.sessions.values():
+            session.events.clear()
+            session.limiter.clear()
+    else:
+        plugin.events.clear()
+        if hasattr(plugin, 'limiter'):	# Or repeated runs would be suppressed
+            plugin.limiter.clear()
+    if hasattr(plugin, 'acknowledged'):	# Or StartUp would leave out what the last run sent
+        plugin.acknowledged.clear()
+    if hasattr(plugin, 'deltas'):
+        plugin.deltas.clear()
+    queue = plugin.queue
+    while not queue.empty():
+        queue.get_nowait()
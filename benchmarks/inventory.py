@@ -0,0 +1,74 @@
+# Cost of deciding whether cargo and materials need sending, at realistic inventory sizes.
+#
+#   python -m benchmarks.inventory
+#
+# "rebuild" is what send() used to do every time: build the sorted payloads
+# and deep-compare them with the last ones sent. "snapshot" is sfr.inventory.
+
+from collections import OrderedDict
+import random
+from timeit import Timer
+
+from benchmarks.journal import make_state
+from sfr.inventory import Inventory
+
+SIZES = [(5, 30), (20, 130), (40, 330)]	# (cargo types, material types)
+
+
+class Rebuild(object):
+
+    def __init__(self):
+        self.cargo = None
+        self.materials = None
+
+    def update(self, state):
+        changed = False
+        cargo = [ OrderedDict([('itemName', k), ('itemCount', state['Cargo'][k])]) for k in sorted(state['Cargo']) ]
+        if self.cargo != cargo:
+            self.cargo = cargo
+            changed = True
+        materials = []
+        for category in ['Raw', 'Manufactured', 'Encoded']:
+            materials.extend([ OrderedDict([('itemName', k), ('itemCount', state[category][k])]) for k in sorted(state[category]) ])
+        if self.materials != materials:
+            self.materials = materials
+            changed = True
+        return changed
+
+
+class Snapshot(object):
+
+    def __init__(self):
+        self.cargo = Inventory('Cargo')
+        self.materials = Inventory('Raw', 'Manufactured', 'Encoded')
+
+    def update(self, state):
+        cargo = self.cargo.update(state)
+        return self.materials.update(state) or cargo
+
+
+def measure(tracker, state, change):
+    rng = random.Random(1)
+    names = list(state['Raw'])
+    tracker.update(state)
+
+    def step():
+        if change:
+            state['Raw'][rng.choice(names)] += 1
+        tracker.update(state)
+
+    timer = Timer(step)
+    (number, elapsed) = timer.autorange()
+    return min([elapsed] + timer.repeat(4, number)) / number * 1e6
+
+
+def main():
+    print('%-8s %-10s %14s %14s %9s' % ('cargo', 'materials', 'rebuild', 'snapshot', 'speedup'))
+    for (cargo, materials) in SIZES:
+        for change in (False, True):
+            times = [measure(kind(), make_state(cargo=cargo, materials=materials), change) for kind in (Rebuild, Snapshot)]
+            print('%-8d %-10d %11.2f us %11.2f us %8.1fx  %s' % (cargo, materials, times[0], times[1], times[0] / times[1], change and 'changed' or 'unchanged'))
+
+
+if __name__ == '__main__':
+    main()
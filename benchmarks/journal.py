@@ -0,0 +1,232 @@
+# Synthetic journal entries and the EDMC `state` dict that goes with them.
+
+import random
+from datetime import datetime, timedelta
+
+SYSTEMS = ['Shinrarta Dezhra', 'Sol', 'Achenar', 'Deciat', 'Colonia', 'LHS 3447', 'Eravate', 'Lave']
+STATIONS = ['Jameson Memorial', 'Abraham Lincoln', 'Dawes Hub', 'Garay Terminal', 'Jaques Station', 'Trevithick Dock']
+SHIPS = ['anaconda', 'krait_mkii', 'federation_corvette', 'python', 'asp', 'type9']
+FACTIONS = ['Pilots Federation Local Branch', 'Straylight Systems', 'Mother Gaia', 'Sol Workers\' Party']
+
+# Relative frequency of journal events in a typical session
+MIX = {
+    'Music': 80,
+    'ReceiveText': 100,
+    'Scan': 120,
+    'FSSSignalDiscovered': 100,
+    'FSDTarget': 40,
+    'StartJump': 40,
+    'FSDJump': 40,
+    'SupercruiseEntry': 20,
+    'SupercruiseExit': 30,
+    'DockingRequested': 15,
+    'DockingGranted': 15,
+    'Docked': 15,
+    'Undocked': 15,
+    'ShipTargeted': 80,
+    'Bounty': 30,
+    'ReservoirReplenished': 50,
+    'FuelScoop': 30,
+    'MaterialCollected': 30,
+    'NavBeaconScan': 5,
+    'Cargo': 30,
+    'MarketBuy': 8,
+    'MarketSell': 8,
+    'RedeemVoucher': 5,
+    'MissionAccepted': 5,
+    'MissionCompleted': 5,
+    'Friends': 10,
+    'Loadout': 5,
+    'Statistics': 1,
+}
+
+# Sessions spent mostly on one thing
+PROFILES = {
+    'combat': {
+        'Music': 60, 'ReceiveText': 120, 'ShipTargeted': 300, 'Bounty': 80, 'FSDJump': 10, 'SupercruiseEntry': 10,
+        'SupercruiseExit': 10, 'Interdicted': 8, 'Interdiction': 8, 'EscapeInterdiction': 4, 'PVPKill': 2, 'Died': 1,
+        'RedeemVoucher': 10, 'Docked': 5, 'Undocked': 5, 'Cargo': 10, 'MaterialCollected': 20, 'Loadout': 3,
+    },
+    'trading': {
+        'Music': 40, 'ReceiveText': 60, 'FSDJump': 40, 'StartJump': 40, 'SupercruiseEntry': 30, 'SupercruiseExit': 30,
+        'DockingRequested': 30, 'DockingGranted': 30, 'Docked': 30, 'Undocked': 30, 'MarketBuy': 30, 'MarketSell': 30,
+        'Cargo': 60, 'MissionAccepted': 10, 'MissionCompleted': 10, 'ShipTargeted': 10,
+    },
+    'exploration': {
+        'Music': 40, 'FSDJump': 100, 'StartJump': 100, 'FSDTarget': 100, 'Scan': 400, 'FSSSignalDiscovered': 200,
+        'FuelScoop': 80, 'ReservoirReplenished': 100, 'SupercruiseEntry': 5, 'SupercruiseExit': 5, 'MaterialCollected': 20,
+        'NavBeaconScan': 2,
+    },
+    'carrier': {
+        'Music': 40, 'ReceiveText': 60, 'CarrierStats': 30, 'CarrierJumpRequest': 5, 'Docked': 20, 'Undocked': 20,
+        'MarketBuy': 30, 'MarketSell': 30, 'Cargo': 60, 'FSDJump': 10, 'SupercruiseEntry': 10, 'Friends': 10,
+    },
+}
+
+
+def make_state(modules=20, materials=100, cargo=10, rng=None, engineered=0.7):
+    rng = rng or random.Random(0)
+    state = {
+        'Captain': None,
+        'Cargo': {'commodity%d' % i: rng.randint(1, 64) for i in range(cargo)},
+        'Credits': 1234567890,
+        'FID': 'F1234567',
+        'Horizons': True,
+        'Loan': 0,
+        'Raw': {},
+        'Manufactured': {},
+        'Encoded': {},
+        'Engineers': {'Felicity Farseer': (5,), 'Elvira Martuuk': (5,), 'The Dweller': 'Known'},
+        'Rank': {'Combat': (8, 0), 'Trade': (7, 45), 'Explore': (6, 12), 'Empire': (12, 0), 'Federation': (3, 80), 'CQC': (0, 0)},
+        'Reputation': {'Empire': 75.0, 'Federation': 10.0, 'Independent': 0.0, 'Alliance': 35.0},
+        'Statistics': {'Bank_Account': {'Current_Wealth': 1234567890}, 'Combat': {'Bounties_Claimed': 1234}},
+        'Role': None,
+        'Friends': set(),
+        'ShipID': 1,
+        'ShipIdent': 'SL-01',
+        'ShipName': 'Wintermute',
+        'ShipType': 'anaconda',
+        'HullValue': 146969450,
+        'ModulesValue': 250000000,
+        'Rebuy': 19848472,
+        'Modules': {},
+    }
+    for i in range(materials):
+        state[('Raw', 'Manufactured', 'Encoded')[i % 3]]['material%d' % i] = rng.randint(1, 300)
+    for i in range(modules):
+        state['Modules']['Slot%02d' % i] = make_module('Slot%02d' % i, rng, engineered)
+    return state
+
+
+def make_module(slot, rng, engineered=0.7):
+    # engineered is the chance that the module has been engineered
+    module = {
+        'Slot': slot,
+        'Item': 'int_shieldgenerator_size7_class5',
+        'On': True,
+        'Priority': 1,
+        'Health': 1.0,
+        'Value': rng.randint(100000, 50000000),
+    }
+    if rng.random() < engineered:
+        module['Engineering'] = {
+            'Engineer': 'Lei Cheung',
+            'EngineerID': 300120,
+            'BlueprintID': 128673839,
+            'BlueprintName': 'ShieldGenerator_Reinforced',
+            'Level': 5,
+            'Quality': rng.random(),
+            'ExperimentalEffect': 'special_shield_health',
+            'Modifiers': [
+                {'Label': 'Mass', 'Value': 130.2, 'OriginalValue': 80.0, 'LessIsGood': 1},
+                {'Label': 'Integrity', 'Value': 260.0, 'OriginalValue': 200.0, 'LessIsGood': 0},
+                {'Label': 'ShieldGenStrength', 'Value': 178.4, 'OriginalValue': 150.0, 'LessIsGood': 0},
+                {'Label': 'RegenRate', 'Value': 1.9, 'OriginalValue': 1.0, 'LessIsGood': 0},
+                {'Label': 'WeaponMode', 'ValueStr': 'Reinforced'},
+            ],
+        }
+    return module
+
+
+def make_entry(event, timestamp, rng):
+    system = rng.choice(SYSTEMS)
+    entry = {'timestamp': timestamp, 'event': event}
+    if event == 'FSDJump':
+        entry.update({
+            'StarSystem': system,
+            'SystemAddress': rng.getrandbits(40),
+            'StarPos': [rng.uniform(-1000, 1000) for i in range(3)],
+            'JumpDist': round(rng.uniform(5, 60), 3),
+            'FuelUsed': 4.2,
+            'FuelLevel': 28.1,
+            'Factions': [{'Name': f, 'FactionState': 'None', 'Influence': 0.2, 'MyReputation': rng.uniform(-100, 100)} for f in FACTIONS],
+        })
+    elif event == 'Docked':
+        entry.update({'StationName': rng.choice(STATIONS), 'StarSystem': system, 'MarketID': rng.getrandbits(32)})
+    elif event == 'ShipTargeted':
+        stage = rng.choice([0, 1, 2, 3])
+        entry.update({'TargetLocked': True, 'Ship': rng.choice(SHIPS), 'ScanStage': stage})
+        if stage >= 3:
+            entry.update({
+                'PilotName': '$npc_name_decorate:#name=Jon Doe;', 'PilotName_Localised': 'Jon Doe',
+                'PilotRank': 'Deadly', 'ShieldHealth': 100.0, 'HullHealth': 100.0,
+                'Faction': FACTIONS[2], 'LegalStatus': 'Wanted', 'Bounty': rng.randint(1000, 500000),
+            })
+    elif event in ('MarketBuy', 'MarketSell'):
+        count = rng.randint(1, 700)
+        entry.update({'MarketID': rng.getrandbits(32), 'Type': 'gold', 'Count': count})
+        if event == 'MarketBuy':
+            entry.update({'BuyPrice': 9401, 'TotalCost': 9401 * count})
+        else:
+            entry.update({'SellPrice': 9788, 'TotalSale': 9788 * count, 'AvgPricePaid': 9401})
+    elif event == 'RedeemVoucher':
+        entry.update({'Type': 'bounty', 'Amount': rng.randint(10000, 5000000), 'Faction': FACTIONS[1]})
+    elif event == 'MissionAccepted':
+        entry.update({
+            'Faction': FACTIONS[1], 'Name': 'Mission_Delivery', 'LocalisedName': 'Deliver',
+            'Commodity': '$Gold_Name;', 'Count': 20, 'DestinationSystem': system, 'DestinationStation': rng.choice(STATIONS),
+            'Expiry': timestamp, 'Wing': False, 'Influence': '++', 'Reputation': '++', 'Reward': 500000,
+            'MissionID': rng.getrandbits(30),
+        })
+    elif event == 'MissionCompleted':
+        entry.update({
+            'Faction': FACTIONS[1], 'Name': 'Mission_Delivery_name', 'MissionID': rng.getrandbits(30), 'Reward': 500000,
+            'FactionEffects': [{'Faction': FACTIONS[1], 'Effects': [], 'Influence': [{'SystemAddress': 1, 'Trend': 'UpGood', 'Influence': '++'}], 'ReputationTrend': 'UpGood', 'Reputation': '++'}],
+        })
+    elif event == 'Friends':
+        entry.update({'Status': rng.choice(['Online', 'Offline', 'Added', 'Lost']), 'Name': 'CMDR Friend%d' % rng.randint(1, 50)})
+    elif event == 'Scan':
+        entry.update({'ScanType': 'AutoScan', 'BodyName': system + ' A 1', 'BodyID': 4, 'DistanceFromArrivalLS': 1023.4, 'Landable': False})
+    elif event == 'ReceiveText':
+        entry.update({'From': 'Local', 'Message': '$COMMS_entered:#name=%s;' % system, 'Channel': 'npc'})
+    elif event == 'FSSSignalDiscovered':
+        entry.update({'SystemAddress': rng.getrandbits(40), 'SignalName': '$USS_Type_Salvage;', 'USSType': '$USS_Type_Salvage;', 'SpawningState': '', 'SpawningFaction': 'Straylight Systems', 'ThreatLevel': 0, 'TimeRemaining': 1200.0})
+    elif event == 'Music':
+        entry.update({'MusicTrack': rng.choice(['Supercruise', 'Exploration', 'Combat_Dogfight', 'DockingComputer'])})
+    elif event == 'Bounty':
+        entry.update({'Rewards': [{'Faction': FACTIONS[1], 'Reward': 120000}], 'Target': rng.choice(SHIPS), 'TotalReward': 120000, 'VictimFaction': FACTIONS[2]})
+    elif event == 'Loadout':
+        entry.update({
+            'Ship': 'Anaconda', 'ShipID': 1, 'ShipName': 'Wintermute', 'ShipIdent': 'SL-01',
+            'HullValue': 146969450, 'ModulesValue': 250000000, 'Rebuy': 19848472,
+            'Modules': [make_module('Slot%02d' % i, rng) for i in range(20)],
+        })
+    elif event == 'MaterialCollected':
+        entry.update({'Category': rng.choice(['Raw', 'Manufactured', 'Encoded']), 'Name': 'material%d' % rng.randint(0, 99), 'Count': rng.randint(1, 3)})
+    elif event == 'Cargo':
+        entry.update({'Vessel': 'Ship', 'Count': 0})
+    elif event == 'Interdicted':
+        entry.update({'Submitted': rng.random() < 0.5, 'Interdictor': 'Jon Doe', 'IsPlayer': False, 'Faction': FACTIONS[2]})
+    elif event == 'Interdiction':
+        entry.update({'Success': rng.random() < 0.5, 'Interdicted': 'Jon Doe', 'IsPlayer': False, 'Faction': FACTIONS[2]})
+    elif event == 'EscapeInterdiction':
+        entry.update({'Interdictor': 'Jon Doe', 'IsPlayer': False})
+    elif event == 'PVPKill':
+        entry.update({'Victim': 'CMDR Victim%d' % rng.randint(1, 50), 'CombatRank': 5})
+    elif event == 'Died':
+        entry.update({'KillerName': 'Jon Doe', 'KillerShip': rng.choice(SHIPS), 'KillerRank': 'Deadly'})
+    elif event == 'CarrierJumpRequest':
+        entry.update({'CarrierID': 3700000000, 'SystemName': system, 'Body': system + ' A', 'SystemAddress': rng.getrandbits(40), 'BodyID': 1})
+    elif event == 'CarrierStats':
+        entry.update({
+            'CarrierID': 3700000000, 'Callsign': 'SLY-01X', 'Name': 'STRAYLIGHT', 'DockingAccess': 'squadron',
+            'AllowNotorious': False, 'FuelLevel': rng.randint(0, 1000), 'JumpRangeCurr': 500.0, 'JumpRangeMax': 500.0,
+            'SpaceUsage': {'TotalCapacity': 25000, 'Crew': 6170, 'Cargo': rng.randint(0, 15000), 'CargoSpaceReserved': 0, 'ShipPacks': 0, 'ModulePacks': 0, 'FreeSpace': 5000},
+            'Finance': {'CarrierBalance': rng.randint(10 ** 8, 10 ** 10), 'ReserveBalance': 0, 'AvailableBalance': 0, 'ReservePercent': 0},
+            'Crew': [{'CrewRole': role, 'Activated': True, 'Enabled': True, 'CrewName': 'Crew %s' % role} for role in ('BlackMarket', 'Captain', 'Refuel', 'Repair', 'Rearm', 'Commodities')],
+            'ShipPacks': [], 'ModulePacks': [],
+        })
+    return entry
+
+
+def journal(count, seed=0, mix=MIX):
+    # List of (system, station, entry) in a plausible order of events
+    rng = random.Random(seed)
+    events = list(mix)
+    weights = [mix[e] for e in events]
+    when = datetime(3306, 1, 1)
+    entries = []
+    for event in rng.choices(events, weights, k=count):
+        when += timedelta(seconds=rng.randint(0, 20))
+        entries.append((rng.choice(SYSTEMS), rng.choice(STATIONS + [None]), make_entry(event, when.strftime('%Y-%m-%dT%H:%M:%SZ'), rng)))
+    return entries
@@ -0,0 +1,261 @@
+# End-to-end load test of the upload path, against the stand-in server in
+# benchmarks.server.
+#
+#   python -m benchmarks.loadtest [--pilots N] [--entries N] [--rate N] [--error-rate P] ... [JOURNAL ...]
+#
+# Each pilot is a copy of sfr.core of its own, as in each squadron member's
+# EDMC - its own worker, upload threads and spool - and all of them upload to
+# one server. Pilots play a synthetic journal (one of the PROFILES in
+# benchmarks.journal each, in turn) or, if given, recorded journal files, each
+# under a commander name of its own. Every event call() hands to the worker is
+# noted and matched against what arrives at the server.
+#
+# Once the journals have been played and translated the pilots get --drain
+# seconds to get everything through, and are then stopped as EDMC would stop
+# them. Whatever is still in their spools is left to a restart against a
+# well-behaved server, as would happen the next time they played.
+#
+# --compression makes the pilots compress their uploads, as sfr.compress can.
+#
+#   sent	- bytes posted, across all uploads
+#   throughput	- events arriving per second, from the first hand-over until the pilots were stopped
+#   latency	- from call() until the event arrives at the server, up until the pilots were stopped
+#   travel	- the same, for the events whose reply updates the system and station links
+#   unsent	- events that hadn't arrived by the time the pilots were stopped
+#   lost	- events that never arrived, even after the restart
+#   duplicated	- events that arrived more than once
+#   stale	- events that arrived although they were never handed over, e.g. replaced by a later one
+#
+# Exits with status 1 if any events were lost. Needs requests installed, as
+# for benchmarks.edmc.
+
+import argparse
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack, redirect_stderr, redirect_stdout
+import io
+import os
+import random
+import sys
+import tempfile
+from threading import Lock, Thread
+import time
+
+from benchmarks import edmc, server
+from benchmarks.journal import PROFILES, journal, make_state
+from sfr import codec, compress
+from sfr.batch import URGENT
+
+
+class Ledger(object):
+    # Events handed to the workers, and what arrived at the server
+
+    def __init__(self):
+        self.lock = Lock()
+        self.waiting = defaultdict(deque)	# (cmdr, eventName, eventTimestamp, eventData) -> times handed over, for events yet to arrive
+        self.arrived = Counter()		# Same -> times arrived
+        self.handed = 0
+        self.delivered = 0
+        self.duplicated = 0
+        self.stale = 0
+        self.latencies = []
+        self.travel = []	# Latencies of URGENT events
+        self.first = None	# Time of the first hand-over
+
+    def hand(self, cmdr, events):
+        now = time.perf_counter()
+        with self.lock:
+            if self.first is None:
+                self.first = now
+            for event in events:
+                self.waiting[(cmdr, event.name, event.timestamp, event.data)].append(now)
+                self.handed += 1
+
+    def arrive(self, header, events, now):
+        cmdr = header['commanderName']
+        events = [codec.Event.decoded(event) for event in events]	# eventData encoded the same way as when it was handed over
+        with self.lock:
+            for event in events:
+                identity = (cmdr, event.name, event.timestamp, event.data)
+                waiting = self.waiting.get(identity)
+                if waiting:
+                    latency = now - waiting.popleft()
+                    self.latencies.append(latency)
+                    if event.name in URGENT:
+                        self.travel.append(latency)
+                    if not waiting:
+                        del self.waiting[identity]
+                    self.delivered += 1
+                elif self.arrived[identity]:
+                    self.duplicated += 1
+                else:
+                    self.stale += 1
+                self.arrived[identity] += 1
+
+    def pending(self):
+        with self.lock:
+            return self.handed - self.delivered
+
+
+def start(name, folder, url, ledger, compression=None):
+    # A copy of the plugin started in folder, uploading to url, with its hand-overs noted in ledger
+    plugin = edmc.load_plugin(name=name)
+    plugin.API_URL = url
+    plugin.COMPRESSION = compression
+    call = plugin.call
+
+    def noted():
+        for session in list(plugin.sessions.values()):
+            if session.events:
+                ledger.hand(session.cmdr, session.events)
+        call()
+    plugin.call = noted	# Handlers look call() up in the plugin's globals each time
+    plugin.start(folder)
+    return plugin
+
+
+def synthetic(n, count):
+    # (system, station, entry, state) from one of the PROFILES
+    profile = sorted(PROFILES)[n % len(PROFILES)]
+    state = make_state(rng=random.Random(n))
+    state['FID'] = 'F%07d' % n
+    for (system, station, entry) in journal(count, seed=n, mix=PROFILES[profile]):
+        yield (system, station, entry, state)
+
+
+def recorded(n, paths, wanted):
+    # (system, station, entry, state) from journal files, as sfr.backfill reads them
+    from sfr.backfill import Tracker, journal_entries, journal_files, journal_lines
+    tracker = Tracker()
+    for entry in journal_entries(journal_lines(journal_files(paths)), wanted | set(tracker.handlers)):
+        tracker.update(entry)
+        tracker.state['FID'] = 'F%07d' % n
+        if tracker.cmdr:
+            yield (tracker.system, tracker.station, entry, tracker.state)
+
+
+def play(plugin, cmdr, entries, rate):
+    # Feed entries to journal_entry(), at rate entries a second if given
+    interval = rate and 1.0 / rate
+    due = time.perf_counter()
+    for (system, station, entry, state) in entries:
+        plugin.journal_entry(cmdr, False, system, station, entry, state)
+        if interval:
+            due += interval
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def together(func, items):
+    # func(item) for each item, on threads of their own, waiting for all of them
+    threads = [Thread(target = func, args = (item,)) for item in items]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def settle(ledger, plugins, seconds):
+    # Wait until every entry has been translated and everything handed over has arrived, or seconds have
+    # passed. Once its translation thread is idle, a plugin's events that are waiting for an entry that
+    # sends are handed over, as they would be by the next one.
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if all(plugin.metrics.translations.count >= plugin.metrics.entries.count for plugin in plugins):
+            for plugin in plugins:
+                plugin.call()
+            if not ledger.pending():
+                return
+        time.sleep(0.05)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values and values[int(q * (len(values) - 1))] or 0.0
+
+
+def run(args):
+    ledger = Ledger()
+    stand_in = server.make(args, callback=ledger.arrive).start()
+    cmdrs = ['Pilot %d' % n for n in range(args.pilots)]
+    with tempfile.TemporaryDirectory(prefix='sfr_loadtest_') as root:
+        folders = [os.path.join(root, str(n)) for n in range(args.pilots)]
+        for folder in folders:
+            os.mkdir(folder)
+        plugins = [start('load_%d' % n, folder, stand_in.url, ledger, args.compression) for (n, folder) in enumerate(folders)]
+        if args.journals:
+            wanted = set(plugins[0].HANDLERS)
+            streams = [recorded(n, args.journals, wanted) for n in range(args.pilots)]
+        else:
+            streams = [synthetic(n, args.entries) for n in range(args.pilots)]
+
+        together(lambda n: play(plugins[n], cmdrs[n], streams[n], args.rate), range(args.pilots))
+        settle(ledger, plugins, args.drain)
+        together(lambda plugin: plugin.stop(), plugins)
+        stopped = time.perf_counter()
+        with ledger.lock:
+            (handed, delivered, latencies, travel) = (ledger.handed, ledger.delivered, list(ledger.latencies), list(ledger.travel))
+        (uploads, probes, errors, rejected, wasted, sent) = (stand_in.uploads, stand_in.probes, stand_in.errors, stand_in.rejected, stand_in.wasted, stand_in.bytes)
+
+        # Next time they play, the spools are replayed
+        stand_in.healthy()
+        plugins = [start('load_%d' % n, folder, stand_in.url, ledger, args.compression) for (n, folder) in enumerate(folders)]
+        settle(ledger, plugins, args.drain)
+        together(lambda plugin: plugin.stop(), plugins)
+    stand_in.stop()
+
+    elapsed = stopped - (ledger.first or stopped)
+    return {
+        'handed': handed,
+        'uploads': uploads,
+        'probes': probes,
+        'errors': errors,
+        'rejected': rejected,
+        'wasted': wasted,
+        'sent': sent,
+        'throughput': delivered / max(elapsed, 1e-9),
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'travel p50': percentile(travel, 0.5),
+        'travel p99': percentile(travel, 0.99),
+        'unsent': handed - delivered,
+        'lost': ledger.pending(),
+        'duplicated': ledger.duplicated,
+        'stale': ledger.stale,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the upload path against a stand-in SFR server')
+    parser.add_argument('journals', nargs='*', metavar='JOURNAL', help='journal directories or Journal.*.log files to play instead of synthetic journals')
+    parser.add_argument('--pilots', type=int, default=8, help='copies of the plugin uploading at once (default: %(default)s)')
+    parser.add_argument('--entries', type=int, default=5000, help='synthetic journal entries per pilot (default: %(default)s)')
+    parser.add_argument('--rate', type=float, default=0, help='journal entries per second per pilot, or 0 for as fast as possible (default: %(default)s)')
+    parser.add_argument('--drain', type=float, default=30, metavar='SECONDS', help='time allowed for uploads to finish before stopping, and after restarting (default: %(default)s)')
+    parser.add_argument('--compression', choices=(compress.GZIP, compress.DEFLATE, compress.DICTIONARY), help='compress uploads this way (default: none)')
+    parser.add_argument('--verbose', action='store_true', help="show the plugin's output")
+    server.options(parser)
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(redirect_stdout(io.StringIO()))
+            stack.enter_context(redirect_stderr(io.StringIO()))
+        results = run(args)
+
+    print('%d pilots, %s' % (args.pilots, args.journals and 'playing %s' % ', '.join(args.journals) or '%d synthetic journal entries each' % args.entries))
+    print('%-12s %d events handed over' % ('', results['handed']))
+    print('%-12s %d (%d probes), %d answered with errors, %d too large - %.0f KB not accepted' % (
+        'uploads', results['uploads'], results['probes'], results['errors'], results['rejected'], results['wasted'] / 1024.0))
+    print('%-12s %.0f KB%s' % ('sent', results['sent'] / 1024.0, args.compression and ', %s' % args.compression or ''))
+    print('%-12s %.0f events/s' % ('throughput', results['throughput']))
+    print('%-12s p50 %.3f s, p99 %.3f s' % ('latency', results['p50'], results['p99']))
+    print('%-12s p50 %.3f s, p99 %.3f s' % ('travel', results['travel p50'], results['travel p99']))
+    for name in ('unsent', 'lost', 'duplicated', 'stale'):
+        print('%-12s %d' % (name, results[name]))
+    if results['lost']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Time journal_entry() keeps EDMC's main thread busy, per call.
+#
+#   python -m benchmarks.mainthread [--baseline REV] [--count N]
+#
+# With the translation thread running, as it is in EDMC, journal_entry() only
+# snapshots the state the handlers need and hands the entry over - the
+# translation thread competes for the GIL meanwhile, as it would. --baseline
+# times the plugin as it was at git revision REV alongside, which (before the
+# translation thread) did everything on the main thread. Each call is timed on
+# its own, so the numbers include ~50ns of timer overhead.
+
+import argparse
+from collections import defaultdict
+from threading import Thread
+from time import perf_counter_ns
+
+from benchmarks import edmc
+from benchmarks.dispatch import CHUNK
+from benchmarks.journal import PROFILES, journal, make_state
+
+
+def timings(plugin, entries, state):
+    # ns taken by each journal_entry() call, by event
+    threaded = hasattr(plugin, 'translation')
+    times = defaultdict(list)
+    edmc.reset(plugin)
+    for i in range(0, len(entries), CHUNK):
+        if threaded:
+            plugin.translator = Thread(target = plugin.translation)
+            plugin.translator.start()
+        for (system, station, entry) in entries[i:i + CHUNK]:
+            start = perf_counter_ns()
+            plugin.journal_entry('Cmdr', False, system, station, entry, state)
+            times[entry['event']].append(perf_counter_ns() - start)
+        if threaded:
+            plugin.journal.put(None)
+            plugin.translator.join()
+            plugin.translator = None
+        edmc.reset(plugin)
+    return times
+
+
+def stats(times):
+    times = sorted(times)
+    return (sum(times) / len(times), times[len(times) // 2], times[int(len(times) * 0.99)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time journal_entry() on EDMC's main thread")
+    parser.add_argument('--baseline', metavar='REV', help='also time the plugin as it was at git revision REV')
+    parser.add_argument('--count', type=int, default=20000, help='journal entries per profile')
+    args = parser.parse_args()
+
+    runs = [('now', edmc.load_plugin(name='now'))]
+    if args.baseline:
+        runs.insert(0, (args.baseline, edmc.load_plugin(args.baseline, 'baseline')))
+
+    results = {}
+    byevent = {}
+    for (seed, (profile, mix)) in enumerate(sorted(PROFILES.items())):
+        entries = journal(args.count, seed=seed, mix=mix)
+        for (label, plugin) in runs:
+            with edmc.using(plugin):
+                times = timings(plugin, entries, make_state())
+            results[(profile, label)] = stats([t for ts in times.values() for t in ts])
+            for (event, ts) in times.items():
+                byevent.setdefault((event, label), []).extend(ts)
+
+    print('%-20s' % 'ns per call' + ''.join('%30s' % label for (label, plugin) in runs))
+    print('%-20s' % '' + ''.join('%10s%10s%10s' % ('mean', 'p50', 'p99') for run in runs))
+    rows = sorted(results) + sorted(byevent, key=lambda key: -stats(byevent[key])[0])
+    for (name, label) in [key for key in rows if key[1] == runs[0][0]]:
+        line = '%-20s' % name
+        for (other, plugin) in runs:
+            line += '%10.0f%10.0f%10.0f' % (name in PROFILES and results[(name, other)] or stats(byevent[(name, other)]))
+        print(line)
+        if name == sorted(PROFILES)[-1]:
+            print()
+
+
+if __name__ == '__main__':
+    main()
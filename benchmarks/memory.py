@@ -0,0 +1,68 @@
+# Memory held by unsent events, e.g. after a long session with SFR unreachable.
+#
+#   python -m benchmarks.memory [--events N]
+#
+# "ordereddicts" is how events used to be kept: an OrderedDict per event with
+# the OrderedDict payloads built by the handlers inside it. "records" is
+# sfr.codec.Event - interned name and timestamp, and the encoded eventData.
+# Events are taken from the journal mix in benchmarks.journal, repeated as
+# needed, and each one is built from fresh objects as it would be in play.
+
+import argparse
+from collections import OrderedDict
+import gc
+import tracemalloc
+
+from benchmarks.serialize import capture
+from sfr import codec
+
+
+def ordered(data):
+    # A copy of data as the handlers used to build it, with strings of its own as if fresh from the journal
+    if isinstance(data, dict):
+        return OrderedDict([(k, ordered(v)) for (k, v) in data.items()])
+    if isinstance(data, list):
+        return [ordered(v) for v in data]
+    if isinstance(data, str):
+        return data.encode().decode()
+    return data
+
+
+def ordereddicts(name, timestamp, data):
+    return OrderedDict([('eventName', name), ('eventTimestamp', timestamp), ('eventData', ordered(data))])
+
+
+def records(name, timestamp, data):
+    return codec.Event.make(name, timestamp, data)
+
+
+def measure(make, made, count):
+    # Bytes allocated and still held once count events have been made
+    gc.collect()
+    tracemalloc.start()
+    events = []
+    for i in range(count):
+        (name, timestamp, data) = made[i % len(made)]
+        events.append(make(name, timestamp.encode().decode(), data))	# Each journal entry brings its own timestamp string
+    (held, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return held
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure memory held by unsent events')
+    parser.add_argument('--events', type=int, default=100000, help='unsent events to hold')
+    parser.add_argument('--count', type=int, default=20000, help='journal entries to generate events from')
+    args = parser.parse_args()
+
+    made = capture(args.count)
+    results = [(label, measure(make, made, args.events)) for (label, make) in (('ordereddicts', ordereddicts), ('records', records))]
+
+    print('%d unsent events' % args.events)
+    for (label, held) in results:
+        print('%-14s %9.1f MB %9.0f bytes/event' % (label, held / 1e6, held / args.events))
+    print('%-14s %11.1fx' % ('saving', results[0][1] / results[1][1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# Cost of encoding events, per event, for the journal mix in benchmarks.journal.
+#
+#   python -m benchmarks.serialize [--count N]
+#
+# "dicts" is what happened before sfr.codec: events kept as OrderedDicts and
+# encoded again for the batch size check, the spool line and every attempt at
+# the upload. "encoded" encodes each event once in add_event() and joins the
+# bytes, with the json module and (if it's installed) orjson.
+#
+#   main thread	- making the event and its spool line, in add_event()
+#   worker	- sizing it for a batch and putting the upload body together
+#   retry	- encoding the upload again after a failure
+
+import argparse
+from collections import OrderedDict
+import json
+from time import perf_counter_ns
+
+from benchmarks import edmc
+from benchmarks.journal import journal, make_state
+from sfr import codec
+from sfr.batch import MAX_EVENTS
+
+KEY = ('Cmdr', 'F1234567')
+HEADER = OrderedDict([('commanderName', KEY[0]), ('commanderFrontierID', KEY[1]), ('version', '2.0.0')])
+
+
+def capture(count):
+    # (name, timestamp, data) for every event the plugin makes from a journal
+    plugin = edmc.load_plugin()
+    made = []
+    plugin.add_event = lambda session, name, timestamp, data, key=None, if_changed=False: made.append((name, timestamp, data))
+    state = make_state()
+    for (system, station, entry) in journal(count):
+        plugin.journal_entry(KEY[0], False, system, station, entry, state)
+    edmc.reset(plugin)
+    return made
+
+
+def dicts(made):
+    start = perf_counter_ns()
+    events = []
+    for (name, timestamp, data) in made:
+        event = OrderedDict([('eventName', name), ('eventTimestamp', timestamp), ('eventData', data)])
+        json.dumps([KEY[0], KEY[1], event], separators = (',', ':'))
+        events.append(event)
+    added = perf_counter_ns()
+    for i in range(0, len(events), MAX_EVENTS):
+        batch = events[i:i + MAX_EVENTS]
+        for event in batch:
+            len(json.dumps(event, separators = (',', ':')))
+        json.dumps(OrderedDict([('header', HEADER), ('events', batch)]), separators = (',', ':'))
+    batched = perf_counter_ns()
+    for i in range(0, len(events), MAX_EVENTS):
+        json.dumps(OrderedDict([('header', HEADER), ('events', events[i:i + MAX_EVENTS])]), separators = (',', ':'))
+    retried = perf_counter_ns()
+    return (added - start, batched - added, retried - batched)
+
+
+def encoded(made):
+    start = perf_counter_ns()
+    events = []
+    for (name, timestamp, data) in made:
+        event = codec.Event.make(name, timestamp, data)
+        b''.join([codec.dumps([KEY[0], KEY[1]])[:-1], b',', event.encode(), b']\n'])
+        events.append(event)
+    added = perf_counter_ns()
+    for i in range(0, len(events), MAX_EVENTS):
+        batch = events[i:i + MAX_EVENTS]
+        for event in batch:
+            event.size()
+        codec.payload(HEADER, batch)
+    batched = perf_counter_ns()
+    return (added - start, batched - added, 0)	# A retry posts the body it already has
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time event encoding per event')
+    parser.add_argument('--count', type=int, default=20000, help='journal entries to generate')
+    parser.add_argument('--repeat', type=int, default=5, help='runs to take the best of')
+    args = parser.parse_args()
+
+    made = capture(args.count)
+    orjson = codec.fast()
+    runs = [('dicts', dicts, None), ('encoded json', encoded, None)]
+    if orjson:
+        runs.append(('encoded orjson', encoded, orjson))
+
+    print('%d events from %d journal entries' % (len(made), args.count))
+    print('%-16s %14s %14s %14s %14s' % ('', 'main thread', 'worker', 'retry', 'total'))
+    for (label, run, encoder) in runs:
+        codec.orjson = encoder or False
+        times = [min(t) / len(made) for t in zip(*[run(made) for i in range(args.repeat)])]
+        print('%-16s' % label + ''.join(' %11.0f ns' % t for t in times) + ' %11.0f ns' % sum(times))
+    codec.orjson = orjson or False
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+# A local stand-in for SFR's upload endpoint, for load tests.
+#
+#   python -m benchmarks.server [--port N] [--latency MS] [--error-rate P] ...
+#
+# Accepts the uploads worker() posts and replies in the same shape as SFR - a
+# header eventStatus and an eventStatus for each event, with eventData for the
+# travel and ship events that load.py passes on to other plugins. It can be
+# made slow (--latency, --jitter), flaky (--error-rate), down for a while every
+# so often (--burst), slow to send its replies (--slow-body) or strict about how
+# big an upload can be (--max-body). Uploads compressed by sfr.compress are
+# decompressed first. Everything that arrives is handed to a callback, so a
+# harness can check what got through.
+#
+# It keeps each commander's loadouts and stored modules as SFR would, and takes
+# sfr.delta's updates to them from uploads that ask for deltas - answering
+# RESYNC to any it can't apply.
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+from threading import Lock, Thread
+import time
+
+from sfr import compress, delta
+
+ERRORS = (500, 502, 503)	# Answered at random to --error-rate of uploads
+REASONS = {409: 'Resync', 413: 'Payload Too Large', 500: 'Internal Server Error', 502: 'Bad Gateway', 503: 'Service Unavailable'}
+TRICKLE = 10			# Pieces a slow reply is sent in
+
+TRAVEL = ('addCommanderTravelDock', 'addCommanderTravelFSDJump', 'setCommanderTravelLocation')
+SHIP = ('addCommanderShip', 'setCommanderShip')
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'	# Keep-alive, as SFR's front end does
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status = server.decide(len(body))
+        if server.latency or server.jitter:
+            time.sleep((server.latency + random.random() * server.jitter) / 1000.0)
+        if status != 200:
+            self.reply(status, REASONS[status], b'')
+            return
+
+        upload = json.loads(compress.decompress(body, self.headers.get('Content-Encoding'), self.headers.get('SFR-Dictionary')))
+        header = upload['header']
+        events = upload['events']
+        deltas = header.get('version') == delta.VERSION
+        replies = [server.snapshot(header.get('commanderFrontierID'), event, deltas) or reply(event) for event in events]
+        server.received(header, events)
+        self.reply(200, 'OK', json.dumps({
+            'header': deltas and {'eventStatus': 200, 'version': delta.VERSION} or {'eventStatus': 200},
+            'events': replies,
+        }).encode('utf-8'))
+
+    def reply(self, status, reason, body):
+        self.send_response(status, reason)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status == 200 and self.server.slow_body and body:
+            # Trickle the body out, a piece at a time
+            piece = len(body) // TRICKLE + 1
+            for i in range(0, len(body), piece):
+                self.wfile.write(body[i:i + piece])
+                self.wfile.flush()
+                time.sleep(self.server.slow_body / TRICKLE)
+        else:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass	# One line per upload is far too many
+
+
+def reply(event):
+    name = event['eventName']
+    if name in TRAVEL:
+        return {'eventStatus': 200, 'eventData': {'starsystemInaraURL': 'https://inara.cz/', 'stationInaraURL': 'https://inara.cz/'}}
+    elif name in SHIP:
+        return {'eventStatus': 200, 'eventData': {'shipInaraURL': 'https://inara.cz/'}}
+    return {'eventStatus': 200}
+
+
+class StandIn(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0, burst=None, slow_body=0.0, max_body=None, callback=None):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.latency = latency		# ms before replying
+        self.jitter = jitter		# Up to this many more ms, at random
+        self.error_rate = error_rate	# Fraction of uploads answered with a 5xx
+        self.burst = burst		# (period, length) - answer everything with 503 for length seconds out of every period
+        self.slow_body = slow_body	# Seconds taken to send each reply body
+        self.max_body = max_body	# Bytes - bigger uploads are answered with 413
+        self.callback = callback	# Called with (header, events, time received) for each upload accepted
+        self.started = time.monotonic()
+        self.lock = Lock()
+        self.uploads = 0
+        self.probes = 0		# Uploads without any events
+        self.events = 0
+        self.bytes = 0		# Bytes of uploads, as posted
+        self.errors = 0		# 5xx replies
+        self.rejected = 0	# 413 replies
+        self.wasted = 0		# Bytes of uploads that weren't accepted
+        self.snapshots = {}	# (FID, eventName, ident) -> items of each loadout and stored modules, as in sfr.delta
+        self.resyncs = 0	# Updates that couldn't be applied
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d/upload' % self.server_address
+
+    def healthy(self):
+        # Stop misbehaving, apart from being slow
+        self.error_rate = 0.0
+        self.burst = None
+
+    def decide(self, size):
+        # Status to answer the next upload with
+        status = 200
+        if self.max_body and size > self.max_body:
+            status = 413
+        elif self.burst:
+            (period, length) = self.burst
+            if (time.monotonic() - self.started) % period >= period - length:
+                status = 503
+        if status == 200 and self.error_rate and random.random() < self.error_rate:
+            status = random.choice(ERRORS)
+        with self.lock:
+            self.uploads += 1
+            self.bytes += size
+            if status == 413:
+                self.rejected += 1
+            elif status != 200:
+                self.errors += 1
+            if status != 200:
+                self.wasted += size
+        return status
+
+    def snapshot(self, FID, event, deltas):
+        # Keep a loadout or stored modules, or apply an update to them. Returns a reply if it isn't OK
+        name = event['eventName']
+        if name in delta.UPDATES and deltas:
+            name = delta.UPDATES[name]
+            kind = delta.KINDS[name]
+            key = (FID, name, delta.ident(kind, event['eventData']))
+            with self.lock:
+                items = key in self.snapshots and delta.apply(kind, self.snapshots[key], event['eventData'])
+                if not items:
+                    self.resyncs += 1
+                    return {'eventStatus': delta.RESYNC, 'eventStatusText': REASONS[delta.RESYNC]}
+                self.snapshots[key] = items
+        elif name in delta.UPDATES:
+            return {'eventStatus': 400, 'eventStatusText': 'Unknown event'}
+        elif name in delta.KINDS:
+            kind = delta.KINDS[name]
+            with self.lock:
+                self.snapshots[(FID, name, delta.ident(kind, event['eventData']))] = delta.items(kind, event['eventData'])
+        return None
+
+    def received(self, header, events):
+        now = time.perf_counter()
+        with self.lock:
+            self.events += len(events)
+            if not events:
+                self.probes += 1
+        if self.callback and events:
+            self.callback(header, events, now)
+
+    def start(self):
+        self.thread = Thread(target = self.serve_forever, name = 'SFR stand-in')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
+def options(parser):
+    # Arguments for the stand-in's behaviour, shared with benchmarks.loadtest
+    parser.add_argument('--latency', type=float, default=50, metavar='MS', help='time taken to answer each upload (default: %(default)s)')
+    parser.add_argument('--jitter', type=float, default=50, metavar='MS', help='up to this much longer, at random (default: %(default)s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, metavar='P', help='fraction of uploads answered with a 5xx error (default: %(default)s)')
+    parser.add_argument('--burst', metavar='PERIOD:LENGTH', type=lambda s: tuple(float(x) for x in s.split(':')), help='answer every upload with 503 for LENGTH seconds out of every PERIOD')
+    parser.add_argument('--slow-body', type=float, default=0.0, metavar='SECONDS', help='time taken to send each reply body (default: %(default)s)')
+    parser.add_argument('--max-body', type=int, metavar='BYTES', help='answer bigger uploads with 413 Payload Too Large')
+
+
+def make(args, port=0, callback=None):
+    return StandIn(port, args.latency, args.jitter, args.error_rate, args.burst, args.slow_body, args.max_body, callback)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a stand-in for the SFR upload endpoint')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (default: %(default)s)')
+    options(parser)
+    args = parser.parse_args()
+
+    server = make(args, args.port)
+    print('Listening on %s - set API_URL in sfr/core.py to this' % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print('%d uploads (%d probes), %d events, %d errors, %d too large' % (server.uploads, server.probes, server.events, server.errors, server.rejected))
+
+
+if __name__ == '__main__':
+    main()
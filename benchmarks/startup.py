@@ -0,0 +1,63 @@
+# Time taken to import the plugin, as EDMC does when it starts.
+#
+#   python -m benchmarks.startup [--baseline REV] [--repeat N]
+#
+# Each import is made in a fresh interpreter, and the best of --repeat is shown.
+#   in EDMC	- tkinter and requests already imported, as EDMC has them by the time it loads plugins
+#   headless	- nothing imported beforehand, as for sfr.backfill or a service built on sfr.core
+# along with which of tkinter and requests the import pulled in.
+
+import argparse
+import os
+import subprocess
+import sys
+
+from benchmarks import edmc
+
+PRELOAD = ('tkinter', 'requests')
+
+CHILD = '''
+import sys, time
+sys.path.insert(0, %(root)r)
+from benchmarks import edmc
+edmc.install()
+for name in %(preload)r:
+    __import__(name)
+start = time.perf_counter()
+edmc.load_file(%(path)r, 'load', %(tree)r)
+elapsed = time.perf_counter() - start
+print(elapsed, ' '.join(name for name in %(heavy)r if name in sys.modules))
+'''
+
+
+def measure(tree, path, preload, repeat):
+    # (Best seconds to import path, heavy modules it imported)
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)	# EDMC has .pyc files from the last time it ran
+    times = []
+    for i in range(repeat + 1):	# The first one writes them
+        output = subprocess.check_output([sys.executable, '-c', CHILD % {'root': edmc.ROOT, 'tree': tree, 'path': path, 'preload': preload, 'heavy': PRELOAD}], env=env)
+        (elapsed, imported) = (output.decode().strip().split(' ', 1) + [''])[:2]
+        times.append(float(elapsed))
+    return (min(times[1:]), imported.split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time importing the plugin')
+    parser.add_argument('--baseline', metavar='REV', help='also time load.py as it was at git revision REV')
+    parser.add_argument('--repeat', type=int, default=10, help='imports to take the best of')
+    args = parser.parse_args()
+
+    runs = [('working tree', None)]
+    if args.baseline:
+        runs.insert(0, (args.baseline, args.baseline))
+
+    print('%-16s %-10s %10s  %s' % ('', '', 'import', 'imported'))
+    for (label, rev) in runs:
+        for (context, preload) in (('in EDMC', PRELOAD), ('headless', ())):
+            (elapsed, imported) = measure(edmc.tree(rev), edmc.source('load.py', rev), preload, args.repeat)
+            print('%-16s %-10s %7.1f ms  %s' % (label, context, elapsed * 1000, context == 'headless' and ', '.join(imported) or ''))
+
+
+if __name__ == '__main__':
+    main()
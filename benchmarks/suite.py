@@ -0,0 +1,189 @@
+# The whole benchmark suite, with results kept as a baseline to compare against.
+#
+#   python -m benchmarks.suite --save baseline.json	# before a change
+#   python -m benchmarks.suite --compare baseline.json	# after it
+#
+# Times, in ns per call or per event:
+#   journal_entry.EVENT	- journal_entry() for each event type in the PROFILES journals
+#   journal_entry.PROFILE	- the mean over a journal for each profile
+#   make_loadout.SIZE	- a fully engineered ship with SIZE modules
+#   inventory.changed/unchanged	- deciding whether cargo and materials need sending
+#   add_event	- making an event from its data
+#   call	- handing events to the worker, batching them and building the upload
+#
+# Each time is the best of --runs runs of the whole suite, so a burst of load on
+# the machine only spoils one of them. --compare exits with status 1 if anything
+# is more than --tolerance percent slower than the baseline, and by more than
+# --floor ns - a few tens of ns is noise for the fastest of them. Baselines are
+# only comparable on the same machine.
+
+import argparse
+from collections import defaultdict
+import json
+import platform
+import sys
+import time
+from timeit import Timer
+
+from benchmarks import edmc
+from benchmarks.dispatch import CHUNK
+from benchmarks.inventory import SIZES, Snapshot, measure
+from benchmarks.journal import PROFILES, journal, make_state
+from benchmarks.serialize import capture
+from sfr.batch import Batcher
+
+LOADOUTS = (20, 40)	# Modules - a small ship, and a Corvette with every utility slot filled
+REPEAT = 5		# Runs to take the best of
+RUNS = 3		# Runs of the whole suite to take the best of
+FLOOR = 100		# ns slower that's never counted as a regression
+
+
+def best(func, repeat=REPEAT):
+    # ns per call of func, from the fastest of several runs
+    timer = Timer(func)
+    (number, elapsed) = timer.autorange()
+    return min([elapsed] + timer.repeat(repeat - 1, number)) / number * 1e9
+
+
+def time_events(plugin, entries, state, runs=REPEAT * 10):
+    # ns per journal_entry() call for each event type, from the fastest of several runs through CHUNK entries
+    byevent = defaultdict(list)
+    for item in entries:
+        byevent[item[2]['event']].append(item)
+
+    times = {}
+    for (event, items) in byevent.items():
+        chunk = (items * (CHUNK // len(items) + 1))[:CHUNK]
+        fastest = None
+        for i in range(runs):
+            edmc.reset(plugin)
+            start = time.perf_counter_ns()
+            for (system, station, entry) in chunk:
+                plugin.journal_entry('Cmdr', False, system, station, entry, state)
+            elapsed = time.perf_counter_ns() - start
+            fastest = min(elapsed, fastest or elapsed)
+        times[event] = fastest / len(chunk)
+    edmc.reset(plugin)
+    return times
+
+
+def journal_entries(plugin, count, results):
+    state = make_state()
+    byevent = defaultdict(list)
+    for (seed, (profile, mix)) in enumerate(sorted(PROFILES.items())):
+        times = time_events(plugin, journal(count, seed=seed, mix=mix), state)
+        total = float(sum(mix[e] for e in times))	# Short journals may not have every event in the mix
+        results['journal_entry.%s' % profile] = sum(times[e] * mix[e] for e in times) / total
+        for (event, t) in times.items():
+            byevent[event].append(t)
+    for (event, times) in byevent.items():
+        results['journal_entry.%s' % event] = min(times)
+
+
+def loadouts(plugin, results):
+    for modules in LOADOUTS:
+        state = make_state(modules=modules, engineered=1.0)
+        results['make_loadout.%d' % modules] = best(lambda: plugin.make_loadout(state))
+
+
+def inventories(results):
+    (cargo, materials) = SIZES[-1]
+    for change in (False, True):
+        results['inventory.%s' % (change and 'changed' or 'unchanged')] = measure(Snapshot(), make_state(cargo=cargo, materials=materials), change) * 1000
+
+
+def calls(plugin, made, results):
+    # Per event, in batches the size call() usually hands over
+    chunk = made[:100]
+    edmc.reset(plugin)
+
+    def add():
+        session = plugin.commander('Cmdr', 'F1234567')
+        for (name, timestamp, data) in chunk:
+            plugin.add_event(session, name, timestamp, data)
+        edmc.reset(plugin)
+    results['add_event'] = best(add) / len(chunk)
+
+    batcher = Batcher(linger=0)
+    elapsed = []
+    session = plugin.commander('Cmdr', 'F1234567')
+    for i in range(REPEAT * 20):
+        for (name, timestamp, data) in chunk:
+            plugin.add_event(session, name, timestamp, data)
+        start = time.perf_counter_ns()
+        plugin.call()
+        (handed, span) = plugin.queue.get_nowait()
+        for (key, events) in handed:
+            batcher.add(key, events, span)
+        batcher.flush()
+        for batch in batcher.pop():
+            plugin.payload(batch)
+        elapsed.append(time.perf_counter_ns() - start)
+    results['call'] = min(elapsed) / len(chunk)
+
+
+def run(count, runs=RUNS):
+    made = capture(count)
+    plugin = edmc.load_plugin()
+    results = {}
+    for i in range(runs):
+        once = {}
+        journal_entries(plugin, count, once)
+        loadouts(plugin, once)
+        inventories(once)
+        calls(plugin, made, once)
+        for (name, t) in once.items():
+            results[name] = min(t, results.get(name, t))
+    return results
+
+
+def compare(results, baseline, tolerance, floor=FLOOR):
+    # Print results against the baseline and return the names that got slower
+    slower = []
+    print('%-40s %12s %12s %8s' % ('', 'baseline', 'now', 'change'))
+    for name in sorted(set(results) | set(baseline)):
+        if name not in results or name not in baseline:
+            print('%-40s %12s %12s' % (name, name in baseline and '%.0f ns' % baseline[name] or '-', name in results and '%.0f ns' % results[name] or '-'))
+            continue
+        change = results[name] / baseline[name] - 1
+        flag = change * 100 > tolerance and results[name] - baseline[name] > floor and '  SLOWER' or ''
+        if flag:
+            slower.append(name)
+        print('%-40s %9.0f ns %9.0f ns %+7.1f%%%s' % (name, baseline[name], results[name], change * 100, flag))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmark suite')
+    parser.add_argument('--save', metavar='FILE', help='write results to FILE as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare results with the baseline in FILE')
+    parser.add_argument('--tolerance', type=float, default=25, help='percent slower than the baseline that counts as a regression (default: %(default)s)')
+    parser.add_argument('--floor', type=float, default=FLOOR, help='ns slower than the baseline that never counts as a regression (default: %(default)s)')
+    parser.add_argument('--count', type=int, default=5000, help='journal entries to generate per profile')
+    parser.add_argument('--runs', type=int, default=RUNS, help='runs of the whole suite to take the best of (default: %(default)s)')
+    args = parser.parse_args()
+
+    results = run(args.count, args.runs)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'machine': platform.node(),
+                'results': results,
+            }, f, indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline['results'], args.tolerance, args.floor)
+        if slower:
+            sys.exit('%d benchmarks more than %g%% slower than %s' % (len(slower), args.tolerance, args.compare))
+    elif not args.save:
+        for (name, t) in sorted(results.items()):
+            print('%-40s %9.0f ns' % (name, t))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# The Straylight Flight Recorder: the headless core (sfr.core) and its support modules. load.py adapts it to EDMC.
@@ -0,0 +1,372 @@
+# Replay historical Journal.*.log files through the plugin and send the result to SFR.
+#
+#   python -m sfr.backfill [--dry-run OUT.ndjson] [JOURNAL_DIR_OR_FILE ...]
+#
+# Run from the plugin directory. Everything is a generator pipeline - files are
+# read line by line, lines for journal events that neither the plugin nor the
+# state tracker care about are dropped before they are parsed, and uploads are
+# made as batches fill - so memory use doesn't depend on how many journals
+# there are. The `state` dict EDMC would have passed to journal_entry() is
+# rebuilt by Tracker from the journal itself.
+
+import argparse
+from datetime import datetime
+import json
+import os
+import re
+import sys
+from time import perf_counter
+from traceback import print_exc
+
+from sfr.batch import Batcher
+
+JOURNAL_DIR = os.path.join(os.path.expanduser('~'), 'Saved Games', 'Frontier Developments', 'Elite Dangerous')
+
+# Journal.YYMMDDHHMMSS.NN.log (before Odyssey) and Journal.YYYY-MM-DDTHHMMSS.NN.log
+JOURNAL_NAME = re.compile(r'^Journal(Beta)?\.((\d{12})|(\d{4}-\d\d-\d\dT\d{6}))\.(\d+)\.log$')
+
+
+def journal_files(paths):
+    # Journal files in the order they were written
+    found = []
+    for path in paths:
+        names = os.path.isdir(path) and [os.path.join(path, x) for x in os.listdir(path)] or [path]
+        for name in names:
+            match = JOURNAL_NAME.match(os.path.basename(name))
+            if match:
+                when = match.group(3) and datetime.strptime(match.group(3), '%y%m%d%H%M%S') or datetime.strptime(match.group(4), '%Y-%m-%dT%H%M%S')
+                found.append((when, int(match.group(5)), name))
+    return [name for (when, part, name) in sorted(found)]
+
+
+def journal_lines(files):
+    for name in files:
+        with open(name, 'rb') as f:
+            yield from f
+
+
+def journal_entries(lines, wanted):
+    # Parsed entries for the events in wanted. Lines are written by the game as
+    # { "timestamp":"...", "event":"Name", ... } so the name can be found without parsing.
+    wanted = frozenset(x.encode('ascii') for x in wanted)
+    for line in lines:
+        start = line.find(b'"event":"')
+        if start >= 0:
+            start += 9
+            if line[start:line.find(b'"', start)] not in wanted:
+                continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue	# Truncated by a crash
+        if entry.get('event'):
+            yield entry
+
+
+class Tracker(object):
+    # Rebuilds the parts of EDMC's monitor state that the plugin uses
+
+    def __init__(self):
+        self.cmdr = None
+        self.is_beta = False
+        self.system = None
+        self.station = None
+        self.state = {
+            'Captain': None,
+            'Cargo': {},
+            'Credits': None,
+            'FID': None,
+            'Horizons': None,
+            'Loan': None,
+            'Raw': {},
+            'Manufactured': {},
+            'Encoded': {},
+            'Engineers': {},
+            'Rank': {},
+            'Reputation': {},
+            'Statistics': {},
+            'Role': None,
+            'ShipID': None,
+            'ShipIdent': None,
+            'ShipName': None,
+            'ShipType': None,
+            'HullValue': None,
+            'ModulesValue': None,
+            'Rebuy': None,
+            'Modules': None,
+        }
+        self.handlers = {
+            'Fileheader': self.fileheader,
+            'Commander': self.commander,
+            'LoadGame': self.load_game,
+            'Rank': self.rank,
+            'Progress': self.progress,
+            'Promotion': self.promotion,
+            'Reputation': self.reputation,
+            'EngineerProgress': self.engineer_progress,
+            'Loadout': self.loadout,
+            'ShipyardBuy': self.new_ship,
+            'ShipyardNew': self.new_ship,
+            'ShipyardSwap': self.new_ship,
+            'SetUserShipName': self.set_user_ship_name,
+            'Cargo': self.cargo,
+            'MarketBuy': self.cargo_added,
+            'CollectCargo': self.cargo_added,
+            'MiningRefined': self.cargo_added,
+            'MarketSell': self.cargo_removed,
+            'EjectCargo': self.cargo_removed,
+            'Materials': self.materials,
+            'MaterialCollected': self.material_added,
+            'MaterialDiscarded': self.material_removed,
+            'EngineerCraft': self.ingredients,
+            'Synthesis': self.ingredients,
+            'Statistics': self.statistics,
+            'JoinACrew': self.crew,
+            'CrewRoleChange': self.crew,
+            'QuitACrew': self.crew,
+            'EndCrewSession': self.crew,
+            'Location': self.location,
+            'FSDJump': self.location,
+            'CarrierJump': self.location,
+            'Docked': self.location,
+            'Undocked': self.undocked,
+            'SupercruiseEntry': self.undocked,
+        }
+
+    def update(self, entry):
+        func = self.handlers.get(entry['event'])
+        if func:
+            func(entry, self.state)
+
+    def fileheader(self, entry, state):
+        self.is_beta = 'beta' in entry.get('gameversion', '').lower()
+
+    def commander(self, entry, state):
+        self.cmdr = entry['Name']
+        state['FID'] = entry.get('FID')
+
+    def load_game(self, entry, state):
+        self.cmdr = entry['Commander']
+        self.system = self.station = None
+        state.update({
+            'Captain': None,
+            'Credits': entry['Credits'],
+            'FID': entry.get('FID'),
+            'Horizons': entry.get('Horizons'),
+            'Loan': entry['Loan'],
+            'Engineers': {},
+            'Rank': {},
+            'Reputation': {},
+            'Statistics': {},
+            'Role': None,
+            'ShipID': entry.get('ShipID'),
+            'ShipIdent': entry.get('ShipIdent'),
+            'ShipName': entry.get('ShipName'),
+            'ShipType': entry.get('Ship', '').lower() or None,
+            'HullValue': None,
+            'ModulesValue': None,
+            'Rebuy': None,
+            'Modules': None,
+        })
+
+    def rank(self, entry, state):
+        for (k, v) in entry.items():
+            if k not in ('timestamp', 'event'):
+                state['Rank'][k] = (v, 0)
+
+    def progress(self, entry, state):
+        for (k, v) in entry.items():
+            if k in state['Rank']:
+                state['Rank'][k] = (state['Rank'][k][0], min(v, 100))
+
+    def promotion(self, entry, state):
+        for (k, v) in entry.items():
+            if k not in ('timestamp', 'event'):
+                state['Rank'][k] = (v, 0)
+
+    def reputation(self, entry, state):
+        for k in ('Empire', 'Federation', 'Independent', 'Alliance'):
+            if k in entry:
+                state['Reputation'][k] = entry[k]
+
+    def engineer_progress(self, entry, state):
+        for engineer in entry.get('Engineers', [entry]):
+            if 'Engineer' in engineer:
+                state['Engineers'][engineer['Engineer']] = 'Rank' in engineer and (engineer['Rank'], engineer.get('RankProgress', 0)) or engineer['Progress']
+
+    def loadout(self, entry, state):
+        state.update({
+            'ShipID': entry['ShipID'],
+            'ShipIdent': entry.get('ShipIdent'),
+            'ShipName': entry.get('ShipName'),
+            'ShipType': entry['Ship'].lower(),
+            'HullValue': entry.get('HullValue'),
+            'ModulesValue': entry.get('ModulesValue'),
+            'Rebuy': entry.get('Rebuy'),
+            'Modules': dict([(m['Slot'], m) for m in entry['Modules']]),	# New dict - queued events may hold the old one
+        })
+
+    def new_ship(self, entry, state):
+        state.update({
+            'ShipID': entry.get('NewShipID', entry.get('ShipID')),
+            'ShipIdent': None,
+            'ShipName': None,
+            'ShipType': entry['ShipType'].lower(),
+            'HullValue': None,
+            'ModulesValue': None,
+            'Rebuy': None,
+            'Modules': None,
+        })
+
+    def set_user_ship_name(self, entry, state):
+        if entry['ShipID'] == state['ShipID']:
+            state['ShipName'] = entry.get('UserShipName')
+            state['ShipIdent'] = entry.get('UserShipId')
+
+    def cargo(self, entry, state):
+        if entry.get('Vessel', 'Ship') == 'Ship' and 'Inventory' in entry:
+            state['Cargo'] = dict([(x['Name'].lower(), x['Count']) for x in entry['Inventory']])
+
+    def cargo_added(self, entry, state):
+        name = entry['Type'].lower()
+        state['Cargo'][name] = state['Cargo'].get(name, 0) + entry.get('Count', 1)
+
+    def cargo_removed(self, entry, state):
+        name = entry['Type'].lower()
+        count = state['Cargo'].get(name, 0) - entry.get('Count', 1)
+        if count > 0:
+            state['Cargo'][name] = count
+        else:
+            state['Cargo'].pop(name, None)
+
+    def materials(self, entry, state):
+        for category in ('Raw', 'Manufactured', 'Encoded'):
+            state[category] = dict([(x['Name'].lower(), x['Count']) for x in entry.get(category, [])])
+
+    def material_added(self, entry, state):
+        if entry.get('Category') not in ('Raw', 'Manufactured', 'Encoded'):
+            return
+        materials = state[entry['Category']]
+        name = entry['Name'].lower()
+        materials[name] = materials.get(name, 0) + entry['Count']
+
+    def material_removed(self, entry, state):
+        if entry.get('Category') not in ('Raw', 'Manufactured', 'Encoded'):
+            return
+        materials = state[entry['Category']]
+        name = entry['Name'].lower()
+        materials[name] = max(materials.get(name, 0) - entry['Count'], 0)
+
+    def ingredients(self, entry, state):
+        for x in entry.get('Ingredients', []):
+            name = x['Name'].lower()
+            for category in ('Raw', 'Manufactured', 'Encoded'):
+                if name in state[category]:
+                    state[category][name] = max(state[category][name] - x['Count'], 0)
+                    break
+
+    def statistics(self, entry, state):
+        state['Statistics'] = dict([(k, v) for (k, v) in entry.items() if k not in ('timestamp', 'event')])
+
+    def crew(self, entry, state):
+        state['Role'] = entry['event'] in ('JoinACrew', 'CrewRoleChange') and entry.get('Role', 'Idle') or None
+
+    def location(self, entry, state):
+        self.system = entry['StarSystem']
+        self.station = entry.get('StationName') if entry['event'] == 'Docked' or entry.get('Docked') else None
+
+    def undocked(self, entry, state):
+        self.station = None
+
+
+def replay(plugin, entries, tracker):
+    # Feed entries to journal_entry() as EDMC would, yielding what it queues for the worker
+    for entry in entries:
+        tracker.update(entry)
+        if tracker.cmdr:
+            try:
+                error = plugin.journal_entry(tracker.cmdr, tracker.is_beta, tracker.system, tracker.station, entry, tracker.state)
+            except Exception:
+                print_exc()	# EDMC would log it and carry on
+            else:
+                if error:
+                    print('%s %s: %s' % (entry['timestamp'], entry['event'], error), file=sys.stderr)
+        yield from handed(plugin.queue)
+    plugin.call()
+    yield from handed(plugin.queue)
+
+
+def handed(queue):
+    # (key, events, span) for each commander's events call() has queued
+    while not queue.empty():
+        (commanders, span) = queue.get_nowait()
+        for (key, events) in commanders:
+            yield (key, events, span)
+
+
+def batches(items, max_events, max_bytes):
+    # No linger time or urgent events - we're not waiting on anyone. Uploads are
+    # made one at a time, so there's no point splitting events into lanes either.
+    batcher = Batcher(max_events=max_events, max_bytes=max_bytes, linger=float('inf'), urgent=(), lanes={})
+    for item in items:
+        batcher.add(*item)
+        yield from batcher.pop()
+    batcher.flush()
+    yield from batcher.pop()
+
+
+class Counter(object):
+    # Counts lines as they pass through
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.iterable:
+            self.count += 1
+            yield item
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send historical journals to the Straylight Flight Recorder')
+    parser.add_argument('paths', nargs='*', default=[JOURNAL_DIR], metavar='PATH', help='journal directory or Journal.*.log files (default: %(default)s)')
+    parser.add_argument('--dry-run', metavar='FILE', help="write payloads to FILE as NDJSON ('-' for stdout) instead of uploading")
+    parser.add_argument('--max-events', type=int, default=1000, help='events per upload (default: %(default)s)')
+    parser.add_argument('--max-bytes', type=int, default=512 * 1024, help='approximate bytes per upload (default: %(default)s)')
+    args = parser.parse_args()
+
+    from sfr import core	# The plugin - without start() there's no worker thread or spool
+
+    files = journal_files(args.paths)
+    if not files:
+        sys.exit('No journals found in %s' % ', '.join(args.paths))
+
+    tracker = Tracker()
+    lines = Counter(journal_lines(files))
+    entries = journal_entries(lines, set(core.HANDLERS) | set(tracker.handlers))
+    out = args.dry_run and (args.dry_run == '-' and sys.stdout.buffer or open(args.dry_run, 'wb'))
+
+    start = perf_counter()
+    (uploads, events, failed) = (0, 0, 0)
+    for batch in batches(replay(core, entries, tracker), args.max_events, args.max_bytes):
+        body = core.payload(batch)
+        if out:
+            out.write(body)
+            out.write(b'\n')
+        elif not core.upload(core.API_URL, body, batch.events):
+            failed += 1
+        uploads += 1
+        events += len(batch.events)
+    elapsed = perf_counter() - start
+
+    if out and out is not sys.stdout.buffer:
+        out.close()
+    print('%d journals, %d lines, %d events (%d suppressed) in %d uploads (%d failed) in %.1fs - %.0f lines/s' % (
+        len(files), lines.count, events, sum(core.metrics.suppressed.values()), uploads, failed, elapsed, lines.count / max(elapsed, 1e-9)), file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+# Batching stage between call() and the SFR worker thread.
+#
+# call() hands over whatever events it has; the worker feeds them to a Batcher
+# which releases an upload when a batch is full (MAX_EVENTS or MAX_BYTES), when
+# it has been open for LINGER seconds, or straight away if it contains an
+# URGENT event (the ones whose reply updates the main window).
+#
+# Each commander's events are split into LANES. Events in a lane are batched
+# and uploaded in order, but different lanes don't depend on each other and so
+# can be uploaded at the same time (see sfr.pool). When there are more lanes
+# with uploads waiting than upload threads, PRIORITY decides which go first.
+#
+# An upload bigger than SPLIT_BYTES that SFR said was too large, or that timed
+# out, is retried in two halves - each of which only needs to get through once.
+# One that SFR refused because of its content is split all the way down, to
+# drop just the events it won't take.
+#
+# If SFR has been out of reach for long enough that too much is waiting to be
+# uploaded (see sfr.pool), supersede() merges snapshots that a later one makes
+# redundant, and if that isn't enough expend() drops EXPENDABLE events.
+
+from collections import deque
+import json
+import time
+
+from sfr import codec
+
+MAX_EVENTS = 100		# Events per upload
+MAX_BYTES = 64 * 1024	# Encoded size of events per upload
+LINGER = 5.0		# Seconds a partial batch may wait for more events
+SPLIT_BYTES = 16 * 1024	# Smallest failed upload that's split in two for retrying
+
+# Travel events - reply feeds the system and station links, so send at once
+URGENT = frozenset(['addCommanderTravelDock', 'addCommanderTravelFSDJump', 'setCommanderTravelLocation'])
+
+TRAVEL = 'travel'	# Where the commander is and what they're flying - order matters
+STATE = 'state'		# Snapshots of ranks, reputation, inventory etc - each replaces the last
+ACTIVITY = 'activity'	# Everything else - missions, combat, trade, friends, community goals, carriers
+LANES = {
+    'addCommanderTravelDock': TRAVEL,
+    'addCommanderTravelFSDJump': TRAVEL,
+    'setCommanderTravelLocation': TRAVEL,
+    'addCommanderShip': TRAVEL,
+    'delCommanderShip': TRAVEL,
+    'setCommanderShip': TRAVEL,
+    'setCommanderShipLoadout': TRAVEL,
+    'updateCommanderShipLoadout': TRAVEL,
+    'setCommanderShipTransfer': TRAVEL,
+    'setCommanderCredits': STATE,
+    'setCommanderGameStatistics': STATE,
+    'setCommanderInventoryCargo': STATE,
+    'setCommanderInventoryMaterials': STATE,
+    'setCommanderRankEngineer': STATE,
+    'setCommanderRankPilot': STATE,
+    'setCommanderRankPower': STATE,
+    'setCommanderReputationMajorFaction': STATE,
+    'setCommanderReputationMinorFaction': STATE,
+    'setCommanderStorageModules': STATE,
+    'updateCommanderStorageModules': STATE,
+}
+
+# Snapshots where only the latest matters - eventName -> the eventData field that tells them apart,
+# or None if there's only one. Those with a field are merged, later properties winning, so that a
+# ship keeps a name that was only in an earlier event.
+SUPERSEDE = {
+    'setCommanderCredits': None,
+    'setCommanderGameStatistics': None,
+    'setCommanderInventoryCargo': None,
+    'setCommanderInventoryMaterials': None,
+    'setCommanderStorageModules': None,
+    'setCommanderShip': 'shipGameID',
+    'setCommanderShipLoadout': 'shipGameID',
+}
+
+# Dropped, oldest first, if merging snapshots isn't enough
+EXPENDABLE = frozenset(['addCommanderShipScan', 'setCommanderTravelLocation', 'addCarrierStats', 'setCommanderCommunityGoalProgress'])
+
+HIGH = 0	# Travel, ships and combat - what the main window and SFR's live views show
+LOW = 1		# Big snapshots that nothing is waiting on
+PRIORITY = {TRAVEL: HIGH, ACTIVITY: HIGH, STATE: LOW}
+
+
+class Batch(object):
+
+    __slots__ = ('key', 'lane', 'events', 'spans', 'size', 'urgent', 'opened', 'attempts', 'body')
+
+    def __init__(self, key, lane, opened):
+        self.key = key		# (cmdr, FID) - events for different commanders are never mixed
+        self.lane = lane
+        self.events = []
+        self.spans = []		# Spool spans with events in this batch
+        self.size = 0
+        self.urgent = False
+        self.opened = opened
+        self.attempts = 0	# Failed uploads
+        self.body = None	# Encoded upload, kept for retries
+
+
+class Batcher(object):
+
+    def __init__(self, max_events=MAX_EVENTS, max_bytes=MAX_BYTES, linger=LINGER, urgent=URGENT, lanes=LANES, clock=time.monotonic):
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.linger = linger
+        self.urgent = urgent
+        self.lanes = lanes	# eventName -> lane. Pass {} to keep everything in one lane
+        self.clock = clock
+        self.open = {}		# (key, lane) -> Batch still accepting events, oldest first
+        self.ready = deque()	# Sealed batches waiting to be uploaded
+
+    def add(self, key, events, span=None):
+        for event in events:
+            size = event.size()
+            lane = (key, self.lanes.get(event.name, ACTIVITY))
+            current = self.open.get(lane)
+            if current and current.size + size > self.max_bytes:
+                self.seal(lane)
+                current = None
+            if not current:
+                current = self.open[lane] = Batch(key, lane[1], self.clock())
+            if span and (not current.spans or current.spans[-1] is not span):
+                current.spans.append(span)
+                span.parts += 1
+            current.events.append(event)
+            current.size += size
+            if event.name in self.urgent:
+                current.urgent = True
+            if len(current.events) >= self.max_events:
+                self.seal(lane)
+
+        # Send urgent events along with everything queued ahead of them in their lane
+        for lane in [lane for (lane, batch) in self.open.items() if batch.urgent]:
+            self.seal(lane)
+
+    def timeout(self):
+        # Seconds until the oldest open batch must be sent, or None if there isn't one
+        if not self.open:
+            return None
+        return max(0, min(batch.opened for batch in self.open.values()) + self.linger - self.clock())
+
+    def expire(self):
+        now = self.clock()
+        for lane in [lane for (lane, batch) in self.open.items() if now >= batch.opened + self.linger]:
+            self.seal(lane)
+
+    def seal(self, lane):
+        batch = self.open.pop(lane, None)
+        if batch:
+            self.ready.append(batch)
+
+    def merge(self, batch, other):
+        # Add the events of the next batch in the same lane to batch, if there's room and neither
+        # has been posted yet. True if so
+        if batch.attempts or other.attempts:
+            return False
+        if len(batch.events) + len(other.events) > self.max_events or batch.size + other.size > self.max_bytes:
+            return False
+        batch.events.extend(other.events)
+        batch.size += other.size
+        batch.urgent = batch.urgent or other.urgent
+        for span in other.spans:
+            if batch.spans and batch.spans[-1] is span:
+                span.parts -= 1	# One upload now, not two
+            else:
+                batch.spans.append(span)
+        return True
+
+    def flush(self):
+        for lane in list(self.open):
+            self.seal(lane)
+
+    def pop(self):
+        while self.ready:
+            yield self.ready.popleft()
+
+
+def split(batch, min_bytes=SPLIT_BYTES):
+    # A failed batch as halves of about the same size, to be retried in order - or just the batch
+    if len(batch.events) < 2 or batch.size < min_bytes:
+        return [batch]
+    sizes = [event.size() for event in batch.events]
+    (n, size) = (1, sizes[0])
+    while n < len(sizes) - 1 and size + sizes[n] <= batch.size / 2:
+        size += sizes[n]
+        n += 1
+
+    halves = []
+    for (events, part_size) in ((batch.events[:n], size), (batch.events[n:], batch.size - size)):
+        half = Batch(batch.key, batch.lane, batch.opened)
+        half.events = events
+        half.size = part_size
+        half.spans = list(batch.spans)	# Which span each event came from isn't kept, so both carry them all
+        half.urgent = batch.urgent
+        half.attempts = batch.attempts
+        halves.append(half)
+    for span in batch.spans:
+        span.parts += 1
+    return halves
+
+
+def supersede(batches):
+    # Merge snapshots in batches (oldest first) into the latest of each for their commander.
+    # Returns how many events went
+    latest = {}	# (commander, eventName, key) -> (latest event, its eventData, whether others were merged into it)
+    gone = set()	# id()s of superseded events
+    for batch in reversed(batches):
+        for event in reversed(batch.events):
+            field = SUPERSEDE.get(event.name, False)
+            if field is False:
+                continue
+            data = field and json.loads(event.data)
+            key = (batch.key, event.name, field and data.get(field))
+            later = latest.get(key)
+            if later is None:
+                latest[key] = (event, data, False)
+            else:
+                gone.add(id(event))
+                if field:
+                    latest[key] = (later[0], dict(data, **later[1]), True)
+    if not gone:
+        return 0
+
+    merged = {id(event): data for (event, data, changed) in latest.values() if changed}
+    for batch in batches:
+        events = []
+        for event in batch.events:
+            if id(event) in gone:
+                continue
+            data = merged.get(id(event))
+            events.append(data is None and event or codec.Event.make(event.name, event.timestamp, data))
+        if events != batch.events:	# Same Events, unless some went or were merged into
+            batch.events = events
+            batch.size = sum(event.size() for event in events)
+            batch.body = None
+    return len(gone)
+
+
+def expend(batches, events, size):
+    # Drop EXPENDABLE events from batches, oldest first, until at least `events` of them and `size`
+    # bytes have gone, or there are none left. Returns (events, bytes) dropped
+    (dropped, freed) = (0, 0)
+    for batch in batches:
+        if dropped >= events and freed >= size:
+            break
+        kept = []
+        for event in batch.events:
+            if event.name in EXPENDABLE and (dropped < events or freed < size):
+                dropped += 1
+                freed += event.size()
+            else:
+                kept.append(event)
+        if len(kept) != len(batch.events):
+            batch.events = kept
+            batch.size = sum(event.size() for event in kept)
+            batch.body = None
+    return (dropped, freed)
@@ -0,0 +1,63 @@
+# Unsent events, in the order they were added, indexed so that superseded
+# events can be dropped without scanning the whole buffer.
+#
+# Events added with a key replace any unsent event with the same name and key,
+# and supersede() drops every unsent event with a given name (and key). Both
+# are O(1) per event dropped however long the buffer has grown while offline.
+
+from itertools import count
+
+
+class EventBuffer(object):
+
+    def __init__(self):
+        self.seq = count()
+        self.coalesced = 0	# Events dropped because a later one superseded them
+        self.added = 0		# Events ever added
+        self.clear()
+
+    def clear(self):
+        self.events = {}	# seq -> event, in insertion order
+        self.byname = {}	# eventName -> {seq: key}
+        self.bykey = {}		# (eventName, key) -> seq
+
+    def append(self, event, key=None):
+        seq = next(self.seq)
+        name = event.name
+        if key is not None:
+            old = self.bykey.get((name, key))
+            if old is not None:
+                self.drop(old)
+            self.bykey[(name, key)] = seq
+        self.events[seq] = event
+        self.byname.setdefault(name, {})[seq] = key
+        self.added += 1
+
+    def supersede(self, name, key=None):
+        # Drop unsent events with this name - and key, if given
+        if key is not None:
+            seq = self.bykey.get((name, key))
+            if seq is not None:
+                self.drop(seq)
+        else:
+            for seq in list(self.byname.get(name, ())):
+                self.drop(seq)
+
+    def drop(self, seq):
+        name = self.events.pop(seq).name
+        key = self.byname[name].pop(seq)
+        if key is not None:
+            del self.bykey[(name, key)]
+        self.coalesced += 1
+
+    def take(self):
+        # Everything unsent, oldest first, leaving the buffer empty
+        events = list(self.events.values())
+        self.clear()
+        return events
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events.values())
@@ -0,0 +1,80 @@
+# JSON encoding for events and uploads.
+#
+# Each event's data is encoded once, when add_event() makes it, and carried
+# around as compact UTF-8 bytes in a small Event record alongside its name and
+# timestamp. Those are interned, since a session only has a few dozen event
+# names and every event from a journal entry shares its timestamp. Spool lines
+# and upload bodies are put together by joining bytes, so the data is never
+# encoded again - not when the spool writes it, and not when an upload is
+# retried. orjson is used if it happens to be installed, otherwise the json
+# module. orjson takes longer to import than the rest of the plugin put
+# together, so that waits until there's something to encode.
+
+import json
+import sys
+
+orjson = None	# The orjson module once fast() has been called, or False if it isn't installed
+
+
+def fast():
+    # orjson, or None if it isn't installed
+    global orjson
+    if orjson is None:
+        try:
+            import orjson as module
+        except ImportError:
+            module = False
+        orjson = module
+    return orjson or None
+
+
+def dumps(obj):
+    # Compact JSON, as bytes
+    encoder = fast()
+    if encoder:
+        try:
+            return encoder.dumps(obj)
+        except TypeError:
+            pass	# Something orjson won't do, e.g. ints over 64 bits - json can
+    return json.dumps(obj, separators = (',', ':')).encode('utf-8')
+
+
+OVERHEAD = len(b'{"eventName":"","eventTimestamp":"","eventData":}')
+
+
+class Event(object):
+
+    __slots__ = ('name', 'timestamp', 'data')
+
+    def __init__(self, name, timestamp, data):
+        self.name = sys.intern(name)	# eventName
+        self.timestamp = sys.intern(timestamp)
+        self.data = data		# eventData, encoded
+
+    @classmethod
+    def make(cls, name, timestamp, data):
+        data = dumps(data)
+        if orjson:
+            data = memoryview(data).tobytes()	# orjson's bytes hang on to its whole buffer, 1KB or more - keep just the JSON
+        return cls(name, timestamp, data)
+
+    @classmethod
+    def decoded(cls, event):
+        # From an event that has been through json.loads(), e.g. replayed from the spool
+        return cls.make(event['eventName'], event['eventTimestamp'], event['eventData'])
+
+    def size(self):
+        # Encoded length, near enough
+        return OVERHEAD + len(self.name) + len(self.timestamp) + len(self.data)
+
+    def encode(self):
+        # Names are ours and timestamps are the journal's ISO 8601 - neither needs escaping
+        return b''.join([b'{"eventName":"', self.name.encode('ascii'), b'","eventTimestamp":"', self.timestamp.encode('ascii'), b'","eventData":', self.data, b'}'])
+
+    def __repr__(self):
+        return self.encode().decode('utf-8')
+
+
+def payload(header, events):
+    # Upload body for a list of Events
+    return b''.join([b'{"header":', dumps(header), b',"events":[', b','.join([event.encode() for event in events]), b']}'])
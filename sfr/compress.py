@@ -0,0 +1,212 @@
+# Compression for upload bodies. Off unless COMPRESSION is set in sfr.core, as
+# SFR has to be able to decode it.
+#
+#   GZIP	- Content-Encoding: gzip
+#   DEFLATE	- Content-Encoding: deflate, a zlib stream as HTTP means by it
+#   DICTIONARY	- deflate with a preset dictionary of what SFR uploads repeat:
+#		  eventNames, eventData keys and the like. Small uploads are mostly
+#		  those, so they shrink a lot more than with plain deflate.
+#
+# The dictionary is versioned, and a version never changes once released -
+# benchmarks.compression --train makes the vocabulary for a new one. Its
+# version goes in the SFR-Dictionary header, since the server needs it before it
+# can read anything in the upload, and zlib puts the dictionary's checksum at
+# the start of the stream too.
+
+import zlib
+
+GZIP = 'gzip'
+DEFLATE = 'deflate'
+DICTIONARY = 'dictionary'
+
+LEVEL = 6	# zlib's default - little smaller for a lot more CPU above this
+VERSION = 1	# Dictionary version used for uploads
+
+VOCABULARIES = {
+    1: (
+        '"bankBalance":',
+        '"body":',
+        '"callsign":',
+        '"carrierId":',
+        '"commanderCredits":',
+        '"commanderFrontierID":',
+        '"commanderLoan":',
+        '"communitygoalGameID":',
+        '"communitygoalName":',
+        '"contribution":',
+        '"contributionsTotal":',
+        '"contributorsNum":',
+        '"dockingAccess":',
+        '"freeSpaceCurr":',
+        '"freeSpaceMax":',
+        '"fuelLevel":',
+        '"goalExpiry":',
+        '"isCompleted":',
+        '"isHot":',
+        '"isPlayer":',
+        '"isSubmit":',
+        '"isSuccess":',
+        '"itemCount":',
+        '"jumpRangeCurr":',
+        '"jumpRangeMax":',
+        '"marketID":',
+        '"opponentName":',
+        '"percentileBand":',
+        '"powerName":',
+        '"system":',
+        '"transferTime":',
+        '"version":',
+        '{"eventName":"addCarrierJumpRequest","eventTimestamp":"',
+        '{"eventName":"addCarrierStats","eventTimestamp":"',
+        '{"eventName":"addCommanderCombatDeath","eventTimestamp":"',
+        '{"eventName":"addCommanderCombatInterdicted","eventTimestamp":"',
+        '{"eventName":"addCommanderCombatInterdiction","eventTimestamp":"',
+        '{"eventName":"addCommanderCombatInterdictionEscape","eventTimestamp":"',
+        '{"eventName":"addCommanderCombatKill","eventTimestamp":"',
+        '{"eventName":"addCommanderPermit","eventTimestamp":"',
+        '{"eventName":"addCommanderShip","eventTimestamp":"',
+        '{"eventName":"delCommanderShip","eventTimestamp":"',
+        '{"eventName":"setCommanderCommunityGoalProgress","eventTimestamp":"',
+        '{"eventName":"setCommanderCredits","eventTimestamp":"',
+        '{"eventName":"setCommanderInventoryCargo","eventTimestamp":"',
+        '{"eventName":"setCommanderInventoryMaterials","eventTimestamp":"',
+        '{"eventName":"setCommanderMissionAbandoned","eventTimestamp":"',
+        '{"eventName":"setCommanderMissionFailed","eventTimestamp":"',
+        '{"eventName":"setCommanderRankPower","eventTimestamp":"',
+        '{"eventName":"setCommanderShipTransfer","eventTimestamp":"',
+        '{"eventName":"setCommanderStorageModules","eventTimestamp":"',
+        '{"eventName":"setCommunityGoal","eventTimestamp":"',
+        '","commanderFrontierID":"',
+        '","version":"2.0.0"},"events":[',
+        '"isCurrentShip":',
+        '"isCurrentShip":true',
+        '"rankStage":',
+        '"shipHullValue":',
+        '"shipIdent":',
+        '"shipModulesValue":',
+        '"shipName":',
+        '"shipRebuyCost":',
+        '{"eventName":"setCommanderRankEngineer","eventTimestamp":"',
+        '{"eventName":"setCommanderRankPilot","eventTimestamp":"',
+        '{"eventName":"setCommanderReputationMajorFaction","eventTimestamp":"',
+        '{"eventName":"setCommanderShip","eventTimestamp":"',
+        '{"header":{"commanderName":"',
+        '"shipLoadout":',
+        '{"eventName":"setCommanderShipLoadout","eventTimestamp":"',
+        '"engineerName":',
+        '"majorfactionName":',
+        '"majorfactionReputation":',
+        '"rankName":',
+        '"rankProgress":',
+        '"rankValue":',
+        '"stationNameOrigin":null',
+        '"Bank_Account":',
+        '"Bounties_Claimed":',
+        '"Combat":',
+        '"Current_Wealth":',
+        '{"eventName":"setCommanderGameStatistics","eventTimestamp":"',
+        '"blueprintLevel":',
+        '"blueprintName":',
+        '"blueprintQuality":',
+        '"engineering":',
+        '"experimentalEffect":',
+        '"modifiers":',
+        '"stationName":null',
+        '"isOn":',
+        '"isOn":true',
+        '"itemHealth":',
+        '"itemName":',
+        '"itemPriority":',
+        '"itemValue":',
+        '"slotName":',
+        '{"eventName":"delCommanderFriend","eventTimestamp":"',
+        '"minorfactionEffects":',
+        '"rewardCredits":',
+        '{"eventName":"setCommanderMissionCompleted","eventTimestamp":"',
+        '"commodityCount":',
+        '"commodityName":',
+        '"minorfactionNameOrigin":',
+        '"missionExpiry":',
+        '"missionName":',
+        '"starsystemNameOrigin":',
+        '"starsystemNameTarget":',
+        '"stationNameOrigin":',
+        '"stationNameTarget":',
+        '{"eventName":"addCommanderMission","eventTimestamp":"',
+        '"lessIsGood":',
+        '"originalValue":',
+        '"amount":',
+        '"faction":',
+        '{"eventName":"addCommanderFactionKillBond","eventTimestamp":"',
+        '{"eventName":"addCommanderFriend","eventTimestamp":"',
+        '"value":',
+        '"average":',
+        '"blackmarket":',
+        '"blackmarket":null',
+        '"illegal":',
+        '"illegal":null',
+        '"stolen":',
+        '"stolen":null',
+        '{"eventName":"addMarketSell","eventTimestamp":"',
+        '{"eventName":"addMarketBuy","eventTimestamp":"',
+        '"commanderName":',
+        '"gamePlatform":',
+        '"influenceGain":',
+        '"missionGameID":',
+        '"reputationGain":',
+        '{"eventName":"addCommanderTravelDock","eventTimestamp":"',
+        '"stationName":',
+        '"count":',
+        '"price":',
+        '"total":',
+        '{"eventName":"setCommanderTravelLocation","eventTimestamp":"',
+        '"bounty":',
+        '"nameRaw":',
+        '"power":',
+        '"power":null',
+        '"rank":',
+        '"ship":',
+        '"ship":null',
+        '"shipRaw":',
+        '"squadronId":',
+        '"squadronId":null',
+        '"status":',
+        '{"eventName":"addCommanderShipScan","eventTimestamp":"',
+        '"type":',
+        '"name":',
+        '"jumpDistance":',
+        '{"eventName":"addCommanderTravelFSDJump","eventTimestamp":"',
+        '{"eventName":"setCommanderReputationMinorFaction","eventTimestamp":"',
+        '"shipGameID":',
+        '"shipType":',
+        '"starsystemName":',
+        '"minorfactionReputation":',
+        '"minorfactionName":',
+        '","eventData":',
+    ),
+}
+
+DICTIONARIES = {version: ''.join(vocabulary).encode('utf-8') for (version, vocabulary) in VOCABULARIES.items()}
+
+
+def compress(body, mode, level=LEVEL):
+    # (body to post, HTTP headers to go with it)
+    if mode == GZIP:
+        packer = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)	# gzip wrapper
+        return (packer.compress(body) + packer.flush(), {'Content-Encoding': 'gzip'})
+    elif mode == DEFLATE:
+        return (zlib.compress(body, level), {'Content-Encoding': 'deflate'})
+    elif mode == DICTIONARY:
+        packer = zlib.compressobj(level, zdict=DICTIONARIES[VERSION])
+        return (packer.compress(body) + packer.flush(), {'Content-Encoding': 'deflate', 'SFR-Dictionary': str(VERSION)})
+    return (body, {})
+
+
+def decompress(body, encoding, dictionary=None):
+    # What the server does - for benchmarks.server and the benchmarks
+    if encoding == 'gzip':
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        unpacker = dictionary and zlib.decompressobj(zdict=DICTIONARIES[int(dictionary)]) or zlib.decompressobj()
+        return unpacker.decompress(body) + unpacker.flush()
+    return body
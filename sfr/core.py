@@ -0,0 +1,1219 @@
+# Headless core of the plugin: turns journal entries into SFR events and uploads them.
+#
+# Nothing here needs EDMC or tkinter, so sfr.backfill, the benchmarks or a
+# service can use it as they are, and load.py is a thin adapter between it and
+# EDMC. requests is only imported once the worker thread starts, or something
+# is first uploaded, and what's only needed once EDMC has started the plugin -
+# the spool, uploads, metrics and deltas - waits until then too, so importing
+# this is quick. Whatever is running the core
+# shows errors, status changes and SFR's replies by setting on_error, on_status
+# and on_reply.
+
+import builtins
+import os
+import sys
+import time
+from collections.abc import Mapping
+from operator import attrgetter, itemgetter
+from queue import Empty, Queue, SimpleQueue
+from threading import Lock, Thread
+from traceback import print_exc
+
+from sfr import codec
+from sfr.retry import ATTEMPTS, CLOSED, HALF_OPEN, CircuitBreaker, RetryQueue, backoff
+from sfr.session import CommanderSession
+from sfr.startup import UNCHANGED, Acknowledged
+
+API_URL = 'https://sfr.straylight.systems/upload'
+API_HEADERS = {'Content-type': 'application/json'}
+COMPRESSION = None	# Or compress.GZIP, DEFLATE or DICTIONARY - only once SFR can decode it
+DELTAS = False		# Send changes to loadouts and stored modules rather than the lot - only once SFR takes them
+
+_TIMEOUT = 20
+CONNECT_TIMEOUT = 5	# Give up quickly if SFR can't be reached at all
+DRAIN = 2.0	# Seconds stop() gives the last upload, however the network is behaving
+FAKE = ['CQC', 'Training', 'Destination']	# Fake systems that shouldn't be sent to SFR
+CREDIT_RATIO = 1.05		# Update credits if they change by 5% over the course of a session
+LOCATION_EVENTS = ('addCommanderTravelDock', 'addCommanderTravelFSDJump', 'setCommanderTravelLocation')	# SFR replies with Inara URLs for these
+SHIP_EVENTS = ('addCommanderShip', 'setCommanderShip')
+REFUSED = (400, 422)	# HTTP statuses for uploads SFR won't take because of what's in them
+
+INVENTORY = ('Cargo', 'Raw', 'Manufactured', 'Encoded')	# Dicts in EDMC's state used by send(), so by any entry with SEND handlers
+NESTED = ('Modules',)	# Dicts in EDMC's state whose values EDMC changes in place
+
+this = sys.modules[__name__]	# For holding module globals
+this.session = None	# requests.Session, made when first needed - see connection()
+this.journal = SimpleQueue()	# (cmdr, system, station, entry, state) for the translation thread to turn into events
+this.translator = None	# Translation thread, while running. Otherwise journal_entry() translates entries itself
+this.queue = Queue()	# ([((cmdr, FID), events)], spool span) to be batched and sent to SFR by worker thread, or Done uploads
+this.spool = None	# Events not yet acknowledged by SFR, kept on disk
+this.breaker = CircuitBreaker()	# Stops uploads while SFR is down
+this.making = Lock()	# For making metrics and deltas when first used - see __getattr__()
+this.deadline = None	# When the worker must be done by, once stop() has been called
+this.unsent = 0		# Events the worker couldn't send before the deadline
+this.acknowledged = Acknowledged()	# What SFR has of each commander's state, so StartUp only sends what changed
+
+# Cached Cmdr state
+this.sessions = {}	# FID (or name, if there isn't one) -> CommanderSession
+
+this.system = None	# Inara URLs from SFR's replies, for the current system and station
+this.station = None
+
+# Set by whatever is running the core. Called on the translation, worker and upload threads.
+this.on_error = print	# (message) - something the user should know about
+this.on_status = None	# (breaker state) - after every upload or probe
+this.on_reply = None	# (eventName, eventData) - SFR's reply to each of LOCATION_EVENTS and SHIP_EVENTS
+
+# this.metrics (sfr.metrics.Metrics) and this.deltas (sfr.delta.Deltas, the versions of loadouts and stored
+# modules SFR has, to send changes to) are made when first used, so their modules aren't imported with this
+def __getattr__(name):
+    with this.making:
+        if name in vars(this):
+            pass	# Made by another thread meanwhile
+        elif name == 'metrics':
+            from sfr.metrics import Metrics
+            this.metrics = Metrics()
+        elif name == 'deltas':
+            from sfr.delta import Deltas
+            this.deltas = Deltas()
+        else:
+            raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    return vars(this)[name]
+
+def _(s):
+    # EDMC's translation function, when running in EDMC
+    func = getattr(builtins, '_', None)
+    return func(s) if func else s
+
+def start(folder, metrics_file=None):
+    # Replay and keep unsent events in folder, and start the translation and worker threads
+    from sfr.spool import Spool
+    this.spool = Spool(os.path.join(folder, 'sfr.spool'))	# Unsent events are replayed by the worker
+    this.deadline = None
+    this.unsent = 0
+    this.acknowledged.load(os.path.join(folder, 'sfr.startup'))
+    this.metrics.track('queue_depth', this.queue.qsize)
+    this.metrics.track('unsent_events', lambda: sum(len(session.events) for session in list(this.sessions.values())))
+    this.metrics.track('events_coalesced', lambda: sum(session.events.coalesced for session in list(this.sessions.values())))
+    this.metrics.track('breaker_open', lambda: int(this.breaker.state != CLOSED))
+    this.metrics.track('journal_backlog', this.journal.qsize)
+    if metrics_file:
+        this.metrics.start(metrics_file)
+    this.thread = Thread(target = worker, name = 'SFR worker')
+    this.thread.daemon = True
+    this.thread.start()
+    this.translator = Thread(target = translation, name = 'SFR translator')
+    this.translator.daemon = True
+    this.translator.start()
+
+# Takes DRAIN and half as much again at most, however the network and the disk are behaving. Threads
+# still going by then are left to finish (they're daemons), and whatever they don't send stays in the
+# spool for next time.
+def stop():
+    this.deadline = time.monotonic() + DRAIN
+    # Finish translating entries already handed over
+    this.journal.put(None)
+    this.translator.join(DRAIN / 4)
+    translated = not this.translator.is_alive()
+    this.translator = None
+    # Send any unsent events - not while the translator could still be adding to them
+    if translated:
+        call()
+    # Signal thread to close and wait for it, but only until the deadline
+    this.queue.put(None)
+    this.thread.join(max(0, this.deadline - time.monotonic()))
+    finished = translated and not this.thread.is_alive()
+    this.thread = None
+    this.spool.close(DRAIN / 4)
+    this.acknowledged.save()
+    this.metrics.stop(DRAIN / 4)
+    if not finished:
+        print('SFR\tStopped while still sending - an unknown number of events not sent, they will be next time')
+    elif this.unsent:
+        print('SFR\t%d events not sent - they will be next time' % this.unsent)
+
+# Journal event handlers, filled in by the @handler decorator. Each phase runs in turn:
+#   PRE	- update cached state before anything is sent
+#   SEND	- events that should be sent straight away, together with cargo and materials (if changed)
+#   DEFER	- events that don't need to be sent immediately but will be sent on the next mandatory event
+PRE, SEND, DEFER = range(3)
+HANDLERS = {}	# Journal event name -> ([PRE handlers], [SEND handlers], [DEFER handlers])
+FIELDS = {}	# Journal event name -> dicts in EDMC's state its handlers use
+
+def handler(*events, phase=SEND, state=()):
+    # state names any dicts in EDMC's state that the handler uses
+    def register(func):
+        for event in events:
+            HANDLERS.setdefault(event, ([], [], []))[phase].append(func)
+            fields = FIELDS.get(event, ()) + tuple(state) + (phase == SEND and INVENTORY or ())
+            FIELDS[event] = tuple(dict.fromkeys(fields))
+        return func
+    return register
+
+# Called by EDMC on its main thread, so it only takes a snapshot of the state the handlers will need and
+# leaves making events to the translation thread. Without one (e.g. in sfr.backfill) entries are translated
+# straight away, and any error is returned.
+def journal_entry(cmdr, is_beta, system, station, entry, state):
+    fields = FIELDS.get(entry['event'])
+    if fields is None:
+        return	# Nothing to do for this event
+
+    start = time.perf_counter()
+    if this.translator:
+        this.journal.put((cmdr, system, station, entry, snapshot(state, fields)))
+        error = None
+    else:
+        error = translate((cmdr, system, station, entry, state))
+    this.metrics.entries.observe(time.perf_counter() - start)
+    return error
+
+# EDMC's state as it is now, for the translation thread. EDMC changes the dicts in it as it goes, so
+# those in fields are copied too - one level deep where EDMC replaces their values, and all the way
+# down for those in NESTED, such as a module's Engineering that EDMC fills in on EngineerCraft.
+def snapshot(state, fields):
+    copy = state.copy()
+    for field in fields:
+        value = copy[field]
+        if value is not None:
+            copy[field] = field in NESTED and copied(value) or value.copy()
+    return copy
+
+# A copy all the way down of data parsed from the journal - any kind of Mapping (EDMC's are often
+# OrderedDicts, which marshal won't take) as a dict, and lists. Several times quicker than deepcopy.
+def copied(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value	# Most of it, so checked first
+    elif isinstance(value, Mapping):
+        return {key: copied(item) for (key, item) in value.items()}
+    elif isinstance(value, list):
+        return [copied(item) for item in value]
+    return value
+
+# Translation thread
+def translation():
+    while True:
+        item = this.journal.get()
+        if item is None:
+            return	# Closing
+        error = translate(item)
+        if error:
+            show_error(error)
+
+# The session for a commander, started when first seen. Switching between commanders leaves each one's
+# unsent events and cached state as they were.
+def commander(cmdr, FID):
+    session = this.sessions.get(FID or cmdr)
+    if not session:
+        session = this.sessions[FID or cmdr] = CommanderSession(cmdr, FID)
+    session.cmdr = cmdr or session.cmdr	# Renamed, perhaps
+    return session
+
+# Run the handlers for an entry. Returns an error message if one of them failed, rather than raising -
+# the translation thread has to carry on with the next entry.
+def translate(item):
+    (cmdr, system, station, entry, state) = item
+    start = time.perf_counter()
+    try:
+        session = commander(cmdr, state['FID'])
+        session.multicrew = bool(state['Role'])
+
+        # SFR couldn't apply changes to these, so they go in full
+        for (event, key) in this.deltas.rejected(session.FID):
+            append(session, event, key)
+
+        handlers = HANDLERS[entry['event']]
+        for func in handlers[PRE]:
+            func(session, system, station, entry, state)
+
+        old_events = session.events.added	# Will only send existing events if we add a new event below
+        for func in handlers[SEND]:
+            func(session, system, station, entry, state)
+        if session.events.added > old_events:
+            send(session, entry, state)
+
+        for func in handlers[DEFER]:
+            func(session, system, station, entry, state)
+    except Exception as e:
+        if __debug__: print_exc()
+        error = str(e)
+    else:
+        error = None
+
+    this.metrics.translations.observe(time.perf_counter() - start)
+    return error
+
+# Send cargo and materials if changed, and queue a call to SFR
+def send(session, entry, state):
+    if session.cargo.update(state):
+        add_event(session, 'setCommanderInventoryCargo', entry['timestamp'], session.cargo.payload)
+    if session.materials.update(state):
+        add_event(session, 'setCommanderInventoryMaterials', entry['timestamp'], session.materials.payload)
+
+    call()
+
+
+#
+# Cached state
+#
+
+@handler('LoadGame', phase=PRE)
+def load_game(session, system, station, entry, state):
+    # clear cached state
+    session.reset()
+    this.system = None
+    this.station = None
+
+@handler('Resurrect', 'ShipyardBuy', 'ShipyardSell', 'SellShipOnRebuy', phase=PRE)
+def credits_changed(session, system, station, entry, state):
+    # Events that mean a significant change in credits so we should send credits after next "Update"
+    session.lastcredits = 0
+
+@handler('ShipyardNew', 'ShipyardSwap', 'Location', phase=PRE)
+def skip_initial_docked(session, system, station, entry, state):
+    if entry['event'] != 'Location' or entry['Docked']:
+        session.suppress_docked = True
+
+
+#
+# Send location and status on new game or StartUp. Assumes Cargo is the last event on a new game (other than Docked).
+# Always send an update on Docked, FSDJump, Undocked+SuperCruise, Promotion, EngineerProgress and PowerPlay affiliation.
+# Also send material and cargo (if changed) whenever we send an update.
+#
+
+# Dump starting state to Inara - what SFR doesn't already have from the last session
+@handler('StartUp', 'Cargo', state=('Rank', 'Reputation', 'Engineers', 'Modules'))
+def startup(session, system, station, entry, state):
+    if entry['event'] == 'Cargo' and not session.newsession:
+        return
+    session.newsession = False
+    added = session.events.added
+
+    # Send rank info to Inara on startup
+    add_event(session, 'setCommanderRankPilot', entry['timestamp'],
+                [
+                    {
+                        'rankName': k.lower(),
+                        'rankValue': v[0],
+                        'rankProgress': v[1] / 100.0,
+                    } for k,v in list(state['Rank'].items()) if v is not None
+                ], if_changed=True)
+    add_event(session, 'setCommanderReputationMajorFaction', entry['timestamp'],
+                [
+                    {
+                        'majorfactionName': k.lower(),
+                        'majorfactionReputation': v / 100.0,
+                    } for k,v in list(state['Reputation'].items()) if v is not None
+                ], if_changed=True)
+    if state['Engineers']:	# Not populated < 3.3
+        add_event(session, 'setCommanderRankEngineer', entry['timestamp'],
+                    [
+                        dict([
+                            ('engineerName', k),
+                            type(v) is tuple and ('rankValue', v[0]) or ('rankStage', v),
+                        ]) for k,v in list(state['Engineers'].items())
+                    ], if_changed=True)
+
+    # Update location - always, as SFR's reply fills in the system and station links that LoadGame cleared
+    add_event(session, 'setCommanderTravelLocation', entry['timestamp'],
+                {
+                    'starsystemName': system,
+                    'stationName': station,		# Can be None
+                })
+
+    # Update ship - likewise, for the ship link. The loadout only if it's changed
+    if state['ShipID']:	# Unknown if started in Fighter or SRV
+        add_current_ship(session, entry, state, if_changed=True)
+
+    if session.events.added == added:
+        send(session, entry, state)	# SFR has all of the above, but cargo and materials are sent anyway
+
+def add_current_ship(session, entry, state, if_changed=False):
+    data = {
+        'shipType': state['ShipType'],
+        'shipGameID': state['ShipID'],
+        'shipName': state['ShipName'],	# Can be None
+        'shipIdent': state['ShipIdent'],	# Can be None
+        'isCurrentShip': True,
+    }
+    if state['HullValue']:
+        data['shipHullValue'] = state['HullValue']
+    if state['ModulesValue']:
+        data['shipModulesValue'] = state['ModulesValue']
+    data['shipRebuyCost'] = state['Rebuy']
+    add_event(session, 'setCommanderShip', entry['timestamp'], data)
+
+    session.loadout = session.loadouts.get(state['ShipID'], state, make_loadout)[0]
+    add_event(session, 'setCommanderShipLoadout', entry['timestamp'], session.loadout, state['ShipID'], if_changed)	# Replaces any unsent for this ship
+
+# Promotions
+@handler('Promotion', state=('Rank',))
+def promotion(session, system, station, entry, state):
+    for k,v in list(state['Rank'].items()):
+        if k in entry:
+            add_event(session, 'setCommanderRankPilot', entry['timestamp'],
+                        {
+                            'rankName': k.lower(),
+                            'rankValue': v[0],
+                            'rankProgress': 0,
+                        })
+
+@handler('EngineerProgress')
+def engineer_progress(session, system, station, entry, state):
+    if 'Engineer' in entry:
+        add_event(session, 'setCommanderRankEngineer', entry['timestamp'],
+                    dict([
+                        ('engineerName', entry['Engineer']),
+                        'Rank' in entry and ('rankValue', entry['Rank']) or ('rankStage', entry['Progress']),
+                    ]))
+
+# PowerPlay status change
+@handler('PowerplayJoin')
+def powerplay_join(session, system, station, entry, state):
+    add_event(session, 'setCommanderRankPower', entry['timestamp'],
+                {
+                    'powerName': entry['Power'],
+                    'rankValue': 1,
+                })
+
+@handler('PowerplayLeave')
+def powerplay_leave(session, system, station, entry, state):
+    add_event(session, 'setCommanderRankPower', entry['timestamp'],
+                {
+                    'powerName': entry['Power'],
+                    'rankValue': 0,
+                })
+
+@handler('PowerplayDefect')
+def powerplay_defect(session, system, station, entry, state):
+    add_event(session, 'setCommanderRankPower', entry['timestamp'],
+                {
+                    'powerName': entry['ToPower'],
+                    'rankValue': 1,
+                })
+
+# Ship change
+@handler('Loadout', state=('Modules',))
+def ship_change(session, system, station, entry, state):
+    if session.shipswap:
+        add_current_ship(session, entry, state)
+        session.shipswap = False
+
+# Location change
+@handler('Docked')
+def docked(session, system, station, entry, state):
+    if session.undocked:
+        # Undocked and now docking again. Don't send.
+        session.undocked = False
+    elif session.suppress_docked:
+        # Don't send initial Docked event on new game
+        session.suppress_docked = False
+    else:
+        add_event(session, 'addCommanderTravelDock', entry['timestamp'],
+                    {
+                        'starsystemName': system,
+                        'stationName': station,
+                        'shipType': state['ShipType'],
+                        'shipGameID': state['ShipID'],
+                    })
+
+@handler('Undocked')
+def undock(session, system, station, entry, state):
+    session.undocked = True
+    this.station = None
+
+@handler('SupercruiseEntry')
+def supercruise_entry(session, system, station, entry, state):
+    add_event(session, 'setCommanderTravelLocation', entry['timestamp'],
+                {
+                    'starsystemName': system,
+                    'shipType': state['ShipType'],
+                    'shipGameID': state['ShipID'],
+                })
+    session.undocked = False
+
+@handler('FSDJump')
+def fsd_jump(session, system, station, entry, state):
+    session.undocked = False
+    this.system = None
+    add_event(session, 'addCommanderTravelFSDJump', entry['timestamp'],
+                {
+                    'starsystemName': entry['StarSystem'],
+                    'jumpDistance': entry['JumpDist'],
+                    'shipType': state['ShipType'],
+                    'shipGameID': state['ShipID'],
+                })
+
+    if entry.get('Factions'):
+        add_event(session, 'setCommanderReputationMinorFaction', entry['timestamp'],
+                    [
+                        {
+                            'minorfactionName': f['Name'],
+                            'minorfactionReputation': f['MyReputation'],
+                        } for f in entry['Factions']
+                    ])
+
+# Missions
+@handler('MissionAccepted')
+def mission_accepted(session, system, station, entry, state):
+    data = {
+        'missionName': entry['Name'],
+        'missionGameID': entry['MissionID'],
+        'influenceGain': entry['Influence'],
+        'reputationGain': entry['Reputation'],
+        'starsystemNameOrigin': system,
+        'stationNameOrigin': station,
+        'minorfactionNameOrigin': entry['Faction'],
+    }
+    # optional mission-specific properties
+    for (iprop, prop) in [
+            ('missionExpiry', 'Expiry'),	# Listed as optional in the docs, but always seems to be present
+            ('starsystemNameTarget', 'DestinationSystem'),
+            ('stationNameTarget', 'DestinationStation'),
+            ('minorfactionNameTarget', 'TargetFaction'),
+            ('commodityName', 'Commodity'),
+            ('commodityCount', 'Count'),
+            ('targetName', 'Target'),
+            ('targetType', 'TargetType'),
+            ('killCount', 'KillCount'),
+            ('passengerType', 'PassengerType'),
+            ('passengerCount', 'PassengerCount'),
+            ('passengerIsVIP', 'PassengerVIPs'),
+            ('passengerIsWanted', 'PassengerWanted'),
+    ]:
+        if prop in entry:
+            data[iprop] = entry[prop]
+    add_event(session, 'addCommanderMission', entry['timestamp'], data)
+
+@handler('MissionAbandoned')
+def mission_abandoned(session, system, station, entry, state):
+    add_event(session, 'setCommanderMissionAbandoned', entry['timestamp'], { 'missionGameID': entry['MissionID'] })
+
+@handler('MissionCompleted')
+def mission_completed(session, system, station, entry, state):
+    for x in entry.get('PermitsAwarded', []):
+        add_event(session, 'addCommanderPermit', entry['timestamp'], { 'starsystemName': x })
+
+    data = { 'missionGameID': entry['MissionID'] }
+    if 'Donation' in entry:
+        data['donationCredits'] = entry['Donation']
+    if 'Reward' in entry:
+        data['rewardCredits'] = entry['Reward']
+    if 'PermitsAwarded' in entry:
+        data['rewardPermits'] = [{ 'starsystemName': x } for x in entry['PermitsAwarded']]
+    if 'CommodityReward' in entry:
+        data['rewardCommodities'] = [{ 'itemName': x['Name'], 'itemCount': x['Count'] } for x in entry['CommodityReward']]
+    if 'MaterialsReward' in entry:
+        data['rewardMaterials'] = [{ 'itemName': x['Name'], 'itemCount': x['Count'] } for x in entry['MaterialsReward']]
+    factioneffects = []
+    for faction in entry.get('FactionEffects', []):
+        effect = { 'minorfactionName': faction['Faction'] }
+        for influence in faction.get('Influence', []):
+            if 'Influence' in influence:
+                effect['influenceGain'] = len(effect.get('influenceGain', '')) > len(influence['Influence']) and effect['influenceGain'] or influence['Influence']	# pick highest
+        if 'Reputation' in faction:
+            effect['reputationGain'] = faction['Reputation']
+        factioneffects.append(effect)
+    if factioneffects:
+        data['minorfactionEffects'] = factioneffects
+    add_event(session, 'setCommanderMissionCompleted', entry['timestamp'], data)
+
+@handler('MissionFailed')
+def mission_failed(session, system, station, entry, state):
+    add_event(session, 'setCommanderMissionFailed', entry['timestamp'], { 'missionGameID': entry['MissionID'] })
+
+# Combat
+@handler('Died')
+def died(session, system, station, entry, state):
+    data = { 'starsystemName': system }
+    if 'Killers' in entry:
+        data['wingOpponentNames'] = [x['Name'] for x in entry['Killers']]
+    elif 'KillerName' in entry:
+        data['opponentName'] = entry['KillerName']
+    add_event(session, 'addCommanderCombatDeath', entry['timestamp'], data)
+
+@handler('Interdicted')
+def interdicted(session, system, station, entry, state):
+    data = {'starsystemName': system,
+            'isPlayer': entry['IsPlayer'],
+            'isSubmit': entry['Submitted'],
+    }
+    if 'Interdictor' in entry:
+        data['opponentName'] = entry['Interdictor']
+    elif 'Faction' in entry:
+        data['opponentName'] = entry['Faction']
+    elif 'Power' in entry:
+        data['opponentName'] = entry['Power']
+    add_event(session, 'addCommanderCombatInterdicted', entry['timestamp'], data)
+
+@handler('Interdiction')
+def interdiction(session, system, station, entry, state):
+    data = {'starsystemName': system,
+            'isPlayer': entry['IsPlayer'],
+            'isSuccess': entry['Success'],
+    }
+    if 'Interdicted' in entry:
+        data['opponentName'] = entry['Interdicted']
+    elif 'Faction' in entry:
+        data['opponentName'] = entry['Faction']
+    elif 'Power' in entry:
+        data['opponentName'] = entry['Power']
+    add_event(session, 'addCommanderCombatInterdiction', entry['timestamp'], data)
+
+@handler('EscapeInterdiction')
+def escape_interdiction(session, system, station, entry, state):
+    add_event(session, 'addCommanderCombatInterdictionEscape', entry['timestamp'],
+                {'starsystemName': system,
+                 'opponentName': entry['Interdictor'],
+                 'isPlayer': entry['IsPlayer'],
+                })
+
+@handler('PVPKill')
+def pvp_kill(session, system, station, entry, state):
+    add_event(session, 'addCommanderCombatKill', entry['timestamp'],
+                {'starsystemName': system,
+                 'opponentName': entry['Victim'],
+                })
+
+@handler('RedeemVoucher')
+def redeem_voucher(session, system, station, entry, state):
+    add_event(session, 'addCommanderFactionKillBond', entry['timestamp'],
+                {'starsystemName': system,
+                 'type': entry.get('Type'),
+                 'faction': entry.get('Faction'),
+                 'amount': entry.get('Amount'),
+                })
+
+@handler('ShipTargeted')
+def ship_targeted(session, system, station, entry, state):
+    if entry.get('ScanStage') == 3:
+        add_event(session, 'addCommanderShipScan', entry['timestamp'],
+                    {'starsystemName': system,
+                     'nameRaw': entry.get('PilotName'),
+                     'name': entry.get('PilotName_Localised'),
+                     'rank': entry.get('PilotRank'),
+                     'shipRaw': entry.get('Ship'),
+                     'ship': entry.get('Ship_Localised'),
+                     'power': entry.get('Power'),
+                     'status': entry.get('LegalStatus'),
+                     'squadronId': entry.get('SquadronID'),
+                     'bounty': entry.get('Bounty'),
+                    })
+
+@handler('CarrierJumpRequest')
+def carrier_jump_request(session, system, station, entry, state):
+    add_event(session, 'addCarrierJumpRequest', entry['timestamp'],
+                {'starsystemName': system,
+                 'carrierId': entry.get('CarrierID'),
+                 'system': entry.get('SystemName'),
+                 'body': entry.get('Body'),
+                })
+
+@handler('CarrierStats')
+def carrier_stats(session, system, station, entry, state):
+    add_event(session, 'addCarrierStats', entry['timestamp'],
+                {'starsystemName': system,
+                 'carrierId': entry.get('CarrierID'),
+                 'callsign': entry.get('Callsign'),
+                 'name': entry.get('Name'),
+                 'dockingAccess': entry.get('DockingAccess'),
+                 'fuelLevel': entry.get('FuelLevel'),
+                 'jumpRangeCurr': entry.get('JumpRangeCurr'),
+                 'jumpRangeMax': entry.get('JumpRangeMax'),
+                 'freeSpaceCurr': entry.get('SpaceUsage').get('FreeSpace'),
+                 'freeSpaceMax': entry.get('SpaceUsage').get('TotalCapacity'),
+                 'bankBalance': entry.get('Finance').get('CarrierBalance'),
+                })
+
+@handler('MarketBuy')
+def market_buy(session, system, station, entry, state):
+    add_event(session, 'addMarketBuy', entry['timestamp'],
+                {'starsystemName': system,
+                 'type': entry.get('Type'),
+                 'count': entry.get('Count'),
+                 'price': entry.get('BuyPrice'),
+                 'total': entry.get('TotalCost'),
+                })
+
+@handler('MarketSell')
+def market_sell(session, system, station, entry, state):
+    add_event(session, 'addMarketSell', entry['timestamp'],
+                {'starsystemName': system,
+                 'type': entry.get('Type'),
+                 'count': entry.get('Count'),
+                 'price': entry.get('SellPrice'),
+                 'total': entry.get('TotalSale'),
+                 'average': entry.get('AvgPricePaid'),
+                 'illegal': entry.get('IllegalGoods'),
+                 'stolen': entry.get('StolenGoods'),
+                 'blackmarket': entry.get('BlackMarket'),
+                })
+
+# Send cargo, materials and anything unsent on the way out
+@handler('ShutDown')
+def shutdown(session, system, station, entry, state):
+    send(session, entry, state)
+
+
+#
+# Events that don't need to be sent immediately but will be sent on the next mandatory event
+#
+
+# Send credits and stats to Inara on startup only - otherwise may be out of date
+@handler('LoadGame', phase=DEFER)
+def starting_credits(session, system, station, entry, state):
+    add_event(session, 'setCommanderCredits', entry['timestamp'],
+                {
+                    'commanderCredits': state['Credits'],
+                    'commanderLoan': state['Loan'],
+                })
+    session.lastcredits = state['Credits']
+
+@handler('Statistics', phase=DEFER, state=('Statistics',))
+def statistics(session, system, station, entry, state):
+    add_event(session, 'setCommanderGameStatistics', entry['timestamp'], state['Statistics'])	# may be out of date
+
+# Selling / swapping ships
+@handler('ShipyardNew', phase=DEFER)
+def shipyard_new(session, system, station, entry, state):
+    add_event(session, 'addCommanderShip', entry['timestamp'],
+                {
+                    'shipType': entry['ShipType'],
+                    'shipGameID': entry['NewShipID'],
+                })
+    session.shipswap = True	# Want subsequent Loadout event to be sent immediately
+
+@handler('ShipyardBuy', 'ShipyardSell', 'SellShipOnRebuy', 'ShipyardSwap', phase=DEFER)
+def shipyard(session, system, station, entry, state):
+    if entry['event'] == 'ShipyardSwap':
+        session.shipswap = True	# Don't know new ship name and ident 'til the following Loadout event
+    if 'StoreShipID' in entry:
+        add_event(session, 'setCommanderShip', entry['timestamp'],
+                    {
+                        'shipType': entry['StoreOldShip'],
+                        'shipGameID': entry['StoreShipID'],
+                        'starsystemName': system,
+                        'stationName': station,
+                    })
+    elif 'SellShipID' in entry:
+        add_event(session, 'delCommanderShip', entry['timestamp'],
+                    {
+                        'shipType': entry.get('SellOldShip', entry['ShipType']),
+                        'shipGameID': entry['SellShipID'],
+                    })
+
+@handler('SetUserShipName', phase=DEFER)
+def set_user_ship_name(session, system, station, entry, state):
+    add_event(session, 'setCommanderShip', entry['timestamp'],
+                {
+                    'shipType': state['ShipType'],
+                    'shipGameID': state['ShipID'],
+                    'shipName': state['ShipName'],	# Can be None
+                    'shipIdent': state['ShipIdent'],	# Can be None
+                    'isCurrentShip': True,
+                })
+
+@handler('ShipyardTransfer', phase=DEFER)
+def shipyard_transfer(session, system, station, entry, state):
+    add_event(session, 'setCommanderShipTransfer', entry['timestamp'],
+                {
+                    'shipType': entry['ShipType'],
+                    'shipGameID': entry['ShipID'],
+                    'starsystemName': system,
+                    'stationName': station,
+                    'transferTime': entry['TransferTime'],
+                })
+
+# Fleet
+@handler('StoredShips', phase=DEFER)
+def stored_ships(session, system, station, entry, state):
+    fleet = sorted(
+        [{
+            'shipType': x['ShipType'],
+            'shipGameID': x['ShipID'],
+            'shipName': x.get('Name'),
+            'isHot': x['Hot'],
+            'starsystemName': entry['StarSystem'],
+            'stationName': entry['StationName'],
+            'marketID': entry['MarketID'],
+        } for x in entry['ShipsHere']] +
+        [{
+            'shipType': x['ShipType'],
+            'shipGameID': x['ShipID'],
+            'shipName': x.get('Name'),
+            'isHot': x['Hot'],
+            'starsystemName': x.get('StarSystem'),	# Not present for ships in transit
+            'marketID': x.get('ShipMarketID'),		#   "
+        } for x in entry['ShipsRemote']],
+        key = itemgetter('shipGameID')
+    )
+    if session.fleet != fleet:
+        session.fleet = fleet
+        session.events.supersede('setCommanderShip')	# Remove any unsent
+        for ship in session.fleet:
+            add_event(session, 'setCommanderShip', entry['timestamp'], ship, if_changed=this.deltas.enabled)	# Only changed ships if SFR takes deltas
+
+# Loadout
+@handler('Loadout', phase=DEFER, state=('Modules',))
+def loadout_changed(session, system, station, entry, state):
+    if not session.newsession:
+        (loadout, changed) = session.loadouts.get(state['ShipID'], state, make_loadout)
+        if changed:
+            session.loadout = loadout
+            add_event(session, 'setCommanderShipLoadout', entry['timestamp'], session.loadout, state['ShipID'])	# Replaces any unsent for this ship
+
+# Stored modules
+@handler('StoredModules', phase=DEFER)
+def stored_modules(session, system, station, entry, state):
+    items = {x['StorageSlot']: x for x in entry['Items']}
+    modules = []
+    for slot in sorted(items):
+        item = items[slot]
+        module = {
+            'itemName': item['Name'],
+            'itemValue': item['BuyPrice'],
+            'isHot': item['Hot'],
+        }
+
+        # Location can be absent if in transit
+        if 'StarSystem' in item:
+            module['starsystemName'] = item['StarSystem']
+        if 'MarketID' in item:
+            module['marketID'] = item['MarketID']
+
+        if 'EngineerModifications' in item:
+            module['engineering'] = {'blueprintName': item['EngineerModifications']}
+            if 'Level' in item:
+                module['engineering']['blueprintLevel'] = item['Level']
+            if 'Quality' in item:
+                module['engineering']['blueprintQuality'] = item['Quality']
+
+        modules.append(module)
+
+    if session.storedmodules != modules:
+        # Only send on change
+        session.storedmodules = modules
+        session.events.supersede('setCommanderStorageModules')	# Remove any unsent
+        session.events.supersede('updateCommanderStorageModules')
+        add_event(session, 'setCommanderStorageModules', entry['timestamp'], session.storedmodules)
+
+# Community Goals
+@handler('CommunityGoal', phase=DEFER)
+def community_goal(session, system, station, entry, state):
+    session.events.supersede('setCommunityGoal')	# Remove any unsent
+    session.events.supersede('setCommanderCommunityGoalProgress')
+    for goal in entry['CurrentGoals']:
+
+        data = {
+            'communitygoalGameID': goal['CGID'],
+            'communitygoalName': goal['Title'],
+            'starsystemName': goal['SystemName'],
+            'stationName': goal['MarketName'],
+            'goalExpiry': goal['Expiry'],
+            'isCompleted': goal['IsComplete'],
+            'contributorsNum': goal['NumContributors'],
+            'contributionsTotal': goal['CurrentTotal'],
+        }
+        if 'TierReached' in goal:
+            data['tierReached'] = int(goal['TierReached'].split()[-1])
+        if 'TopRankSize' in goal:
+            data['topRankSize'] = goal['TopRankSize']
+        if 'TopTier' in goal:
+            data['tierMax'] = int(goal['TopTier']['Name'].split()[-1])
+            data['completionBonus'] = goal['TopTier']['Bonus']
+        add_event(session, 'setCommunityGoal', entry['timestamp'], data)
+
+        data = {
+            'communitygoalGameID': goal['CGID'],
+            'contribution': goal['PlayerContribution'],
+            'percentileBand': goal['PlayerPercentileBand'],
+        }
+        if 'Bonus' in goal:
+            data['percentileBandReward'] = goal['Bonus']
+        if 'PlayerInTopRank' in goal:
+            data['isTopRank'] = goal['PlayerInTopRank']
+        add_event(session, 'setCommanderCommunityGoalProgress', entry['timestamp'], data)
+
+# Friends
+@handler('Friends', phase=DEFER)
+def friends(session, system, station, entry, state):
+    if entry['Status'] in ['Added', 'Online']:
+        add_event(session, 'addCommanderFriend', entry['timestamp'],
+                    {'commanderName': entry['Name'],
+                     'gamePlatform': 'pc',
+                    })
+    elif entry['Status'] in ['Declined', 'Lost']:
+        add_event(session, 'delCommanderFriend', entry['timestamp'],
+                    {'commanderName': entry['Name'],
+                     'gamePlatform': 'pc',
+                    })
+
+# Worker thread
+def worker():
+    from sfr.batch import PRIORITY, Batcher
+    from sfr.pool import MAX_QUEUED, MAX_QUEUED_BYTES, OVERFLOW_TARGET, Done, UploadPool
+    connection()	# Import requests on this thread rather than whichever first uploads
+    batcher = Batcher()
+    retries = RetryQueue()	# Batches waiting to be retried
+    pool = UploadPool(lambda batch: post(API_URL, payload(batch), batch.events, FID=batch.key[1]), this.queue.put, priority=PRIORITY, merge=batcher.merge)
+    this.metrics.track('backlog_events', lambda: pool.queued)
+    this.metrics.track('backlog_bytes', lambda: pool.queued_bytes)
+
+    # Resend anything left over from previous sessions first. It's read from the spool a group at a time
+    # while the pool has room, so a big spool waits on disk rather than being dropped by overflow(). New
+    # events wait behind it, so each lane stays in order.
+    replay = this.spool and this.spool.replay()
+    later = []	# ([((cmdr, FID), events)], spool span) handed over while replaying
+
+    while True:
+        # Retries that are due go back to the front of their lanes, ahead of fresh batches
+        for batch in retries.pop():
+            pool.resubmit(batch)
+        while replay and pool.queued < MAX_QUEUED * OVERFLOW_TARGET and pool.queued_bytes < MAX_QUEUED_BYTES * OVERFLOW_TARGET:
+            group = next(replay, None)
+            if group:
+                batcher.add(*group)
+            else:
+                replay = None
+                for (handed, span) in later:
+                    for (key, events) in handed:
+                        batcher.add(key, events, span)
+                later = []
+            for batch in batcher.pop():
+                pool.submit(batch)
+        for batch in batcher.pop():
+            pool.submit(batch)
+        if pool.queued > MAX_QUEUED or pool.queued_bytes > MAX_QUEUED_BYTES:
+            overflow(pool)
+        if pool.pending() and connected(pool):
+            pool.dispatch()
+
+        this.metrics.set('retry_queue', len(retries))
+
+        # Wait for more events or uploads to finish, or until the open batch, a retry or a probe is due
+        timeouts = [t for t in (batcher.timeout(), retries.timeout(), pool.timeout(), this.breaker.timeout() if pool.pending() else None) if t is not None]
+        try:
+            item = this.queue.get(timeout=min(timeouts) if timeouts else None)
+        except Empty:
+            batcher.expire()	# Linger time is up for an open batch
+        else:
+            if item is None:
+                if replay:
+                    replay.close()	# The rest, and everything handed over since, stays in the spool for next time
+                    this.unsent += sum(len(events) for (handed, span) in later for (key, events) in handed)
+                drain(batcher, retries, pool)
+                pool.stop()
+                return
+            elif isinstance(item, Done):
+                pool.finished(item.batch)
+                sent(item, pool, retries)
+            elif replay:
+                later.append(item)
+            else:
+                (handed, span) = item
+                for (key, events) in handed:
+                    batcher.add(key, events, span)
+
+# Too much is waiting to be uploaded, e.g. after a weekend without SFR. Merge snapshots, then drop
+# expendable events, and as a last resort leave the oldest uploads in the spool for next time.
+# Goes down to OVERFLOW_TARGET of the limits, so it isn't back here with the next event.
+def overflow(pool):
+    from sfr.batch import expend, supersede
+    from sfr.pool import MAX_QUEUED, MAX_QUEUED_BYTES, OVERFLOW_TARGET
+    (events, size) = (int(MAX_QUEUED * OVERFLOW_TARGET), int(MAX_QUEUED_BYTES * OVERFLOW_TARGET))
+    backlog = pool.backlog()
+    this.metrics.count('backlog_merged', supersede(backlog))
+    for batch in pool.prune():
+        finished(batch, True)	# Everything in it was merged into later events
+    if pool.queued > events or pool.queued_bytes > size:
+        this.metrics.count('backlog_dropped', expend(backlog, pool.queued - events, pool.queued_bytes - size)[0])
+        for batch in pool.prune():
+            finished(batch, True)
+    for batch in backlog:
+        if pool.queued <= events and pool.queued_bytes <= size:
+            break
+        if batch.events:	# Or it was pruned above
+            pool.evict(batch)
+            this.metrics.count('failures')
+            finished(batch, False)
+
+# Closing: wait for uploads still in flight to come back, for up to half the time to this.deadline,
+# then make one last try to send everything that's left - uploads waiting to be posted or retried,
+# events not yet batched, and any upload that still hasn't come back (if that does get through, SFR
+# sees its events twice). They go as one upload for each commander, with snapshots merged into the
+# latest. Whatever doesn't get through stays in the spool.
+def drain(batcher, retries, pool):
+    from sfr.batch import Batch, supersede
+    from sfr.pool import Done
+    wait = this.deadline - DRAIN / 2
+    while pool.in_flight and time.monotonic() < wait:
+        try:
+            item = this.queue.get(timeout=max(0, wait - time.monotonic()))
+        except Empty:
+            break
+        if isinstance(item, Done):
+            pool.finished(item.batch)
+            sent(item, pool, retries)
+    batcher.flush()
+    left = pool.abandon() + list(retries.pop(everything=True)) + list(pool.waiting()) + list(batcher.pop())
+    finals = {}	# (cmdr, FID) -> Batch
+    spans = {}	# id(span) -> the span, for those already in a final batch
+    for batch in sorted(left, key=attrgetter('opened')):	# Stable, so each lane stays in order
+        final = finals.get(batch.key)
+        if not final:
+            final = finals[batch.key] = Batch(batch.key, None, batch.opened)
+        final.events.extend(batch.events)
+        for span in batch.spans:
+            if id(span) in spans:
+                span.parts -= 1	# One upload now
+            else:
+                spans[id(span)] = span
+                final.spans.append(span)
+    for final in finals.values():
+        this.metrics.count('backlog_merged', supersede([final]))
+        final.size = sum(event.size() for event in final.events)
+        this.unsent += len(final.events)
+
+    for final in finals.values():
+        remaining = this.deadline - time.monotonic()
+        ok = False
+        if remaining > 0:
+            try:
+                ok = post(API_URL, payload(final), final.events, timeout=remaining, FID=final.key[1])
+            except:
+                print_exc()
+        if ok:
+            this.unsent -= len(final.events)
+        else:
+            this.metrics.count('failures')
+        finished(final, ok)
+
+# True if uploads can go ahead, probing SFR first if the circuit breaker is ready to try again
+def connected(pool):
+    if not this.breaker.allow() and this.breaker.state == HALF_OPEN and not pool.in_flight and this.deadline is None:	# No probing once stopping
+        try:
+            post(API_URL, codec.payload({'version': '2.0.0'}, []))	# Any reply will do
+            this.breaker.success()
+        except:
+            print_exc()
+            this.breaker.failure()
+        show_status()
+    return this.breaker.state == CLOSED
+
+# An upload thread has finished posting a batch. One that SFR refused because of what was in it would
+# be refused again, so it's split until the events SFR won't take are on their own, and those are dropped.
+def sent(done, pool, retries):
+    from sfr.batch import split
+    batch = done.batch
+    if done.error is None:
+        this.breaker.success()
+        ok = done.ok
+        if not ok:
+            batch.attempts += 1	# So the halves aren't merged back together
+            halves = split(batch, 0)
+            if len(halves) > 1:
+                this.metrics.count('splits')
+                pool.hold(halves[1])
+                retries.push(halves[0], 0)
+                show_status()
+                return
+            this.metrics.count('refused', len(batch.events))
+            ok = True	# Done with, so it isn't replayed on every start
+    else:
+        this.breaker.failure()
+        batch.attempts += 1
+        if batch.attempts < ATTEMPTS:
+            halves = oversized(done.error) and split(batch) or [batch]
+            if len(halves) > 1:
+                this.metrics.count('splits')
+                pool.hold(halves[1])
+            retries.push(halves[0], backoff(batch.attempts))	# Lane stays held until it's resubmitted
+            this.metrics.count('retries')
+            show_status()
+            return
+        this.metrics.count('failures')
+        show_error(_("Error: Can't connect to SFR"))
+        ok = False
+    pool.release(batch)
+    show_status()
+    finished(batch, ok)
+
+# True for failures that a smaller upload might get past - too big for SFR, or too slow to send. Not
+# for failing to connect at all, which has nothing to do with size.
+def oversized(error):
+    import requests	# Already imported by connection()
+    response = getattr(error, 'response', None)
+    return isinstance(error, requests.ReadTimeout) or response is not None and response.status_code == 413
+
+def finished(batch, ok):
+    if this.spool:
+        for span in batch.spans:
+            this.spool.done(span, ok)
+
+# Encoded upload for a batch. Made once, however many times the batch is retried.
+def payload(batch):
+    from sfr.delta import VERSION
+    if batch.body is None:
+        (cmdr, FID) = batch.key
+        batch.body = codec.payload({
+            'commanderName': cmdr,
+            'commanderFrontierID': FID,
+            'version': DELTAS and VERSION or '2.0.0',	# Asking for deltas
+        }, batch.events)
+    return batch.body
+
+# Post an encoded upload and block until it's sent, retrying after a pause if need be.
+# Returns True once SFR has replied, whether or not it accepted the events.
+def upload(url, body, events=(), attempts=3):
+    for attempt in range(1, attempts + 1):
+        try:
+            return post(url, body, events)
+        except:
+            print_exc()
+            if attempt < attempts:
+                time.sleep(backoff(attempt))
+    show_error(_("Error: Can't connect to SFR"))
+    return False
+
+# Post an encoded upload once, with the Events it holds for the commander with FID. Returns True once
+# SFR has replied, or False if it refused what was in the upload (REFUSED) - that would be refused again.
+# Raises if SFR couldn't be reached, had a server error or refused the request itself, e.g. for an
+# expired API key - those are worth retrying, and the events stay in the spool until they get through.
+def post(url, body, events=(), timeout=(CONNECT_TIMEOUT, _TIMEOUT), FID=None):
+    from sfr import compress, delta
+    (data, headers) = compress.compress(body, COMPRESSION)
+    this.metrics.count('uploads')
+    this.metrics.count('upload_bytes', len(data))
+    this.metrics.count('upload_json_bytes', len(body))
+    start = time.perf_counter()
+    try:
+        r = connection().post(url, headers=headers and dict(API_HEADERS, **headers) or API_HEADERS, data=data, timeout=timeout)
+        this.metrics.observe('upload_seconds', time.perf_counter() - start)
+        if 400 <= r.status_code < 500 and r.status_code not in (408, 413, 429):	# Timeout, too big (retried in halves), or too many
+            print(('SFR\t%s %s' % (r.status_code, r.reason)))
+            show_error(_('Error: SFR {MSG}').format(MSG = r.reason))
+            if r.status_code in REFUSED:
+                return False
+        r.raise_for_status()
+    except:
+        this.metrics.count('upload_errors')
+        raise
+    reply = r.json()
+    status = reply['header']['eventStatus']
+    if status // 100 != 2:	# 2xx == OK (maybe with warnings)
+        # Log fatal errors
+        print(('SFR\t%s %s' % (reply['header']['eventStatus'], reply['header'].get('eventStatusText', ''))))
+        print(body.decode('utf-8'))
+        show_error(_('Error: SFR {MSG}').format(MSG = reply['header'].get('eventStatusText', status)))
+    else:
+        if DELTAS and events:	# A reply to an upload, which asked for deltas - not to a probe, which doesn't
+            this.deltas.enabled = reply['header'].get('version') == delta.VERSION
+        # Log individual errors and warnings
+        for data_event, reply_event in zip(events, reply['events']):
+            if reply_event['eventStatus'] == 200:
+                this.acknowledged.acknowledge(FID, this.deltas.acknowledge(FID, data_event))
+            elif data_event.name in delta.UPDATES:
+                this.deltas.reject(FID, data_event)	# Sent in full with the next journal entry
+            else:
+                print(('SFR\t%s %s\t%r' % (reply_event['eventStatus'], reply_event.get('eventStatusText', ''), data_event)))
+                if reply_event['eventStatus'] // 100 != 2:
+                    show_error(_('Error: SFR {MSG}').format(MSG = '%s, %s' % (data_event.name, reply_event.get('eventStatusText', reply_event['eventStatus']))))
+            if this.on_reply and (data_event.name in LOCATION_EVENTS or data_event.name in SHIP_EVENTS):
+                this.on_reply(data_event.name, reply_event.get('eventData', {}))
+    return True
+
+def show_error(msg):
+    this.on_error(msg)
+
+def show_status():
+    if this.on_status:
+        this.on_status(this.breaker.state)
+
+def make_loadout(state):
+    modules = []
+    for m in list(state['Modules'].values()):
+        module = {
+            'slotName': m['Slot'],
+            'itemName': m['Item'],
+            'itemHealth': m['Health'],
+            'isOn': m['On'],
+            'itemPriority': m['Priority'],
+        }
+        if 'AmmoInClip' in m:
+            module['itemAmmoClip'] = m['AmmoInClip']
+        if 'AmmoInHopper' in m:
+            module['itemAmmoHopper'] = m['AmmoInHopper']
+        if 'Value' in m:
+            module['itemValue'] = m['Value']
+        if 'Hot' in m:
+            module['isHot'] = m['Hot']
+        if 'Engineering' in m:
+            engineering = {
+                'blueprintName': m['Engineering']['BlueprintName'],
+                'blueprintLevel': m['Engineering']['Level'],
+                'blueprintQuality': m['Engineering']['Quality'],
+            }
+            if 'ExperimentalEffect' in m['Engineering']:
+                engineering['experimentalEffect'] = m['Engineering']['ExperimentalEffect']
+            engineering['modifiers'] = []
+            for mod in m['Engineering']['Modifiers']:
+                modifier = {
+                    'name': mod['Label'],
+                }
+                if 'OriginalValue' in mod:
+                    modifier['value'] = mod['Value']
+                    modifier['originalValue'] = mod['OriginalValue']
+                    modifier['lessIsGood'] = mod['LessIsGood']
+                else:
+                    modifier['value'] = mod['ValueStr']
+                engineering['modifiers'].append(modifier)
+            module['engineering'] = engineering
+
+        modules.append(module)
+
+    return {
+        'shipType': state['ShipType'],
+        'shipGameID': state['ShipID'],
+        'shipLoadout': modules,
+    }
+
+# Events are encoded as they're added. Events added with a key replace any unsent event with the same name and key.
+# Events over their limits in sfr.limit are dropped, as are those added if_changed that SFR already has - see sfr.startup.
+# Loadouts and stored modules may go as changes - see sfr.delta.
+def add_event(session, name, timestamp, data, key=None, if_changed=False):
+    reason = session.limiter.check(name, timestamp, data)
+    if reason:
+        this.metrics.suppressed[(name, reason)] += 1
+        return
+
+    event = codec.Event.make(name, timestamp, data)
+    if if_changed and this.acknowledged.unchanged(session.FID, event):
+        this.metrics.suppressed[(name, UNCHANGED)] += 1
+        return
+    this.acknowledged.added(session.FID, event)
+    event = this.deltas.make(session.FID, event, data, key)	# Or the changes since the version SFR has, for a loadout or stored modules
+    append(session, event, key)
+
+def append(session, event, key=None):
+    session.events.append(event, key)
+    this.metrics.added[event.name] += 1
+    if this.spool:
+        this.spool.append(session.key, event)	# fsync'd by the spool's group commit
+
+# Hand every commander's unsent events to the worker thread, which batches them up for SFR. They go
+# together, as the spool span covers them all.
+def call():
+    handed = [(session.key, session.events.take()) for session in list(this.sessions.values()) if session.events]
+    if not handed:
+        return
+
+    this.queue.put((handed, this.spool and this.spool.span()))
+
+# requests is slow to import, so it waits until there's something to send
+def connection():
+    if this.session is None:
+        import requests
+        from sfr.pool import WORKERS
+        session = requests.Session()
+        session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=WORKERS))	# One connection per upload thread
+        this.session = session
+    return this.session
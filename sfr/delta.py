@@ -0,0 +1,190 @@
+# Deltas for the big snapshots - a ship's loadout and stored modules - that a
+# single outfitting change otherwise resends in full, every engineering
+# modifier included.
+#
+# Off unless DELTAS is set in sfr.core, as SFR has to support them. The header
+# of each upload then says version VERSION, and deltas are only sent once SFR's
+# reply has said VERSION back. Each snapshot is split into items (modules, by
+# slot for a loadout and by content for stored modules), and an update event
+# carries the items changed, by key, and the keys of those removed since the
+# version SFR last acknowledged:
+#
+#   updateCommanderShipLoadout	- shipType, shipGameID, base, fingerprint, changed, removed
+#   updateCommanderStorageModules	- base, fingerprint, changed, removed
+#
+# base is the fingerprint of the version it's a change to and fingerprint that
+# of the result, so SFR can tell if it has something else - then it answers the
+# update with RESYNC, and the plugin sends the latest in full. So does any
+# snapshot that SFR hasn't acknowledged a version of, or that has changed by
+# half or more. So does a snapshot that changes again while a version sent
+# since is waiting to be acknowledged, as by the time the update gets there SFR
+# may have either - one delta at a time, each from the version SFR has.
+# apply() is what SFR does with an update.
+#
+# The fleet has no delta of its own: StoredShips sends each ship as an event of
+# its own, and with deltas on only those that have changed since SFR last
+# acknowledged them are sent - see sfr.startup.
+
+from collections import OrderedDict
+import hashlib
+import json
+from threading import Lock
+
+from sfr import codec
+
+VERSION = '2.1.0'	# Header version of uploads that may have deltas in
+RESYNC = 409		# eventStatus for an update to a version SFR doesn't have
+PENDING = 16		# Versions of a snapshot kept waiting to be acknowledged - sfr.backfill never acknowledges any
+
+
+def slot(item):
+    return item['slotName']
+
+
+def content(item):
+    return fingerprint(item)
+
+
+class Kind(object):
+
+    __slots__ = ('update', 'field', 'key', 'ids')
+
+    def __init__(self, update, field, key, ids):
+        self.update = update	# eventName of deltas
+        self.field = field	# eventData field holding the items, or None if eventData is the list of them
+        self.key = key		# item -> key
+        self.ids = ids		# eventData fields telling apart the snapshots, copied into deltas
+
+
+KINDS = {
+    'setCommanderShipLoadout': Kind('updateCommanderShipLoadout', 'shipLoadout', slot, ('shipType', 'shipGameID')),
+    'setCommanderStorageModules': Kind('updateCommanderStorageModules', None, content, ()),
+}
+UPDATES = {kind.update: name for (name, kind) in KINDS.items()}	# Delta eventName -> snapshot eventName
+
+
+def fingerprint(value):
+    # The same for the same items in either order - json's sort_keys rather than codec, as SFR has to agree
+    return hashlib.blake2b(json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def items(kind, data):
+    # key -> item. Identical stored modules are told apart by number
+    found = OrderedDict()
+    for item in (data[kind.field] if kind.field else data):
+        key = base = kind.key(item)
+        n = 1
+        while key in found:
+            n += 1
+            key = '%s#%d' % (base, n)
+        found[key] = item
+    return found
+
+
+def ident(kind, data):
+    return json.dumps([data[field] for field in kind.ids])
+
+
+def apply(kind, base, update):
+    # SFR's side: the items after update, or None if base isn't the version it's a change to
+    if fingerprint(base) != update['base']:
+        return None
+    result = OrderedDict((key, item) for (key, item) in base.items() if key not in update['removed'])
+    result.update(update['changed'])
+    return fingerprint(result) == update['fingerprint'] and result or None
+
+
+class Snapshot(object):
+
+    __slots__ = ('base', 'pending', 'latest', 'rejected')
+
+    def __init__(self):
+        self.base = None	# (fingerprint, items) SFR acknowledged last
+        self.pending = OrderedDict()	# fingerprint -> (items, full Event) for up to PENDING versions sent since, oldest first
+        self.latest = None	# (full Event, key it was added with)
+        self.rejected = False	# SFR couldn't apply an update - send latest in full
+
+
+class Deltas(object):
+
+    def __init__(self):
+        self.lock = Lock()	# Snapshots are added on the translation thread and acknowledged on the upload threads
+        self.enabled = False	# SFR has said it takes deltas
+        self.snapshots = {}	# (FID, eventName, ident) -> Snapshot
+
+    def clear(self):
+        with self.lock:
+            self.enabled = False
+            self.snapshots = {}
+
+    def make(self, FID, event, data, key=None):
+        # The event to send - event itself, or for a snapshot a delta from the version SFR has
+        kind = KINDS.get(event.name)
+        if not kind or not FID:
+            return event
+        found = items(kind, data)
+        digest = fingerprint(found)
+        with self.lock:
+            snapshot = self.snapshots.get((FID, event.name, ident(kind, data)))
+            if not snapshot:
+                snapshot = self.snapshots[(FID, event.name, ident(kind, data))] = Snapshot()
+            waiting = bool(snapshot.pending)	# A version SFR may or may not have by the time this gets there
+            snapshot.pending[digest] = (found, event)
+            snapshot.pending.move_to_end(digest)
+            if len(snapshot.pending) > PENDING:
+                snapshot.pending.popitem(last=False)	# Its acknowledgement will only be treated as from a previous session
+            snapshot.latest = (event, key)
+            snapshot.rejected = False
+            if not self.enabled or not snapshot.base or waiting:
+                return event
+            (base, known) = snapshot.base
+        changed = {k: item for (k, item) in found.items() if known.get(k) != item}
+        removed = [k for k in known if k not in found]
+        if 2 * (len(changed) + len(removed)) >= len(found):
+            return event	# Hardly smaller
+        delta = {field: data[field] for field in kind.ids}
+        delta.update({
+            'base': base,
+            'fingerprint': digest,
+            'changed': changed,
+            'removed': removed,
+        })
+        return codec.Event.make(kind.update, event.timestamp, delta)
+
+    def acknowledge(self, FID, event):
+        # SFR has accepted event. Returns the snapshot it brought SFR up to, or event if it isn't one
+        name = UPDATES.get(event.name, event.name)
+        kind = KINDS.get(name)
+        if not FID or not kind:
+            return event
+        data = json.loads(event.data)
+        digest = event.name in UPDATES and data['fingerprint'] or fingerprint(items(kind, data))
+        with self.lock:
+            snapshot = self.snapshots.get((FID, name, ident(kind, data)))
+            if not snapshot or digest not in snapshot.pending:
+                return event	# From a previous session
+            while True:	# Anything sent before it won't be acknowledged now
+                (older, (found, full)) = snapshot.pending.popitem(last=False)
+                if older == digest:
+                    break
+            snapshot.base = (digest, found)
+        return full
+
+    def reject(self, FID, event):
+        # SFR couldn't apply an update
+        name = UPDATES[event.name]
+        with self.lock:
+            snapshot = self.snapshots.get((FID, name, ident(KINDS[name], json.loads(event.data))))
+            if snapshot:
+                snapshot.base = None
+                snapshot.rejected = True
+
+    def rejected(self, FID):
+        # (full Event, key) for the latest of each of FID's snapshots that SFR couldn't apply an update to
+        resend = []
+        with self.lock:
+            for (key, snapshot) in self.snapshots.items():
+                if key[0] == FID and snapshot.rejected:
+                    snapshot.rejected = False
+                    resend.append(snapshot.latest)
+        return resend
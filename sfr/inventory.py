@@ -0,0 +1,32 @@
+# Cargo and materials payloads, rebuilt only when the counts behind them change.
+#
+# EDMC updates its state dicts in place and doesn't say when, so each Inventory
+# keeps a shallow copy of the counts it last built a payload from. Comparing
+# that against the live dict is a single C-level dict comparison with no
+# allocation; the sorted payload is only rebuilt when it differs.
+
+
+class Inventory(object):
+
+    def __init__(self, *categories):
+        self.categories = categories	# Keys of EDMC's state, in payload order
+        self.reset()
+
+    def reset(self):
+        self.counts = None	# Copy of state[category] for each category, as last sent
+        self.payload = None
+        self.version = 0	# Bumped whenever the payload changes
+
+    def update(self, state):
+        # Returns True if the payload has changed since the last call
+        if self.counts is not None:
+            for (category, counts) in zip(self.categories, self.counts):
+                if state[category] != counts:
+                    break
+            else:
+                return False
+
+        self.counts = [dict(state[category]) for category in self.categories]
+        self.payload = [ {'itemName': k, 'itemCount': counts[k]} for counts in self.counts for k in sorted(counts) ]
+        self.version += 1
+        return True
@@ -0,0 +1,98 @@
+# Limits on events that the game can produce far more often than is useful.
+#
+# ShipTargeted at ScanStage 3 makes an addCommanderShipScan every time a pilot
+# is rescanned - hundreds a minute in a conflict zone, mostly for the same few
+# pilots. Each limited event type has a key made from some of its eventData:
+# an event is dropped if one with the same key was let through less than `ttl`
+# seconds before, and a token bucket caps how many of that type get through at
+# all. Both go by the events' journal timestamps rather than the clock, so
+# sfr.backfill, replaying hours of play in seconds, treats them the same.
+#
+# Each event type's keys are kept in an LRU of at most SIZE, from which they
+# also expire after their ttl - one for each type, as a type's keys expire in
+# the order they were let through, but different types' don't. Dropping a
+# repeat loses nothing - the earlier event, with the same key, has been sent or
+# is waiting to be.
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+SIZE = 1000	# Keys remembered for each event type
+
+DUPLICATE = 'duplicate'	# Same key as an event let through within its ttl
+RATE = 'rate'		# Over the rate limit for its type
+
+
+class Limit(object):
+
+    __slots__ = ('fields', 'ttl', 'rate', 'burst')
+
+    def __init__(self, fields, ttl, rate, burst):
+        self.fields = fields	# eventData keys that make two events the same
+        self.ttl = ttl		# Seconds a key is remembered for
+        self.rate = rate	# Events per second let through in the long run...
+        self.burst = burst	# ...and at most this many at once
+
+
+LIMITS = {
+    # Rescans of the same pilot in the same ship, with the same bounty and legal status
+    'addCommanderShipScan': Limit(('nameRaw', 'shipRaw', 'bounty', 'status'), ttl=300, rate=0.5, burst=30),
+    # The carrier management screen opened again with nothing changed
+    'addCarrierStats': Limit(('carrierId', 'fuelLevel', 'freeSpaceCurr', 'bankBalance', 'dockingAccess', 'jumpRangeCurr'), ttl=3600, rate=1 / 60.0, burst=5),
+    # Dropping out of supercruise and going back in, in the same system and ship
+    'setCommanderTravelLocation': Limit(('starsystemName', 'stationName', 'shipGameID'), ttl=60, rate=0.1, burst=10),
+}
+
+
+class Limiter(object):
+
+    def __init__(self, limits=LIMITS, size=SIZE):
+        self.limits = limits
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        self.seen = {}		# eventName -> OrderedDict of key -> time it expires, least recently let through first
+        self.buckets = {}	# eventName -> (tokens, time)
+
+    def check(self, name, timestamp, data):
+        # None if an event can go, otherwise why not
+        limit = self.limits.get(name)
+        if limit is None:
+            return None
+
+        try:
+            now = seconds(timestamp)
+        except (TypeError, ValueError):
+            return None	# Nothing to go by
+        seen = self.seen.get(name)
+        if seen is None:
+            seen = self.seen[name] = OrderedDict()
+        while seen:	# Forget expired keys
+            (oldest, expires) = next(iter(seen.items()))
+            if expires > now:
+                break
+            del seen[oldest]
+
+        key = tuple([data.get(field) for field in limit.fields])
+        expires = seen.get(key)
+        if expires is not None and expires - limit.ttl <= now < expires:	# Not if the journal has gone back in time
+            return DUPLICATE
+
+        (tokens, then) = self.buckets.get(name, (limit.burst, now))
+        tokens = min(limit.burst, tokens + max(0, now - then) * limit.rate)
+        if tokens < 1:
+            self.buckets[name] = (tokens, now)
+            return RATE
+        self.buckets[name] = (tokens - 1, now)
+
+        seen[key] = now + limit.ttl
+        seen.move_to_end(key)
+        if len(seen) > self.size:
+            seen.popitem(last=False)
+        return None
+
+
+def seconds(timestamp):
+    # Journal timestamps are UTC, like 2023-01-01T10:10:10Z
+    return datetime.fromisoformat(timestamp[:19]).replace(tzinfo=timezone.utc).timestamp()
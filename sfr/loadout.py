@@ -0,0 +1,45 @@
+# Loadout payloads cached per ship, so that an unchanged ship is never rebuilt or compared.
+#
+# The game writes a Loadout event after outfitting, synthesis, rebuy and so on
+# whether or not anything changed. Each cached ship holds a fingerprint of the
+# state its payload was built from - a hash of state['Modules'] encoded by
+# sfr.codec, which is several times quicker than building the payload. Unlike
+# marshal, that takes the OrderedDicts EDMC parses the journal into. The same
+# modules in another order only cost a rebuild.
+
+from collections import OrderedDict
+import hashlib
+
+from sfr import codec
+
+SHIPS = 32	# Ships to keep - enough for most fleets
+
+
+def fingerprint(state):
+    return hashlib.blake2b(codec.dumps([state['ShipType'], state['Modules']]), digest_size=16).digest()
+
+
+class Loadouts(object):
+
+    def __init__(self, size=SHIPS):
+        self.size = size
+        self.ships = OrderedDict()	# ShipID -> (fingerprint, payload), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, state, build):
+        # Returns (payload, changed), where changed is False if payload is the one returned last time for this ship
+        digest = fingerprint(state)
+        cached = self.ships.get(key)
+        if cached and cached[0] == digest:
+            self.ships.move_to_end(key)
+            self.hits += 1
+            return (cached[1], False)
+
+        payload = build(state)
+        self.ships[key] = (digest, payload)
+        self.ships.move_to_end(key)
+        if len(self.ships) > self.size:
+            self.ships.popitem(last=False)
+        self.misses += 1
+        return (payload, True)
@@ -0,0 +1,210 @@
+# Counters, gauges and latency histograms for the plugin.
+#
+# EDMC's main thread, the translation thread, the worker and the upload threads
+# all record into one Metrics object. summary() is the text shown when hovering
+# over the status in EDMC's main window, and a background thread writes
+# everything to a file every INTERVAL seconds - Prometheus text format (for
+# node_exporter's textfile collector) if the name ends in .prom, otherwise JSON.
+
+from bisect import bisect_left
+from collections import Counter
+import json
+import os
+from threading import Event, Lock, Thread
+import time
+from traceback import print_exc
+
+INTERVAL = 30.0		# Seconds between writes of the metrics file
+PREFIX = 'sfr_'
+
+# Bucket upper bounds, in seconds
+ENTRY_BUCKETS = (0.000001, 0.000003, 0.00001, 0.00003, 0.0001, 0.0003, 0.001, 0.003, 0.01, 0.03, 0.1)
+UPLOAD_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+COUNTERS = {
+    'events_coalesced': 'Unsent events dropped because a later event replaced them',
+    'uploads': 'Uploads posted, including retries and probes',
+    'upload_bytes': 'Bytes posted, after any compression',
+    'upload_json_bytes': 'Bytes of JSON posted, before compression',
+    'upload_errors': "Uploads that didn't get a reply, or got a server error",
+    'retries': 'Uploads scheduled to be retried',
+    'splits': 'Failed uploads split in two to be retried',
+    'failures': 'Uploads given up on for this session - still in the spool',
+    'refused': 'Events SFR refused outright, dropped rather than retried',
+    'backlog_merged': 'Waiting snapshots merged into a later one because too much was waiting',
+    'backlog_dropped': 'Waiting expendable events dropped because too much was waiting',
+}
+GAUGES = {
+    'queue_depth': 'Hand-offs waiting for the worker thread',
+    'unsent_events': "Events that haven't been handed to the worker yet",
+    'retry_queue': 'Uploads waiting to be retried',
+    'backlog_events': 'Events in uploads waiting to be posted',
+    'backlog_bytes': 'Bytes of events in uploads waiting to be posted',
+    'breaker_open': '1 while uploads are paused because SFR is down',
+    'journal_backlog': 'Journal entries waiting for the translation thread',
+}
+HISTOGRAMS = {
+    'journal_entry_seconds': ("Time spent in journal_entry() on EDMC's main thread, handing an entry over", ENTRY_BUCKETS),
+    'translate_seconds': ('Time taken to turn a journal entry into events, on the translation thread', ENTRY_BUCKETS),
+    'upload_seconds': ('Time taken to post an upload and get a reply', UPLOAD_BUCKETS),
+}
+
+
+class Histogram(object):
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)	# Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket the q'th quantile falls in - or the last bound, if it's above all of them
+        rank = q * self.count
+        seen = 0
+        for (bound, n) in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.bounds[-1]
+
+    def copy(self):
+        other = Histogram(self.bounds)
+        other.counts = list(self.counts)
+        other.sum = self.sum
+        other.count = self.count
+        return other
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self.lock = Lock()
+        self.added = Counter()	# eventName -> events added. Only touched by the translation thread
+        self.suppressed = Counter()	# (eventName, reason) -> events dropped by sfr.limit, likewise
+        self.counters = dict.fromkeys(COUNTERS, 0)	# Values, or functions that return them - see track()
+        self.gauges = dict.fromkeys(GAUGES, 0)
+        self.histograms = {name: Histogram(bounds) for (name, (help, bounds)) in HISTOGRAMS.items()}
+        self.entries = self.histograms['journal_entry_seconds']	# Only touched by EDMC's main thread, so observe() directly
+        self.translations = self.histograms['translate_seconds']	# Only touched by the translation thread, likewise
+        self.wakeup = Event()
+        self.thread = None
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def track(self, name, func):
+        # Read a counter or gauge from func whenever metrics are shown or written
+        (name in self.counters and self.counters or self.gauges)[name] = func
+
+    def observe(self, name, value):
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    def snapshot(self):
+        added = dict(self.added)
+        suppressed = dict(self.suppressed)
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {name: h.copy() for (name, h) in self.histograms.items()}
+        counters = {name: value() if callable(value) else value for (name, value) in counters.items()}
+        gauges = {name: value() if callable(value) else value for (name, value) in self.gauges.items()}
+        return (added, suppressed, counters, gauges, histograms)
+
+    def summary(self):
+        (added, suppressed, counters, gauges, histograms) = self.snapshot()
+        lines = [
+            '%d events added, %d coalesced, %d suppressed' % (sum(added.values()), counters['events_coalesced'], sum(suppressed.values())),
+            '%d uploads, %s sent (%s of JSON)' % (counters['uploads'], size(counters['upload_bytes']), size(counters['upload_json_bytes'])),
+            '%d unsent, %d queued, %d waiting, %d awaiting retry' % (gauges['unsent_events'], gauges['queue_depth'], gauges['backlog_events'], gauges['retry_queue']),
+            '%d errors, %d retries, %d given up' % (counters['upload_errors'], counters['retries'], counters['failures']),
+        ]
+        if counters['backlog_merged'] or counters['backlog_dropped']:
+            lines.append('Backed up: %d merged, %d dropped' % (counters['backlog_merged'], counters['backlog_dropped']))
+        for (label, name) in (('Upload', 'upload_seconds'), ('Journal', 'journal_entry_seconds'), ('Translate', 'translate_seconds')):
+            h = histograms[name]
+            if h.count:
+                lines.append('%s p50 %s, p99 %s' % (label, duration(h.quantile(0.5)), duration(h.quantile(0.99))))
+        return '\n'.join(lines)
+
+    def prometheus(self):
+        (added, suppressed, counters, gauges, histograms) = self.snapshot()
+        lines = ['# HELP %sevents_added_total Events added, by eventName' % PREFIX, '# TYPE %sevents_added_total counter' % PREFIX]
+        lines.extend('%sevents_added_total{event="%s"} %d' % (PREFIX, name, n) for (name, n) in sorted(added.items()))
+        lines.extend(['# HELP %sevents_suppressed_total Events dropped as repeats or over their rate limit, by eventName and reason' % PREFIX, '# TYPE %sevents_suppressed_total counter' % PREFIX])
+        lines.extend('%sevents_suppressed_total{event="%s",reason="%s"} %d' % (PREFIX, name, reason, n) for ((name, reason), n) in sorted(suppressed.items()))
+        for (name, help) in COUNTERS.items():
+            lines.extend(['# HELP %s%s_total %s' % (PREFIX, name, help), '# TYPE %s%s_total counter' % (PREFIX, name), '%s%s_total %d' % (PREFIX, name, counters[name])])
+        for (name, help) in GAUGES.items():
+            lines.extend(['# HELP %s%s %s' % (PREFIX, name, help), '# TYPE %s%s gauge' % (PREFIX, name), '%s%s %d' % (PREFIX, name, gauges[name])])
+        for (name, (help, bounds)) in HISTOGRAMS.items():
+            h = histograms[name]
+            lines.extend(['# HELP %s%s %s' % (PREFIX, name, help), '# TYPE %s%s histogram' % (PREFIX, name)])
+            seen = 0
+            for (bound, n) in zip(bounds + ('+Inf',), h.counts):
+                seen += n
+                lines.append('%s%s_bucket{le="%s"} %d' % (PREFIX, name, bound, seen))
+            lines.extend(['%s%s_sum %r' % (PREFIX, name, h.sum), '%s%s_count %d' % (PREFIX, name, h.count)])
+        return '\n'.join(lines) + '\n'
+
+    def json(self):
+        (added, suppressed, counters, gauges, histograms) = self.snapshot()
+        return json.dumps({
+            'time': time.time(),
+            'events_added': added,
+            'events_suppressed': {'%s %s' % key: n for (key, n) in suppressed.items()},
+            'counters': counters,
+            'gauges': gauges,
+            'histograms': {name: {'bounds': list(h.bounds), 'counts': h.counts, 'sum': h.sum, 'count': h.count} for (name, h) in histograms.items()},
+        }, indent=1, sort_keys=True)
+
+    def write(self, path):
+        # Atomically, so a scraper never sees half a file
+        text = path.endswith('.prom') and self.prometheus() or self.json()
+        with open(path + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    def start(self, path, interval=INTERVAL):
+        self.thread = Thread(target = self.writer, args = (path, interval), name = 'SFR metrics')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def writer(self, path, interval):
+        while not self.wakeup.is_set():
+            self.wakeup.wait(interval)
+            try:
+                self.write(path)
+            except:
+                print_exc()
+
+    def stop(self, timeout=None):
+        # Write one last time and stop the writer, waiting for up to timeout seconds
+        if self.thread:
+            self.wakeup.set()
+            self.thread.join(timeout)
+            self.thread = None
+
+
+def size(n):
+    for unit in ('bytes', 'KB', 'MB'):
+        if n < 1024 or unit == 'MB':
+            return unit == 'bytes' and '%d %s' % (n, unit) or '%.1f %s' % (n, unit)
+        n /= 1024.0
+
+
+def duration(seconds):
+    if seconds < 0.001:
+        return '%g \u00b5s' % (seconds * 1000000)
+    return seconds < 1 and '%g ms' % (seconds * 1000) or '%g s' % seconds
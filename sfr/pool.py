@@ -0,0 +1,207 @@
+# Upload threads for the SFR worker.
+#
+# The worker thread decides what to send and when; UploadPool just posts. Sealed
+# batches queue up per lane - a (commander, sfr.batch lane) pair - and a lane
+# only ever has one batch out at a time, so SFR sees each lane's events in the
+# order they happened while other lanes and other commanders upload alongside.
+# A lane whose batch failed stays held until the retry is resubmitted.
+#
+# When lanes are waiting for threads, higher priority lanes go first, and then
+# the one that has waited longest. Low priority lanes (anything but 0) can't
+# have the last RESERVED threads, so a big upload of snapshots can't hold up
+# the travel event after it - unless it has waited STARVE seconds already.
+# Batches that have queued up behind a lane's upload go as one upload if they
+# fit, so the last of them is at most a round trip behind.
+#
+# Uploads are paced to RATE a second, in bursts of up to BURST, so catching up
+# after a long time without SFR doesn't flood it - apart from those with URGENT
+# travel events, which the main window is waiting on. The worker keeps what's
+# waiting under MAX_QUEUED events and MAX_QUEUED_BYTES - see backlog().
+#
+# Results go back to the worker as Done items on its own queue, so all the
+# bookkeeping (retries, circuit breaker, spool) stays on the one thread.
+
+from collections import deque
+from operator import attrgetter
+from threading import Thread
+from queue import Queue
+import time
+from traceback import print_exc
+
+WORKERS = 4		# Uploads in flight at once
+RESERVED = 1	# Threads kept for priority 0 lanes
+STARVE = 30.0	# Seconds before a low priority lane is treated as priority 0
+RATE = 2.0		# Uploads a second...
+BURST = 10		# ...after this many at once
+MAX_QUEUED = 20000	# Events waiting to be posted, across all lanes
+MAX_QUEUED_BYTES = 16 * 1024 * 1024
+OVERFLOW_TARGET = 0.8	# Fraction of those to cut back to when they're exceeded
+
+
+class Done(object):
+
+    __slots__ = ('batch', 'ok', 'error')
+
+    def __init__(self, batch, ok, error):
+        self.batch = batch
+        self.ok = ok		# What post() returned
+        self.error = error	# Or the exception it raised
+
+
+class Lane(object):
+
+    __slots__ = ('waiting', 'busy', 'priority')
+
+    def __init__(self, priority):
+        self.waiting = deque()	# Batches not yet posted, oldest first
+        self.busy = False	# A batch is being posted or waiting to be retried
+        self.priority = priority
+
+
+class UploadPool(object):
+
+    def __init__(self, post, notify, size=WORKERS, priority={}, reserved=RESERVED, starve=STARVE, merge=None, rate=RATE, burst=BURST, clock=time.monotonic):
+        self.post = post	# post(batch) -> ok, or raises
+        self.notify = notify	# Called with a Done for each batch posted
+        self.size = size
+        self.priority = priority	# sfr.batch lane -> priority, 0 highest. Lanes not in it get 0
+        self.reserved = reserved
+        self.starve = starve
+        self.merge = merge	# merge(batch, next batch in its lane) -> True if it took the next batch's events
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock	# Same as the Batcher's, which stamps batch.opened
+        self.tokens = burst	# Uploads that can be posted before waiting for the rate
+        self.filled = clock()
+        self.lanes = {}		# (key, lane) -> Lane
+        self.in_flight = 0
+        self.posting = set()	# Batches handed to the threads that haven't come back yet
+        self.queued = 0		# Events in batches waiting to be posted
+        self.queued_bytes = 0
+        self.work = Queue()
+        self.threads = [Thread(target = self.run, name = 'SFR upload %d' % i) for i in range(size)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def lane(self, batch):
+        lane = self.lanes.get((batch.key, batch.lane))
+        if not lane:
+            lane = self.lanes[(batch.key, batch.lane)] = Lane(self.priority.get(batch.lane, 0))
+        return lane
+
+    def count(self, batch, n):
+        self.queued += n * len(batch.events)
+        self.queued_bytes += n * batch.size
+
+    def submit(self, batch):
+        self.lane(batch).waiting.append(batch)
+        self.count(batch, 1)
+
+    def resubmit(self, batch):
+        # A failed batch that's due to be retried goes back to the front of its lane
+        lane = self.lane(batch)
+        lane.waiting.appendleft(batch)
+        lane.busy = False
+        self.count(batch, 1)
+
+    def hold(self, batch):
+        # Put a batch back at the front of its lane, which stays held until the next resubmit()
+        self.lane(batch).waiting.appendleft(batch)
+        self.count(batch, 1)
+
+    def release(self, batch):
+        # The lane's batch is done with - let the next one go
+        self.lane(batch).busy = False
+
+    def dispatch(self):
+        # Post the next batch from each idle lane while there are threads free, and the rate allows
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.filled) * self.rate)
+        self.filled = now
+        ready = []
+        for (n, lane) in enumerate(self.lanes.values()):
+            if lane.waiting and not lane.busy:
+                opened = lane.waiting[0].opened
+                ready.append((now - opened < self.starve and lane.priority or 0, opened, n, lane))
+        for (priority, opened, n, lane) in sorted(ready):
+            if self.in_flight >= self.size - (priority and self.reserved):
+                return	# Everything after this is low priority too
+            if self.tokens < 1 and not lane.waiting[0].urgent:
+                continue	# Not travel events the main window is waiting on, though
+            self.tokens = max(0, self.tokens - 1)
+            lane.busy = True
+            self.in_flight += 1
+            batch = lane.waiting.popleft()
+            self.posting.add(batch)
+            self.count(batch, -1)
+            while self.merge and lane.waiting and self.merge(batch, lane.waiting[0]):
+                self.count(lane.waiting.popleft(), -1)	# Counted as they were, before merge() added them to batch
+            self.work.put(batch)
+
+    def timeout(self):
+        # Seconds until the rate allows another upload, or None if there's nothing waiting on it
+        if self.tokens >= 1 or not self.pending():
+            return None
+        return (1 - self.tokens) / self.rate
+
+    def finished(self, batch):
+        self.in_flight -= 1
+        self.posting.discard(batch)
+
+    def abandon(self):
+        # Stop waiting for the batches being posted, and return them
+        batches = list(self.posting)
+        self.posting.clear()
+        self.in_flight = 0
+        return batches
+
+    def pending(self):
+        # True if there are batches that could be posted now
+        return any(lane.waiting and not lane.busy for lane in self.lanes.values())
+
+    def waiting(self):
+        for lane in self.lanes.values():
+            while lane.waiting:
+                batch = lane.waiting.popleft()
+                self.count(batch, -1)
+                yield batch
+
+    def backlog(self):
+        # Batches waiting to be posted, oldest first. Change their events as need be, then prune()
+        return sorted([batch for lane in self.lanes.values() for batch in lane.waiting], key=attrgetter('opened'))
+
+    def prune(self):
+        # Take out batches left empty, returning them, and count what's still waiting
+        (self.queued, self.queued_bytes) = (0, 0)
+        empty = []
+        for lane in self.lanes.values():
+            for batch in list(lane.waiting):
+                if batch.events:
+                    self.count(batch, 1)
+                else:
+                    lane.waiting.remove(batch)
+                    empty.append(batch)
+        return empty
+
+    def evict(self, batch):
+        # Take a waiting batch out of its lane, without posting it
+        self.lane(batch).waiting.remove(batch)
+        self.count(batch, -1)
+
+    def run(self):
+        while True:
+            batch = self.work.get()
+            if batch is None:
+                return
+            try:
+                done = Done(batch, self.post(batch), None)
+            except Exception as e:
+                print_exc()
+                done = Done(batch, False, e)
+            self.notify(done)
+
+    def stop(self):
+        # Threads still posting finish in their own time - they're daemons, so don't hold up exit
+        for thread in self.threads:
+            self.work.put(None)
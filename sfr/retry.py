@@ -0,0 +1,97 @@
+# Retry scheduling for uploads that failed: exponential backoff with jitter, and
+# a circuit breaker that stops the worker hammering an SFR that is down.
+#
+# A failed batch goes into RetryQueue with a due time and the worker carries on
+# with fresh batches. After THRESHOLD consecutive failures the breaker opens and
+# nothing is posted for a cooldown period; then a single cheap probe is sent,
+# and uploads resume only if it gets a reply. Each failed probe doubles the
+# cooldown, up to MAX_COOLDOWN.
+
+import heapq
+from itertools import count
+import random
+import time
+
+BASE = 2.0		# Seconds before the first retry
+CAP = 300.0		# Longest wait between retries
+ATTEMPTS = 10		# Attempts before giving up on a batch for this session
+THRESHOLD = 5		# Consecutive failures that open the breaker
+COOLDOWN = 30.0		# Seconds the breaker stays open before probing
+MAX_COOLDOWN = 600.0
+
+CLOSED = 'closed'	# Uploading normally
+OPEN = 'open'		# SFR is down - waiting to probe
+HALF_OPEN = 'half-open'	# Time to probe
+
+
+def backoff(attempt, rng=random.random):
+    # Equal jitter - half the exponential delay, plus up to the same again at random
+    delay = min(CAP, BASE * 2 ** (attempt - 1))
+    return delay / 2 + rng() * delay / 2
+
+
+class RetryQueue(object):
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []		# (due, seq, batch)
+        self.seq = count()	# Keeps batches due at the same time in order
+
+    def push(self, batch, delay):
+        heapq.heappush(self.heap, (self.clock() + delay, next(self.seq), batch))
+
+    def pop(self, everything=False):
+        # Batches that are due (or all of them), oldest first
+        now = self.clock()
+        while self.heap and (everything or self.heap[0][0] <= now):
+            yield heapq.heappop(self.heap)[2]
+
+    def timeout(self):
+        if not self.heap:
+            return None
+        return max(0, self.heap[0][0] - self.clock())
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, threshold=THRESHOLD, cooldown=COOLDOWN, max_cooldown=MAX_COOLDOWN, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0	# Consecutive
+        self.wait = cooldown	# Current cooldown
+        self.until = 0		# When an open breaker may probe
+
+    def allow(self):
+        # True if uploads may be posted
+        if self.state == OPEN and self.clock() >= self.until:
+            self.state = HALF_OPEN
+        return self.state == CLOSED
+
+    def timeout(self):
+        # Seconds until an open breaker wants to probe
+        if self.state != OPEN:
+            return None
+        return max(0, self.until - self.clock())
+
+    def success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.wait = self.cooldown
+
+    def failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self.wait = min(self.wait * 2, self.max_cooldown)	# Probe failed
+            self.trip()
+        elif self.state == CLOSED and self.failures >= self.threshold:
+            self.trip()
+
+    def trip(self):
+        self.state = OPEN
+        self.until = self.clock() + self.wait
@@ -0,0 +1,45 @@
+# What the plugin keeps for each commander it has seen journal entries for.
+#
+# Each CommanderSession has its own unsent events, limits and caches, so a
+# multi-account player switching between commanders - or sfr.backfill
+# replaying several commanders' journals - neither sends anything early nor
+# throws away what it knows about the commander it switched from. Its events
+# are uploaded under its own (cmdr, FID) key, and so in lanes of their own (see
+# sfr.batch). Sessions are kept in sfr.core's registry, keyed by FID.
+
+from sfr.buffer import EventBuffer
+from sfr.inventory import Inventory
+from sfr.limit import Limiter
+from sfr.loadout import Loadouts
+
+
+class CommanderSession(object):
+
+    def __init__(self, cmdr, FID):
+        self.cmdr = cmdr
+        self.FID = FID		# Frontier ID
+        self.events = EventBuffer()	# Unsent events
+        self.limiter = Limiter()	# Drops repeats of high-frequency events
+        self.loadouts = Loadouts()	# Last loadout sent for each ship
+        self.cargo = Inventory('Cargo')
+        self.materials = Inventory('Raw', 'Manufactured', 'Encoded')
+        self.multicrew = False	# don't send captain's ship info to SFR while on a crew
+        self.reset()
+
+    @property
+    def key(self):
+        # Events are batched and uploaded by this
+        return (self.cmdr, self.FID)
+
+    def reset(self):
+        # A new game - clear cached state
+        self.newsession = True	# starting a new session - wait for Cargo event
+        self.undocked = False	# just undocked
+        self.suppress_docked = False	# Skip initial Docked event if started docked
+        self.cargo.reset()
+        self.materials.reset()
+        self.lastcredits = 0	# Send credit update soon after Startup / new game
+        self.storedmodules = None
+        self.loadout = None	# Payload for the current ship
+        self.fleet = None
+        self.shipswap = False	# just swapped ship
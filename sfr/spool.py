@@ -0,0 +1,206 @@
+# Crash-safe spool for events that haven't been acknowledged by SFR.
+#
+# add_event() appends each event to an append-only file as one JSON line. A
+# background thread group-commits the file, so one fsync covers every event
+# written since the previous commit and the journal thread never waits on the
+# disk. Positions in the spool are logical byte offsets that keep increasing
+# across truncations: the file starts at `base` and everything before `cursor`
+# has been acknowledged. Both are kept in a small side file.
+#
+# call() takes a Span covering the events appended since the last call. The
+# worker reports each upload containing part of a span back with done(), and
+# the cursor moves over a span once all of its parts are through and every
+# span before it has been acknowledged. Spans acknowledged past one that
+# failed are kept in the side file too, merged with their neighbours, so the
+# next start only replays what past the cursor isn't in one of them. Delivery
+# is at-least-once.
+
+from bisect import bisect_left
+import json
+import os
+from threading import Event, Lock, Thread
+from traceback import print_exc
+
+from sfr import codec
+
+COMMIT_INTERVAL = 1.0	# Seconds between group commits
+REPLAY_EVENTS = 100	# Events per replayed group
+
+
+class Span(object):
+
+    __slots__ = ('start', 'end', 'parts', 'failed')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.parts = 0		# Uploads still carrying events from this span
+        self.failed = False
+
+
+class Spool(object):
+
+    def __init__(self, path, commit_interval=COMMIT_INTERVAL):
+        self.path = path
+        self.cursorpath = path + '.cursor'
+        self.commit_interval = commit_interval
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.closing = False
+
+        try:
+            with open(self.cursorpath) as f:
+                (self.base, self.cursor, *acked) = json.load(f)	# No acked spans in files from older versions
+            acked = acked and [tuple(span) for span in acked[0]] or []
+        except (OSError, ValueError, TypeError):
+            (self.base, self.cursor, acked) = (0, 0, [])
+        self.acked = []		# (start, end) of acknowledged spans ahead of the cursor, in order and apart
+        for (start, end) in acked:
+            self.acknowledge(start, end)
+        self.saved = (self.base, self.cursor, acked)
+
+        self.compact()
+        self.file = open(self.path, 'ab')
+        self.end = self.base + self.file.tell()
+        if not self.base <= self.cursor <= self.end:
+            self.cursor = self.base	# Cursor doesn't match the file - replay the lot
+            self.acked = []
+        self.acked = [(start, end) for (start, end) in self.acked if end <= self.end]
+        self.handed = self.end	# Start of the next span handed out by span()
+        self.replay_end = self.end	# Events from previous sessions end here
+
+        self.thread = Thread(target = self.committer, name = 'SFR spool')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def compact(self):
+        # Drop the acknowledged head of the spool. Only done at startup while nothing has the file open.
+        if not os.path.exists(self.path):
+            return
+        if not self.base <= self.cursor <= self.base + os.path.getsize(self.path):
+            (self.cursor, self.acked) = (self.base, [])	# Cursor doesn't match the file - replay the lot
+            return
+        if self.cursor > self.base:
+            with open(self.path, 'rb') as f:
+                f.seek(self.cursor - self.base)
+                tail = f.read()
+            with open(self.path + '.tmp', 'wb') as f:
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            # Cursor goes first: if we die before the rename the old file is replayed in full, which is safe
+            self.save(self.cursor, self.cursor)
+            os.replace(self.path + '.tmp', self.path)
+
+    def save(self, base, cursor):
+        with open(self.cursorpath + '.tmp', 'w') as f:
+            json.dump([base, cursor, self.acked], f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.cursorpath + '.tmp', self.cursorpath)
+        (self.base, self.cursor) = (base, cursor)
+        self.saved = (base, cursor, list(self.acked))
+
+    def append(self, key, event):
+        line = b''.join([codec.dumps([key[0], key[1]])[:-1], b',', event.encode(), b']\n'])	# [cmdr,FID,event]
+        with self.lock:
+            self.file.write(line)
+            self.end += len(line)
+
+    def span(self):
+        # Everything appended since the last call, and ask for a group commit
+        with self.lock:
+            span = Span(self.handed, self.end)
+            self.handed = self.end
+        self.wakeup.set()
+        return span
+
+    def done(self, span, ok):
+        # One upload carrying events from span has finished
+        span.parts -= 1
+        span.failed = span.failed or not ok
+        if not span.parts and not span.failed:
+            with self.lock:
+                self.acknowledge(span.start, span.end)
+
+    def acknowledge(self, start, end):
+        # Add start..end to the acknowledged spans, merged with any it touches, and move the cursor over
+        # it if it's at the front
+        acked = self.acked
+        i = bisect_left(acked, (start, end))
+        if i and acked[i - 1][1] >= start:
+            i -= 1
+            (start, end) = (acked[i][0], max(end, acked.pop(i)[1]))
+        while i < len(acked) and acked[i][0] <= end:
+            end = max(end, acked.pop(i)[1])
+        if start <= self.cursor:
+            self.cursor = max(self.cursor, end)
+        else:
+            acked.insert(i, (start, end))
+
+    def replay(self):
+        # Unacknowledged events from previous sessions, as (key, events, span) groups. Read from the file
+        # as they're wanted, so however big the spool is only a group at a time is in memory.
+        with self.lock:
+            self.file.flush()
+            start = self.cursor
+            acked = list(self.acked)
+
+        key = None
+        events = []
+        offset = start
+        with open(self.path, 'rb') as f:
+            f.seek(start - self.base)
+            while offset < self.replay_end:
+                line = f.readline()
+                if not line:
+                    break	# Truncated, as everything left had been acknowledged
+                (at, offset) = (offset, offset + len(line))
+                while acked and acked[0][1] <= at:
+                    acked.pop(0)
+                if acked and acked[0][0] <= at:
+                    continue	# Already acknowledged, in an upload that got through after one that didn't
+                try:
+                    (cmdr, FID, event) = json.loads(line)
+                except ValueError:
+                    continue	# Partially written when we went down
+                if events and ((cmdr, FID) != key or len(events) >= REPLAY_EVENTS):
+                    yield (key, events, Span(start, end))
+                    (events, start) = ([], end)
+                key = (cmdr, FID)
+                events.append(codec.Event.decoded(event))
+                end = offset
+        if events:
+            yield (key, events, Span(start, offset))
+
+    def commit(self):
+        with self.lock:
+            self.file.flush()
+            fd = self.file.fileno()
+        os.fsync(fd)	# Covers every append up to the flush, without holding up the journal thread
+        with self.lock:
+            if self.cursor == self.end > self.base:
+                # Everything acknowledged - start afresh
+                self.save(self.end, self.end)
+                self.file.truncate(0)
+            elif (self.base, self.cursor, self.acked) != self.saved:
+                self.save(self.base, self.cursor)
+
+    def committer(self):
+        closing = False
+        while not closing:
+            self.wakeup.wait(self.commit_interval)
+            self.wakeup.clear()
+            closing = self.closing	# Before committing, so the last commit covers everything before close()
+            try:
+                self.commit()
+            except:
+                print_exc()
+
+    def close(self, timeout=None):
+        # The last commit is the committer's, so it can be left to finish if the disk takes longer than timeout
+        self.closing = True
+        self.wakeup.set()
+        self.thread.join(timeout)
+        if not self.thread.is_alive():
+            self.file.close()
@@ -0,0 +1,116 @@
+# What SFR was last told about each commander's state, kept between sessions so
+# that StartUp only sends what has changed.
+#
+# On StartUp the plugin sends ranks, major faction reputation, engineers,
+# location, the current ship and its loadout - all of it, every session, though
+# for a commander who logs in several times a day it's mostly what SFR has
+# already. For each commander (by FID) and each of those categories this keeps
+# a fingerprint of the last event added and whether SFR has acknowledged it.
+# StartUp leaves out an event if it's the same as one SFR has acknowledged,
+# with nothing else added since. So, with sfr.delta's deltas on, does
+# StoredShips for each ship in the fleet. Location and the current ship always
+# go on StartUp, as SFR's replies to them fill in the main window's links.
+#
+# Any event added in a category replaces its fingerprint until that event is
+# acknowledged in turn, and events in AFFECTS forget the category altogether -
+# SFR's copy of a ship that has been sold isn't the one last sent. So when in
+# doubt, StartUp sends. The file is read and removed by load(), and written by
+# save() on a clean stop only: after a crash, events may be in the spool that
+# the file doesn't know about, so the next StartUp sends everything.
+
+import hashlib
+import json
+import os
+from threading import Lock
+
+UNCHANGED = 'unchanged'	# Suppressed reason, alongside sfr.limit's
+
+# eventName -> eventData field telling apart the things it's the state of, or None if there's only one
+CATEGORIES = {
+    'setCommanderRankPilot': None,
+    'setCommanderReputationMajorFaction': None,
+    'setCommanderRankEngineer': None,
+    'setCommanderShip': 'shipGameID',
+    'setCommanderShipLoadout': 'shipGameID',
+}
+
+# eventName -> eventName of the category SFR's copy of which it changes some other way
+AFFECTS = {
+    'delCommanderShip': 'setCommanderShip',
+    'setCommanderShipTransfer': 'setCommanderShip',
+}
+
+
+def fingerprint(data):
+    # Of an encoded eventData
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def category(event, name=None):
+    # Of event, or of the same thing in the name category
+    name = name or event.name
+    field = CATEGORIES[name]
+    if field is None:
+        return name
+    return '%s/%s' % (name, json.loads(event.data).get(field))
+
+
+class Acknowledged(object):
+
+    def __init__(self):
+        self.path = None
+        self.lock = Lock()	# Events are added on the translation thread and acknowledged on the upload threads
+        self.known = {}		# FID -> {category: [fingerprint, acknowledged]}
+
+    def clear(self):
+        with self.lock:
+            self.known = {}
+
+    def load(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                known = json.load(f)
+            os.remove(path)
+        except (OSError, ValueError):
+            known = {}
+        with self.lock:
+            self.known = known
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            known = json.dumps(self.known)
+        try:
+            with open(self.path + '.tmp', 'w') as f:
+                f.write(known)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError:
+            pass	# Next StartUp sends everything
+
+    def unchanged(self, FID, event):
+        # True if SFR has acknowledged this very event and nothing else in its category has been added since
+        if not FID:
+            return False
+        with self.lock:
+            return self.known.get(FID, {}).get(category(event)) == [fingerprint(event.data), True]
+
+    def added(self, FID, event):
+        if not FID:
+            return
+        if event.name in CATEGORIES:
+            with self.lock:
+                self.known.setdefault(FID, {})[category(event)] = [fingerprint(event.data), False]
+        elif event.name in AFFECTS:
+            with self.lock:
+                self.known.get(FID, {}).pop(category(event, AFFECTS[event.name]), None)
+
+    def acknowledge(self, FID, event):
+        # SFR has accepted event - it's what SFR has, unless another in its category has been added since
+        if not FID or event.name not in CATEGORIES:
+            return
+        with self.lock:
+            known = self.known.get(FID, {}).get(category(event))
+            if known and known[0] == fingerprint(event.data):
+                known[1] = True
@@ -0,0 +1,79 @@
+# sfr.batch - splitting failed uploads, and merging or dropping events when too much is waiting.
+
+import json
+
+from sfr import codec
+from sfr.batch import Batch, Batcher, expend, split, supersede
+from sfr.spool import Span
+
+KEY = ('Cmdr', 'F1')
+
+
+def event(name, **data):
+    return codec.Event.make(name, '3306-01-01T00:00:00Z', data)
+
+
+def batch(events, key=KEY):
+    made = Batch(key, 'lane', 0)
+    made.events = list(events)
+    made.size = sum(e.size() for e in events)
+    return made
+
+
+def test_split_halves_in_order():
+    events = [event('addMarketBuy', n=n) for n in range(10)]
+    whole = batch(events)
+    whole.spans = [Span(0, 10)]
+    whole.spans[0].parts = 1
+    halves = split(whole, 0)
+    assert len(halves) == 2
+    assert halves[0].events + halves[1].events == events
+    assert all(half.size == sum(e.size() for e in half.events) for half in halves)
+    assert whole.spans[0].parts == 2	# One for each half, instead of the whole
+
+
+def test_split_leaves_small_or_single_batches():
+    assert len(split(batch([event('addMarketBuy', n=1), event('addMarketBuy', n=2)]))) == 1	# Under SPLIT_BYTES
+    assert len(split(batch([event('addMarketBuy', n=1)]), 0)) == 1
+
+
+def test_supersede_keeps_the_latest_snapshot():
+    older = batch([event('setCommanderCredits', commanderCredits=1), event('addMarketBuy', n=1)])
+    newer = batch([event('setCommanderCredits', commanderCredits=2)])
+    assert supersede([older, newer]) == 1
+    assert [e.name for e in older.events] == ['addMarketBuy']
+    assert json.loads(newer.events[0].data) == {'commanderCredits': 2}
+
+
+def test_supersede_merges_ships_by_id():
+    older = batch([event('setCommanderShip', shipGameID=1, shipName='Old', shipIdent='AB-1')])
+    newer = batch([event('setCommanderShip', shipGameID=1, shipName='New'), event('setCommanderShip', shipGameID=2)])
+    assert supersede([older, newer]) == 1
+    assert older.events == []
+    assert json.loads(newer.events[0].data) == {'shipGameID': 1, 'shipName': 'New', 'shipIdent': 'AB-1'}	# Later properties win
+    assert json.loads(newer.events[1].data) == {'shipGameID': 2}
+
+
+def test_supersede_keeps_commanders_apart():
+    mine = batch([event('setCommanderCredits', commanderCredits=1)])
+    theirs = batch([event('setCommanderCredits', commanderCredits=2)], key=('Other', 'F2'))
+    assert supersede([mine, theirs]) == 0
+
+
+def test_expend_drops_expendable_oldest_first():
+    older = batch([event('addCommanderShipScan', n=1), event('addMarketBuy', n=1)])
+    newer = batch([event('addCommanderShipScan', n=2)])
+    assert expend([older, newer], 1, 0)[0] == 1
+    assert [e.name for e in older.events] == ['addMarketBuy']
+    assert len(newer.events) == 1
+    assert older.size == sum(e.size() for e in older.events)
+
+
+def test_batcher_seals_urgent_and_full_batches():
+    batcher = Batcher(max_events=2, linger=60, clock=lambda: 0)
+    batcher.add(KEY, [event('addMarketBuy', n=1)])
+    assert list(batcher.pop()) == []	# Lingering
+    batcher.add(KEY, [event('addCommanderTravelFSDJump', starsystemName='Sol')])
+    assert [len(b.events) for b in batcher.pop()] == [1]	# Urgent, in its own lane
+    batcher.add(KEY, [event('addMarketBuy', n=2)])
+    assert [len(b.events) for b in batcher.pop()] == [2]	# Full
@@ -0,0 +1,96 @@
+# sfr.delta - updates that SFR's side, apply(), turns back into the snapshot sent.
+
+import json
+
+from sfr import codec, delta
+
+FID = 'F1'
+
+
+def loadout(modules):
+    return {'shipType': 'cobramkiii', 'shipGameID': 1, 'shipLoadout': [{'slotName': slot, 'itemName': item} for (slot, item) in modules]}
+
+
+def made(deltas, data, name='setCommanderShipLoadout'):
+    return deltas.make(FID, codec.Event.make(name, '3306-01-01T00:00:00Z', data), data)
+
+
+def acknowledged(deltas, data, name='setCommanderShipLoadout'):
+    deltas.enabled = True
+    event = made(deltas, data, name)
+    deltas.acknowledge(FID, event)
+    return event
+
+
+def test_update_round_trip():
+    kind = delta.KINDS['setCommanderShipLoadout']
+    deltas = delta.Deltas()
+    before = loadout([('Slot%02d' % n, 'item%d' % n) for n in range(10)])
+    acknowledged(deltas, before)
+    after = loadout([('Slot%02d' % n, n == 3 and 'better' or 'item%d' % n) for n in range(9)])	# One changed, one removed
+    update = made(deltas, after)
+    assert update.name == 'updateCommanderShipLoadout'
+    data = json.loads(update.data)
+    assert list(data['changed']) == ['Slot03'] and data['removed'] == ['Slot09']
+    assert dict(delta.apply(kind, delta.items(kind, before), data)) == dict(delta.items(kind, after))
+
+
+def test_one_delta_at_a_time():
+    deltas = delta.Deltas()
+    acknowledged(deltas, loadout([('Slot%02d' % n, 'item%d' % n) for n in range(10)]))
+    first = made(deltas, loadout([('Slot%02d' % n, 'item%d' % n) for n in range(9)]))
+    second = made(deltas, loadout([('Slot%02d' % n, 'item%d' % n) for n in range(8)]))	# Before first is acknowledged
+    assert (first.name, second.name) == ('updateCommanderShipLoadout', 'setCommanderShipLoadout')
+    deltas.acknowledge(FID, first)
+    deltas.acknowledge(FID, second)
+    assert made(deltas, loadout([('Slot%02d' % n, 'item%d' % n) for n in range(7)])).name == 'updateCommanderShipLoadout'
+
+
+def test_apply_refuses_the_wrong_base():
+    kind = delta.KINDS['setCommanderShipLoadout']
+    deltas = delta.Deltas()
+    acknowledged(deltas, loadout([('Slot%02d' % n, 'item%d' % n) for n in range(10)]))
+    data = json.loads(made(deltas, loadout([('Slot%02d' % n, 'item%d' % n) for n in range(9)])).data)
+    assert delta.apply(kind, delta.items(kind, loadout([('Slot00', 'other')])), data) is None
+
+
+def test_stored_modules_round_trip_with_identical_items():
+    kind = delta.KINDS['setCommanderStorageModules']
+    deltas = delta.Deltas()
+    before = [{'Name': 'module%d' % (n % 5)} for n in range(10)]	# Pairs of identical modules
+    acknowledged(deltas, before, 'setCommanderStorageModules')
+    after = before[:-1]
+    data = json.loads(made(deltas, after, 'setCommanderStorageModules').data)
+    assert dict(delta.apply(kind, delta.items(kind, before), data)) == dict(delta.items(kind, after))
+
+
+def test_full_until_enabled_and_acknowledged():
+    deltas = delta.Deltas()
+    data = loadout([('Slot%02d' % n, 'item%d' % n) for n in range(10)])
+    assert made(deltas, data).name == 'setCommanderShipLoadout'	# Not enabled
+    deltas.enabled = True
+    assert made(deltas, data).name == 'setCommanderShipLoadout'	# Nothing acknowledged
+
+
+def test_big_changes_go_in_full():
+    deltas = delta.Deltas()
+    acknowledged(deltas, loadout([('Slot%02d' % n, 'item%d' % n) for n in range(10)]))
+    assert made(deltas, loadout([('Slot%02d' % n, 'new%d' % n) for n in range(10)])).name == 'setCommanderShipLoadout'
+
+
+def test_rejected_update_resent_in_full():
+    deltas = delta.Deltas()
+    acknowledged(deltas, loadout([('Slot%02d' % n, 'item%d' % n) for n in range(10)]))
+    update = made(deltas, loadout([('Slot%02d' % n, 'item%d' % n) for n in range(9)]))
+    deltas.reject(FID, update)
+    [(event, key)] = deltas.rejected(FID)
+    assert event.name == 'setCommanderShipLoadout'
+    assert deltas.rejected(FID) == []
+
+
+def test_pending_bounded():
+    deltas = delta.Deltas()
+    for n in range(delta.PENDING * 2):
+        made(deltas, loadout([('Slot00', 'item%d' % n)]))
+    [snapshot] = deltas.snapshots.values()
+    assert len(snapshot.pending) == delta.PENDING
@@ -0,0 +1,55 @@
+# sfr.limit - dropping repeats within their ttl, and the rate limit on each event type.
+
+from datetime import datetime, timedelta, timezone
+
+from sfr.limit import DUPLICATE, RATE, Limit, Limiter
+
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+LOCATION = {'starsystemName': 'Sol', 'stationName': None, 'shipGameID': 1}
+
+
+def at(seconds):
+    return (START + timedelta(seconds=seconds)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def test_repeat_dropped_within_ttl():
+    limiter = Limiter()
+    assert limiter.check('setCommanderTravelLocation', at(0), LOCATION) is None
+    assert limiter.check('setCommanderTravelLocation', at(30), LOCATION) == DUPLICATE
+    assert limiter.check('setCommanderTravelLocation', at(61), LOCATION) is None
+    assert limiter.check('setCommanderTravelLocation', at(61), dict(LOCATION, starsystemName='Achenar')) is None
+
+
+def test_keys_expire_by_their_own_ttl():
+    limiter = Limiter()
+    assert limiter.check('addCarrierStats', at(0), {'carrierId': 1}) is None	# An hour's ttl, ahead of the location's
+    assert limiter.check('setCommanderTravelLocation', at(10), LOCATION) is None
+    assert limiter.check('setCommanderTravelLocation', at(200), LOCATION) is None
+
+
+def test_journal_going_back_in_time():
+    limiter = Limiter()
+    assert limiter.check('setCommanderTravelLocation', at(100), LOCATION) is None
+    assert limiter.check('setCommanderTravelLocation', at(50), LOCATION) is None
+
+
+def test_rate_limit_refills():
+    limiter = Limiter({'test': Limit(('n',), ttl=1, rate=1, burst=2)})
+    assert limiter.check('test', at(0), {'n': 1}) is None
+    assert limiter.check('test', at(0), {'n': 2}) is None
+    assert limiter.check('test', at(0), {'n': 3}) == RATE
+    assert limiter.check('test', at(1), {'n': 4}) is None	# A token a second
+
+
+def test_lru_size():
+    limiter = Limiter({'test': Limit(('n',), ttl=3600, rate=100, burst=100)}, size=2)
+    for n in range(3):
+        assert limiter.check('test', at(0), {'n': n}) is None
+    assert limiter.check('test', at(0), {'n': 0}) is None	# Forgotten
+    assert limiter.check('test', at(0), {'n': 2}) == DUPLICATE
+
+
+def test_unlimited_and_untimed_events_go():
+    limiter = Limiter()
+    assert limiter.check('addMarketBuy', at(0), {}) is None
+    assert limiter.check('setCommanderTravelLocation', None, LOCATION) is None
@@ -0,0 +1,32 @@
+# sfr.loadout - the per-ship cache of loadout payloads.
+
+from collections import OrderedDict
+
+from sfr.loadout import Loadouts
+
+
+def state(item, engineered=True):
+    # As EDMC's monitor has it: the journal parsed with object_pairs_hook=OrderedDict
+    module = OrderedDict([('Slot', 'Slot01'), ('Item', item), ('On', True), ('Priority', 1), ('Health', 1.0)])
+    if engineered:
+        module['Engineering'] = OrderedDict([('BlueprintName', 'Weapon_Overcharged'), ('Level', 5), ('Quality', 1.0),
+                                             ('Modifiers', [OrderedDict([('Label', 'DamagePerSecond'), ('Value', 9.5), ('OriginalValue', 7.1), ('LessIsGood', 0)])])])
+    return {'ShipType': 'cobramkiii', 'ShipID': 1, 'Modules': OrderedDict([('Slot01', module)])}
+
+
+def test_unchanged_ship_is_not_rebuilt():
+    loadouts = Loadouts()
+    built = []
+    build = lambda state: built.append(state) or {'n': len(built)}
+    assert loadouts.get(1, state('laser'), build) == ({'n': 1}, True)
+    assert loadouts.get(1, state('laser'), build) == ({'n': 1}, False)
+    assert loadouts.get(1, state('cannon'), build) == ({'n': 2}, True)
+    assert len(built) == 2
+
+
+def test_least_recently_used_ship_goes():
+    loadouts = Loadouts(size=2)
+    build = lambda state: {}
+    for ship in (1, 2, 1, 3):
+        loadouts.get(ship, state('laser', False), build)
+    assert list(loadouts.ships) == [1, 3]
@@ -0,0 +1,22 @@
+# sfr.core.snapshot() - the copy of EDMC's state journal_entry() hands to the translation thread.
+
+from collections import OrderedDict
+
+from sfr import core
+
+
+def state():
+    # As EDMC's monitor has it: the journal parsed with object_pairs_hook=OrderedDict
+    engineering = OrderedDict([('BlueprintName', 'Weapon_Overcharged'), ('Level', 5),
+                               ('Modifiers', [OrderedDict([('Label', 'DamagePerSecond'), ('Value', 9.5)])])])
+    module = OrderedDict([('Slot', 'Slot01'), ('Item', 'laser'), ('Health', 1.0), ('Engineering', engineering)])
+    return {'ShipType': 'cobramkiii', 'ShipID': 1, 'Modules': {'Slot01': module}, 'Cargo': {'gold': 2}}
+
+
+def test_nested_ordered_dicts_are_copied_all_the_way_down():
+    edmc = state()
+    copy = core.snapshot(edmc, ('Modules', 'Cargo'))
+    assert copy == state()
+    edmc['Modules']['Slot01']['Engineering']['Modifiers'][0]['Value'] = 10.0	# As EDMC does on EngineerCraft
+    edmc['Cargo']['gold'] = 3
+    assert copy == state()
@@ -0,0 +1,137 @@
+# sfr.spool - acknowledging, compacting and replaying across a restart.
+
+import json
+import os
+
+from sfr import codec
+from sfr.spool import Spool
+
+KEY = ('Cmdr', 'F1')
+
+
+def add(spool, names):
+    # Append an event for each name and hand them over as one span, as call() does
+    for name in names:
+        spool.append(KEY, codec.Event.make(name, '3306-01-01T00:00:00Z', {'name': name}))
+    span = spool.span()
+    span.parts = 1	# One upload, as the Batcher would count it
+    return span
+
+
+def replayed(path):
+    spool = Spool(path)
+    try:
+        return [event.name for (key, events, span) in spool.replay() for event in events]
+    finally:
+        spool.close()
+
+
+def test_acknowledged_events_are_not_replayed(tmp_path):
+    path = str(tmp_path / 'sfr.spool')
+    spool = Spool(path)
+    spool.done(add(spool, ['a', 'b']), True)
+    add(spool, ['c'])	# Never acknowledged
+    spool.close()
+    assert replayed(path) == ['c']
+
+
+def test_everything_acknowledged_truncates(tmp_path):
+    path = str(tmp_path / 'sfr.spool')
+    spool = Spool(path)
+    spool.done(add(spool, ['a', 'b']), True)
+    spool.close()
+    assert os.path.getsize(path) == 0
+    assert replayed(path) == []
+
+
+def test_spans_past_a_failed_one_stay_acknowledged(tmp_path):
+    path = str(tmp_path / 'sfr.spool')
+    spool = Spool(path)
+    spans = [add(spool, [name]) for name in 'abcd']
+    spool.done(spans[0], True)
+    spool.done(spans[1], False)
+    spool.done(spans[3], True)
+    spool.done(spans[2], True)
+    spool.close()
+    assert replayed(path) == ['b']
+
+
+def test_replayed_span_moves_the_cursor(tmp_path):
+    path = str(tmp_path / 'sfr.spool')
+    spool = Spool(path)
+    add(spool, ['a', 'b'])
+    spool.close()
+
+    spool = Spool(path)
+    for (key, events, span) in spool.replay():
+        assert key == KEY
+        span.parts = 1
+        spool.done(span, True)
+    spool.close()
+    assert replayed(path) == []
+
+
+def test_replay_stopped_partway(tmp_path, monkeypatch):
+    monkeypatch.setattr('sfr.spool.REPLAY_EVENTS', 2)
+    path = str(tmp_path / 'sfr.spool')
+    spool = Spool(path)
+    add(spool, ['a', 'b', 'c', 'd', 'e'])
+    spool.close()
+
+    spool = Spool(path)
+    replay = spool.replay()
+    (key, events, span) = next(replay)
+    assert [event.name for event in events] == ['a', 'b']
+    add(spool, ['f'])	# Handed over while replaying - not part of it
+    span.parts = 1
+    spool.done(span, True)
+    replay.close()	# As the worker does when it stops
+    spool.close()
+    assert replayed(path) == ['c', 'd', 'e', 'f']
+
+
+def test_compacts_acknowledged_head_on_open(tmp_path):
+    path = str(tmp_path / 'sfr.spool')
+    spool = Spool(path)
+    spool.done(add(spool, ['a']), True)
+    add(spool, ['b'])
+    spool.close()
+    size = os.path.getsize(path)
+
+    spool = Spool(path)	# Compacts
+    spool.close()
+    assert os.path.getsize(path) < size
+    with open(path + '.cursor') as f:
+        (base, cursor, acked) = json.load(f)
+    assert base == cursor and acked == []
+    assert replayed(path) == ['b']
+
+
+def test_torn_tail_is_skipped(tmp_path):
+    path = str(tmp_path / 'sfr.spool')
+    spool = Spool(path)
+    add(spool, ['a', 'b'])
+    spool.close()
+    with open(path, 'ab') as f:
+        f.write(b'["Cmdr","F1",{"eventName":"c","eventTi')	# Went down mid-write
+    assert replayed(path) == ['a', 'b']
+
+
+def test_cursor_file_from_older_versions(tmp_path):
+    path = str(tmp_path / 'sfr.spool')
+    spool = Spool(path)
+    add(spool, ['a'])
+    spool.close()
+    with open(path + '.cursor', 'w') as f:
+        json.dump([0, 0], f)	# No acknowledged spans
+    assert replayed(path) == ['a']
+
+
+def test_cursor_past_the_file_replays_everything(tmp_path):
+    path = str(tmp_path / 'sfr.spool')
+    spool = Spool(path)
+    add(spool, ['a'])
+    spool.close()
+    with open(path + '.cursor', 'w') as f:
+        json.dump([0, 10 ** 6, []], f)
+    assert replayed(path) == ['a']
@@ -0,0 +1,88 @@
+# sfr.core's uploads against the stand-in server in benchmarks.server - what happens to the spool
+# when SFR refuses an upload.
+
+import io
+import time
+
+from benchmarks import edmc, server
+from sfr.spool import Spool
+
+FID = 'F1234567'
+
+
+class Refusing(server.Handler):
+    # Answers uploads with server.status, or just those with BAD in them if server.status is None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.server.status or b'BAD' in body:
+            self.reply(self.server.status or 400, 'Refused', b'')
+        else:
+            self.rfile = io.BytesIO(body)
+            server.Handler.do_POST(self)
+
+
+def upload(folder, status, events, wait=None):
+    # Add events in the travel lane, so they're uploaded straight away, and stop once wait() or after a second
+    arrived = []
+    stand_in = server.StandIn(callback=lambda header, events, received: arrived.extend(events))
+    stand_in.RequestHandlerClass = Refusing
+    stand_in.status = status
+    stand_in.start()
+    plugin = edmc.load_plugin(name='upload')
+    plugin.API_URL = stand_in.url
+    plugin.on_error = lambda message: None
+    edmc.reset(plugin)
+    plugin.start(folder)
+    try:
+        session = plugin.commander('Cmdr', FID)
+        for n in range(events):
+            plugin.add_event(session, 'addCommanderTravelFSDJump', '3306-01-01T00:00:00Z', {'starsystemName': n == 17 and 'BAD' or 'System %d' % n})
+        plugin.call()
+        deadline = time.monotonic() + (wait and 10 or 1)
+        while time.monotonic() < deadline and not (wait and wait(arrived)):
+            time.sleep(0.05)
+    finally:
+        plugin.stop()
+        stand_in.stop()
+    return arrived
+
+
+def spooled(folder):
+    spool = Spool(str(folder / 'sfr.spool'))
+    try:
+        return sum(len(events) for (key, events, span) in spool.replay())
+    finally:
+        spool.close()
+
+
+def test_unauthorised_stays_in_the_spool(tmp_path):
+    assert upload(tmp_path, 401, 40) == []
+    assert spooled(tmp_path) == 40
+
+
+def test_refused_event_dropped_on_its_own(tmp_path):
+    arrived = upload(tmp_path, None, 40, lambda arrived: len(arrived) == 39)
+    assert sorted(event['eventData']['starsystemName'] for event in arrived) == sorted('System %d' % n for n in range(40) if n != 17)
+    assert spooled(tmp_path) == 0
+
+
+def test_stop_is_bounded_when_sfr_hangs(tmp_path, capsys):
+    stand_in = server.StandIn(latency=30000).start()
+    plugin = edmc.load_plugin(name='upload')
+    plugin.API_URL = stand_in.url
+    plugin.on_error = lambda message: None
+    edmc.reset(plugin)
+    plugin.start(tmp_path)
+    try:
+        session = plugin.commander('Cmdr', FID)
+        plugin.add_event(session, 'addCommanderTravelFSDJump', '3306-01-01T00:00:00Z', {'starsystemName': 'Sol'})
+        plugin.call()
+        time.sleep(0.5)	# Posted, and waiting for a reply
+        start = time.monotonic()
+        plugin.stop()
+        assert time.monotonic() - start < plugin.DRAIN * 1.5 + 0.5
+    finally:
+        stand_in.stop()
+    assert 'not sent' in capsys.readouterr().out
+    assert spooled(tmp_path) == 1